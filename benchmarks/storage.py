@@ -0,0 +1,337 @@
+"""
+Microbenchmarks for the queue server's SQL paths.
+
+Each operation calls the real endpoint coroutine from `openbeepboop.server.api`
+against a `jobs` table pre-populated with a given number of rows and status mix,
+so index or query-plan regressions in the API show up here first.
+
+    python -m benchmarks.storage --rows 10000 --rows 1000000 --output bench.json
+    python -m benchmarks.storage --rows 10000 --baseline bench.json
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+import typer
+from fastapi import Response
+
+from openbeepboop.common.db import init_db
+from openbeepboop.common.models import JobStatus
+from openbeepboop.server import api
+
+app = typer.Typer()
+
+# Fractions of QUEUED / PROCESSING / COMPLETED / FAILED rows in the pre-populated table.
+STATUS_MIXES = {
+    "backlog": (0.90, 0.05, 0.04, 0.01),
+    "balanced": (0.40, 0.10, 0.45, 0.05),
+    "drained": (0.05, 0.01, 0.90, 0.04),
+}
+
+OPERATIONS = ["insert", "claim", "complete", "poll_ids", "poll_owner"]
+
+IDENTITY = {"key_hash": "bench", "name": "BenchNode", "role": "NODE"}
+
+# API keys (by hash) the pre-populated jobs belong to, round robin; USER_IDENTITY owns the first share.
+OWNERS = [f"bench-user-{i}" for i in range(4)]
+USER_IDENTITY = {"key_hash": OWNERS[0], "name": "BenchUser", "role": "USER"}
+
+REQUEST_PAYLOAD = {
+    "model": "bench-model",
+    "messages": [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "Summarize the following paragraph in one sentence."}
+    ]
+}
+
+RESULT_PAYLOAD = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "model": "bench-model",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "A summary."}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 24, "completion_tokens": 4, "total_tokens": 28}
+}
+
+def populate(db_path: str, rows: int, mix: str, chunk_size: int = 50000) -> List[str]:
+    """Create a queue database with `rows` jobs in the given status mix and return their ids."""
+    init_db(db_path)
+    weights = STATUS_MIXES[mix]
+    statuses = [JobStatus.QUEUED, JobStatus.PROCESSING, JobStatus.COMPLETED, JobStatus.FAILED]
+    rng = random.Random(rows)
+
+    request_json = json.dumps(REQUEST_PAYLOAD)
+    result_json = json.dumps(RESULT_PAYLOAD)
+    start = datetime.utcnow() - timedelta(seconds=rows)
+
+    conn = sqlite3.connect(db_path)
+    ids = []
+    batch = []
+    for i in range(rows):
+        status = rng.choices(statuses, weights)[0]
+        job_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        created_at = start + timedelta(seconds=i)
+        done = status in (JobStatus.COMPLETED, JobStatus.FAILED)
+        running = status == JobStatus.PROCESSING
+        batch.append((
+            job_id,
+            status.value,
+            created_at,
+            created_at,
+            request_json,
+            result_json if done else None,
+            "BenchNode" if running else None,
+            created_at if running else None,
+            OWNERS[i % len(OWNERS)]
+        ))
+        ids.append(job_id)
+        if len(batch) >= chunk_size:
+            _insert_rows(conn, batch)
+            batch = []
+    if batch:
+        _insert_rows(conn, batch)
+    conn.close()
+    return ids
+
+def _insert_rows(conn: sqlite3.Connection, batch: List[tuple]):
+    conn.executemany(
+        "INSERT INTO jobs (id, status, created_at, updated_at, request_payload, result_payload, locked_by, locked_at, owner) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        batch
+    )
+    conn.commit()
+
+class _Harness:
+    """Runs API coroutines against a fixed database file and records the SQL they issue."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.loop = asyncio.new_event_loop()
+        self.statements: Optional[List[str]] = None
+
+    def connect(self, db_path: str = None) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        if self.statements is not None:
+            conn.set_trace_callback(self.statements.append)
+        return conn
+
+    def call(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def capture_plans(self, fn) -> List[str]:
+        """Run `fn` once and return the query plans of the data statements it executed."""
+        self.statements = []
+        try:
+            fn()
+        finally:
+            statements, self.statements = self.statements, None
+
+        plans = []
+        conn = sqlite3.connect(self.db_path)
+        for sql in statements:
+            verb = sql.lstrip().split(" ", 1)[0].upper()
+            if verb not in ("SELECT", "UPDATE", "INSERT", "DELETE"):
+                continue
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            except sqlite3.Error:
+                continue
+            for row in rows:
+                if row[3] not in plans:
+                    plans.append(row[3])
+        conn.close()
+        return plans
+
+    def close(self):
+        self.loop.close()
+
+def _time(fn, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    p95_index = max(0, int(round(0.95 * len(ordered))) - 1)
+    return {
+        "median_ms": round(statistics.median(ordered), 4),
+        "p95_ms": round(ordered[p95_index], 4),
+        "mean_ms": round(statistics.fmean(ordered), 4),
+        "min_ms": round(ordered[0], 4),
+    }
+
+def bench_database(db_path: str, ids: List[str], batch: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Benchmark every operation against an already populated database."""
+    harness = _Harness(db_path)
+    rng = random.Random(len(ids))
+    claimed: List[str] = []
+
+    # Halfway through USER_IDENTITY's change stream, as a client catching up would read it
+    conn = sqlite3.connect(db_path)
+    owned = conn.execute("SELECT COUNT(*) FROM jobs WHERE owner = ?", (USER_IDENTITY["key_hash"],)).fetchone()[0]
+    row = conn.execute("SELECT seq FROM jobs WHERE owner = ? ORDER BY seq LIMIT 1 OFFSET ?",
+                       (USER_IDENTITY["key_hash"], owned // 2)).fetchone()
+    conn.close()
+    cursors = [0, row[0] if row else 0]
+    turns = [0]
+
+    def insert():
+        harness.call(api.submit_inference(dict(REQUEST_PAYLOAD), identity=USER_IDENTITY))
+
+    def claim():
+        jobs = harness.call(api.fetch_jobs(api.FetchRequest(limit=batch), Response(), identity=IDENTITY))
+        claimed.extend(job["id"] for job in jobs)
+
+    def complete():
+        # Complete what the claim step handed out; fall back to arbitrary ids once drained.
+        job_ids = claimed[:batch] or rng.sample(ids, min(batch, len(ids)))
+        del claimed[:batch]
+        body = [{"id": job_id, "status": JobStatus.COMPLETED.value, "result": RESULT_PAYLOAD} for job_id in job_ids]
+        harness.call(api.submit_results(body, identity=IDENTITY))
+
+    def poll_ids():
+        body = api.PollRequest(ids=rng.sample(ids, min(batch, len(ids))))
+        harness.call(api.poll_results(body, identity=IDENTITY))
+
+    def poll_owner():
+        # One page of the caller's change feed, alternating the start and the middle of the stream
+        cursor = cursors[turns[0] % len(cursors)]
+        turns[0] += 1
+        harness.call(api.job_changes(cursor=cursor, limit=batch, fields=None, identity=USER_IDENTITY))
+
+    operations = {
+        "insert": insert,
+        "claim": claim,
+        "complete": complete,
+        "poll_ids": poll_ids,
+        "poll_owner": poll_owner,
+    }
+
+    results = {}
+    with patch("openbeepboop.server.api.get_db_connection", side_effect=harness.connect):
+        for name in OPERATIONS:
+            fn = operations[name]
+            plans = harness.capture_plans(fn)
+            summary = _summarize(_time(fn, repeat))
+            summary["plans"] = plans
+            results[name] = summary
+
+    harness.close()
+    return results
+
+def run_suite(rows: List[int], mixes: List[str], batch: int = 10, repeat: int = 50, work_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Populate a database for every (rows, mix) pair and benchmark all operations on it."""
+    temp_dir = tempfile.mkdtemp(dir=work_dir)
+    results = []
+    try:
+        for row_count in rows:
+            for mix in mixes:
+                db_path = os.path.join(temp_dir, f"bench-{row_count}-{mix}.db")
+                start = time.perf_counter()
+                ids = populate(db_path, row_count, mix)
+                populate_s = time.perf_counter() - start
+
+                for op, summary in bench_database(db_path, ids, batch, repeat).items():
+                    results.append({
+                        "rows": row_count,
+                        "mix": mix,
+                        "op": op,
+                        "batch": batch,
+                        "repeat": repeat,
+                        "populate_s": round(populate_s, 3),
+                        **summary
+                    })
+                os.remove(db_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "sqlite_version": sqlite3.sqlite_version,
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+        "results": results
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Compare two suite outputs case by case.
+    A case regresses when its median is more than `tolerance` slower than the baseline.
+    Query plan changes are reported but do not count as regressions on their own.
+    """
+    def key(result):
+        return (result["rows"], result["mix"], result["op"], result["batch"])
+
+    previous = {key(r): r for r in baseline.get("results", [])}
+    report = []
+    for result in current["results"]:
+        base = previous.get(key(result))
+        if base is None:
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        report.append({
+            "rows": result["rows"],
+            "mix": result["mix"],
+            "op": result["op"],
+            "batch": result["batch"],
+            "baseline_ms": base["median_ms"],
+            "current_ms": result["median_ms"],
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1.0 + tolerance,
+            "plan_changed": result.get("plans") != base.get("plans"),
+        })
+    return report
+
+@app.command()
+def main(
+    rows: List[int] = typer.Option([10000, 100000], help="Table sizes to benchmark (repeatable)"),
+    mix: List[str] = typer.Option(list(STATUS_MIXES), help=f"Status mixes to benchmark: {', '.join(STATUS_MIXES)}"),
+    batch: int = typer.Option(10, help="Jobs per claim/complete/poll call"),
+    repeat: int = typer.Option(50, help="Timed iterations per operation"),
+    output: Optional[str] = typer.Option(None, help="Write results JSON to this file instead of stdout"),
+    baseline: Optional[str] = typer.Option(None, help="Compare against a previous results JSON"),
+    tolerance: float = typer.Option(0.25, help="Allowed median slowdown before a case counts as a regression"),
+    work_dir: Optional[str] = typer.Option(None, help="Directory for the temporary databases"),
+):
+    """Benchmark the queue server's SQL paths at realistic queue depths."""
+    unknown = [m for m in mix if m not in STATUS_MIXES]
+    if unknown:
+        typer.echo(f"Unknown status mix: {', '.join(unknown)}", err=True)
+        raise typer.Exit(code=2)
+
+    data = run_suite(rows, mix, batch=batch, repeat=repeat, work_dir=work_dir)
+
+    exit_code = 0
+    if baseline:
+        with open(baseline) as f:
+            report = compare(data, json.load(f), tolerance)
+        data["comparison"] = report
+        if any(entry["regression"] for entry in report):
+            exit_code = 1
+
+    text = json.dumps(data, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        typer.echo(text)
+
+    if exit_code:
+        typer.echo("Regressions detected against baseline.", err=True)
+        raise typer.Exit(code=exit_code)
+
+if __name__ == "__main__":
+    app()
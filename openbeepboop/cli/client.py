@@ -2,22 +2,31 @@ import typer
 import json
 import os
 import tomli_w
-from typing import Optional, List
+from itertools import islice
+from typing import Optional, List, Dict, Any
+from rich.console import Console
+from rich.progress import Progress
 from openbeepboop.client import Client
+from openbeepboop.client.store import ResultStore
 from openbeepboop.common.config import load_client_config
 
 app = typer.Typer()
+results_app = typer.Typer(help="Inspect results cached in the local result store.")
+app.add_typer(results_app, name="results")
 
 def get_client(server_url: Optional[str] = None, api_key: Optional[str] = None) -> Client:
     # Defaults
     final_url = "http://localhost:8000"
     final_key = None
+    extra = {}
 
     # Try to load from config
     try:
         config = load_client_config()
         final_url = config.server.url
         final_key = config.server.api_key
+        if config.result_store:
+            extra["result_store"] = config.result_store
     except FileNotFoundError:
         pass
 
@@ -27,7 +36,19 @@ def get_client(server_url: Optional[str] = None, api_key: Optional[str] = None)
     if api_key:
         final_key = api_key
 
-    return Client(base_url=final_url, api_key=final_key)
+    return Client(base_url=final_url, api_key=final_key, **extra)
+
+def _split_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+def get_result_store(path: Optional[str] = None) -> ResultStore:
+    # --store, else result_store from client_config.toml, else the default location
+    if path is None:
+        try:
+            path = load_client_config().result_store
+        except FileNotFoundError:
+            pass
+    return ResultStore(path)
 
 @app.command()
 def setup():
@@ -86,19 +107,21 @@ def poll(
     job_ids: List[str] = typer.Argument(..., help="One or more Job IDs to poll"),
     server_url: str = typer.Option("http://localhost:8000", help="Queue Server URL"),
     api_key: Optional[str] = typer.Option(None, envvar="OPENBEEPBOOP_API_KEY", help="API Key"),
-    wait: bool = typer.Option(False, help="Block until the job(s) are complete (only for first job if multiple)")
+    wait: bool = typer.Option(False, help="Block until all the jobs are complete"),
+    fields: Optional[str] = typer.Option(None, help="Comma-separated result fields to return, e.g. choices.0.message.content,usage")
 ):
     """
     Poll the status of one or more jobs.
     """
     client = get_client(server_url, api_key)
+    field_list = _split_fields(fields)
     try:
         if not job_ids:
             typer.echo("No job IDs provided.", err=True)
             raise typer.Exit(code=1)
 
         # Batch poll
-        jobs = client.jobs.poll(job_ids)
+        jobs = client.jobs.poll(job_ids, fields=field_list)
         if not jobs:
             typer.echo(f"No jobs found for IDs: {job_ids}", err=True)
             raise typer.Exit(code=1)
@@ -118,32 +141,16 @@ def poll(
 
         # If waiting is requested
         if wait:
-             # Logic for waiting on multiple jobs is complex via CLI flags.
-             # For simplicity, we only wait on the FIRST job if multiple are passed,
-             # or we could iterate. Let's iterate but warn.
-
-             if len(job_ids) > 1:
-                 typer.echo("Warning: --wait flag specified with multiple jobs. Waiting for each sequentially.")
-
-             final_results = []
-             for job in jobs:
-                 if not job.is_completed:
-                     typer.echo(f"Waiting for job {job.id}...")
-                     res = job.get(wait=True)
-                     final_results.append({
-                         "id": job.id,
-                         "status": "COMPLETED", # It finished after wait
-                         "completed": True,
-                         "result": res
-                     })
-                 else:
-                     # Already done
-                     final_results.append({
-                         "id": job.id,
-                         "status": job.status,
-                         "completed": True,
-                         "result": job.result
-                     })
+             # Wait on every unfinished job at once; handles are updated in place
+             pending = [job for job in jobs if not job.is_completed]
+             if pending:
+                 typer.echo(f"Waiting for {len(pending)} job(s)...")
+                 client.jobs.wait_all(pending, fields=field_list)
+
+             final_results = [
+                 {"id": job.id, "status": job.status, "completed": True, "result": job.result}
+                 for job in jobs
+             ]
 
              typer.echo(json.dumps(final_results, indent=2))
 
@@ -170,5 +177,178 @@ def poll(
         typer.echo(f"Error polling job: {e}", err=True)
         raise typer.Exit(code=1)
 
+@app.command()
+def cancel(
+    job_ids: Optional[List[str]] = typer.Argument(None, help="Job IDs to cancel"),
+    batch: Optional[str] = typer.Option(None, help="Cancel every unfinished job in this batch"),
+    server_url: str = typer.Option("http://localhost:8000", help="Queue Server URL"),
+    api_key: Optional[str] = typer.Option(None, envvar="OPENBEEPBOOP_API_KEY", help="API Key")
+):
+    """
+    Cancel queued or running jobs.
+    """
+    if not job_ids and batch is None:
+        typer.echo("Give job IDs or --batch.", err=True)
+        raise typer.Exit(code=1)
+
+    client = get_client(server_url, api_key)
+    try:
+        cancelled = client.jobs.cancel(ids=job_ids, batch_id=batch)
+        typer.echo(f"Cancelled {cancelled} job(s).")
+    except Exception as e:
+        typer.echo(f"Error cancelling jobs: {e}", err=True)
+        raise typer.Exit(code=1)
+
+def _read_jsonl(path: str, repair: bool = False) -> List[Dict[str, Any]]:
+    """
+    Records of a JSONL file; a torn last line (interrupted write) is skipped. With
+    `repair` the torn tail is also cut off, so that records appended afterwards
+    don't get glued onto it.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+
+    good_end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("torn line")
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+            good_end = f.tell()
+
+    if repair and good_end < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+    return records
+
+def _default_path(path: str, suffix: str) -> str:
+    base = path[:-len(".jsonl")] if path.endswith(".jsonl") else path
+    if base.endswith(".manifest"):
+        base = base[:-len(".manifest")]
+    return f"{base}.{suffix}.jsonl"
+
+@app.command("submit-file")
+def submit_file(
+    input_path: str = typer.Argument(..., help="JSONL file with one request (create arguments) per line"),
+    manifest: Optional[str] = typer.Option(None, help="Where to record job ids (default: <input>.manifest.jsonl)"),
+    model: Optional[str] = typer.Option(None, help="Model for lines that don't name one"),
+    embeddings: bool = typer.Option(False, help="Submit the lines as embeddings jobs"),
+    chunk_size: int = typer.Option(500, help="Jobs per bulk submission"),
+    server_url: str = typer.Option("http://localhost:8000", help="Queue Server URL"),
+    api_key: Optional[str] = typer.Option(None, envvar="OPENBEEPBOOP_API_KEY", help="API Key")
+):
+    """
+    Submit every line of a JSONL file as a job, writing {"line", "id"} records to a manifest.
+    A "custom_id" key on a line is copied to the manifest instead of being submitted.
+    Lines already in the manifest are skipped, so an interrupted run can be repeated.
+    """
+    manifest = manifest or _default_path(input_path, "manifest")
+    done = {record["line"] for record in _read_jsonl(manifest, repair=True)}
+
+    client = get_client(server_url, api_key)
+    create_many = client.embeddings.create_many if embeddings else client.chat.completions.create_many
+
+    def pending():
+        with open(input_path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                if number in done or not line.strip():
+                    continue
+                request = json.loads(line)
+                if model and "model" not in request:
+                    request["model"] = model
+                yield number, request.pop("custom_id", None), request
+
+    submitted = 0
+    try:
+        with open(manifest, "a", encoding="utf-8") as out, Progress(console=Console(stderr=True)) as progress:
+            task = progress.add_task("Submitting", total=None)
+            lines = pending()
+            # Record each chunk as soon as it is accepted so an interruption loses nothing
+            while chunk := list(islice(lines, chunk_size)):
+                handles = create_many([request for _, _, request in chunk], chunk_size=chunk_size)
+                for (number, custom_id, _), handle in zip(chunk, handles):
+                    record = {"line": number, "id": handle.id}
+                    if custom_id is not None:
+                        record["custom_id"] = custom_id
+                    out.write(json.dumps(record) + "\n")
+                out.flush()
+                submitted += len(chunk)
+                progress.update(task, advance=len(chunk))
+    except Exception as e:
+        typer.echo(f"Error submitting jobs after {submitted} submitted: {e}", err=True)
+        raise typer.Exit(code=1)
+
+    typer.echo(f"Submitted {submitted} job(s); manifest: {manifest}")
+
+@app.command()
+def collect(
+    manifest: str = typer.Argument(..., help="Manifest written by submit-file"),
+    output: Optional[str] = typer.Option(None, help="JSONL file for results (default: <input>.results.jsonl)"),
+    timeout: Optional[float] = typer.Option(None, help="Give up after this many seconds"),
+    fields: Optional[str] = typer.Option(None, help="Comma-separated result fields to keep, e.g. choices.0.message.content,usage"),
+    server_url: str = typer.Option("http://localhost:8000", help="Queue Server URL"),
+    api_key: Optional[str] = typer.Option(None, envvar="OPENBEEPBOOP_API_KEY", help="API Key")
+):
+    """
+    Wait for every job in a manifest, appending each result to the output as it finishes.
+    Jobs already in the output are not fetched again, so collection can be resumed.
+    """
+    output = output or _default_path(manifest, "results")
+    records = {record["id"]: record for record in _read_jsonl(manifest)}
+    collected = {record["id"] for record in _read_jsonl(output, repair=True)}
+    remaining = [job_id for job_id in records if job_id not in collected]
+
+    client = get_client(server_url, api_key)
+    try:
+        with open(output, "a", encoding="utf-8") as out, Progress(console=Console(stderr=True)) as progress:
+            task = progress.add_task("Collecting", total=len(records), completed=len(records) - len(remaining))
+            for job in client.jobs.as_completed(remaining, timeout=timeout, fields=_split_fields(fields)):
+                out.write(json.dumps({**records[job.id], "status": job.status, "result": job.result}) + "\n")
+                out.flush()
+                progress.update(task, advance=1)
+    except TimeoutError as e:
+        typer.echo(f"Timed out: {e}. Run collect again to resume.", err=True)
+        raise typer.Exit(code=1)
+    except Exception as e:
+        typer.echo(f"Error collecting results: {e}", err=True)
+        raise typer.Exit(code=1)
+
+    typer.echo(f"Collected {len(records)} result(s) in {output}")
+
+@results_app.command("list")
+def list_results(
+    status: Optional[str] = typer.Option(None, help="Only jobs with this status (e.g. COMPLETED)"),
+    limit: int = typer.Option(50, help="Most jobs to list"),
+    store: Optional[str] = typer.Option(None, help="Result store path (default: result_store from client_config.toml)")
+):
+    """
+    List jobs whose results are cached locally.
+    """
+    jobs = get_result_store(store).list(status=status, limit=limit)
+    if not jobs:
+        typer.echo("No cached results.")
+        return
+    for job in jobs:
+        typer.echo(f"{job['id']}  {job['status']}  {job['stored_at']}")
+
+@results_app.command("export")
+def export_results(
+    output: str = typer.Argument(..., help="JSONL file to write"),
+    status: Optional[str] = typer.Option(None, help="Only jobs with this status (e.g. COMPLETED)"),
+    store: Optional[str] = typer.Option(None, help="Result store path (default: result_store from client_config.toml)")
+):
+    """
+    Export locally cached results as JSON lines of id, status and result.
+    """
+    jobs = get_result_store(store).list(status=status)
+    with open(output, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps({"id": job["id"], "status": job["status"], "result": job["result"]}) + "\n")
+    typer.echo(f"Exported {len(jobs)} result(s) to {output}.")
+
 if __name__ == "__main__":
     app()
@@ -28,11 +28,7 @@ def batch(config: str = "node_config.toml"):
 
     client = NodeClient(node_config)
     # SPEC: "Runs once, processes available queue, then exits"
-    # We loop until no jobs are returned?
-    while True:
-        count = client.run_once()
-        if count == 0:
-            break
+    client.run_batch()
 
 @app.command()
 def setup():
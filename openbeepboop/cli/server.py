@@ -2,14 +2,23 @@ import typer
 import uvicorn
 import secrets
 from openbeepboop.common.db import init_db, get_db_path
+from openbeepboop.common.config import load_server_config, SERVER_CONFIG_ENV
+from typing import Optional
 import os
 import sqlite3
 
 app = typer.Typer()
 
 @app.command()
-def start(host: str = "0.0.0.0", port: int = 8000):
+def start(host: str = "0.0.0.0", port: int = 8000, config: Optional[str] = None):
     """Start the OpenBeepBoop Queue Server."""
+    if config:
+        try:
+            load_server_config(config) # Fail fast on a bad file
+        except Exception as e:
+            typer.echo(f"Error loading config: {e}")
+            raise typer.Exit(code=1)
+        os.environ[SERVER_CONFIG_ENV] = os.path.abspath(config)
     typer.echo(f"Starting server on {host}:{port}")
     uvicorn.run("openbeepboop.server.api:app", host=host, port=port, reload=False)
 
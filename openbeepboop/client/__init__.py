@@ -1 +1,2 @@
 from .client import Client
+from .async_client import AsyncClient
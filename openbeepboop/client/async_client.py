@@ -0,0 +1,209 @@
+import asyncio
+import httpx
+from typing import List, Dict, Any, Optional
+from openbeepboop.common.models import JobStatus
+from openbeepboop.client.client import _retryable
+
+# Statuses a job never leaves.
+FINISHED_STATUSES = (JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value, JobStatus.EXPIRED.value)
+
+# Longest wait between poll rounds while the server keeps failing transiently.
+POLL_BACKOFF_MAX = 30.0
+
+class AsyncJobHandle:
+    def __init__(self, client, job_id: str, status: str = JobStatus.QUEUED.value):
+        self.client = client
+        self.id = job_id
+        self._status = status
+        self._result = None
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def is_completed(self):
+        return self._status in FINISHED_STATUSES
+
+    def _update(self, status: str, result: Optional[Dict[str, Any]]):
+        self._status = status
+        self._result = result
+
+    async def get(self, wait: bool = True, timeout: Optional[float] = 60) -> Optional[Dict[str, Any]]:
+        """
+        The job's result once it has finished. With `wait`, waits on the client's
+        shared poller instead of polling this job alone.
+        """
+        if self.is_completed and self._result:
+            return self._result
+
+        if not wait:
+            jobs = await self.client.jobs.poll([self.id])
+            if jobs:
+                self._update(jobs[0].status, jobs[0].result)
+            return self._result if self.is_completed else None
+
+        try:
+            status, result = await asyncio.wait_for(self.client._wait_for(self.id), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Job {self.id} timed out after {timeout} seconds")
+        self._update(status, result)
+        return self._result
+
+    async def cancel(self) -> bool:
+        """Cancel the job if it hasn't finished. Returns whether it was cancelled."""
+        resp = await self.client._post(f"/v1/jobs/{self.id}/cancel", json={})
+        data = resp.json()
+        self._status = data["status"]
+        return data["cancelled"]
+
+class AsyncCompletionsClient:
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, **kwargs) -> AsyncJobHandle:
+        """
+        Submit a chat completion job.
+        Accepts standard OpenAI parameters (model, messages, etc.), plus the
+        queue options `hedge`, `batch_id`, `deadline` and `ttl`.
+        """
+        resp = await self.client._post("/v1/chat/completions", json=kwargs)
+        data = resp.json()
+        return AsyncJobHandle(self.client, data["id"], data["status"])
+
+class AsyncChatClient:
+    def __init__(self, client):
+        self.completions = AsyncCompletionsClient(client)
+
+class AsyncEmbeddingsClient:
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, **kwargs) -> AsyncJobHandle:
+        """Submit an embeddings job (model, input, encoding_format, etc.)."""
+        resp = await self.client._post("/v1/embeddings", json=kwargs)
+        data = resp.json()
+        return AsyncJobHandle(self.client, data["id"], data["status"])
+
+class AsyncJobsClient:
+    def __init__(self, client):
+        self.client = client
+
+    async def poll(self, ids: List[str], fields: Optional[List[str]] = None) -> List[AsyncJobHandle]:
+        """Current status and result of each job; `fields` projects results as in Client."""
+        body: Dict[str, Any] = {"ids": ids}
+        if fields is not None:
+            body["fields"] = fields
+        resp = await self.client._post("/v1/results/poll", json=body)
+        data = resp.json()
+
+        handles = []
+        for j in data["jobs"]:
+            handle = AsyncJobHandle(self.client, j["id"], j["status"])
+            handle._result = j.get("result")
+            handles.append(handle)
+        return handles
+
+    async def cancel(self, ids: Optional[List[str]] = None, batch_id: Optional[str] = None) -> int:
+        """Cancel unfinished jobs by id and/or batch. Returns how many were cancelled."""
+        body = {}
+        if ids:
+            body["ids"] = ids
+        if batch_id is not None:
+            body["batch_id"] = batch_id
+        resp = await self.client._post("/v1/jobs/cancel", json=body)
+        return resp.json()["cancelled"]
+
+class AsyncClient:
+    """
+    asyncio counterpart of Client. All requests share one connection pool, and
+    waiting handles are served by a single background poller that checks every
+    outstanding job in batches of `poll_batch_size` every `poll_interval` seconds,
+    so one event loop can wait on many thousands of jobs.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        api_key: Optional[str] = None,
+        poll_interval: float = 1.0,
+        poll_batch_size: int = 500
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.poll_interval = poll_interval
+        self.poll_batch_size = poll_batch_size
+        self.http_client = httpx.AsyncClient(base_url=base_url, headers={"Authorization": f"Bearer {api_key}"}, timeout=30.0)
+
+        self.chat = AsyncChatClient(self)
+        self.embeddings = AsyncEmbeddingsClient(self)
+        self.jobs = AsyncJobsClient(self)
+
+        # Job id -> futures of callers waiting for it to finish
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    async def _post(self, path: str, json: Dict[str, Any]) -> httpx.Response:
+        resp = await self.http_client.post(path, json=json)
+        resp.raise_for_status()
+        return resp
+
+    async def _wait_for(self, job_id: str):
+        """(status, result) once the job finishes."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._run_poller())
+        try:
+            return await future
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    async def _poll_waiting(self):
+        ids = list(self._waiters)
+        for start in range(0, len(ids), self.poll_batch_size):
+            for job in await self.jobs.poll(ids[start:start + self.poll_batch_size]):
+                if not job.is_completed:
+                    continue
+                for future in self._waiters.pop(job.id, []):
+                    if not future.done():
+                        future.set_result((job.status, job.result))
+
+    async def _run_poller(self):
+        failures = 0
+        while self._waiters:
+            try:
+                await self._poll_waiting()
+                failures = 0
+            except Exception as e:
+                if not _retryable(e):
+                    # Surface the error to everyone waiting; retrying won't fix it
+                    for waiters in self._waiters.values():
+                        for future in waiters:
+                            if not future.done():
+                                future.set_exception(e)
+                    self._waiters.clear()
+                    return
+                # Connection errors, 429s and 5xx back off; waiters' own timeouts bound the wait
+                failures += 1
+            if self._waiters:
+                await asyncio.sleep(min(self.poll_interval * 2 ** failures, POLL_BACKOFF_MAX) if failures else self.poll_interval)
+
+    async def aclose(self):
+        if self._poller is not None:
+            self._poller.cancel()
+        await self.http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
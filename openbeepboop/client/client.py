@@ -1,7 +1,9 @@
 import httpx
 import time
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Union, Tuple
 from openbeepboop.common.models import JobStatus
+from openbeepboop.client.store import ResultStore
 
 class JobHandle:
     def __init__(self, client, job_id: str, status: str = JobStatus.QUEUED.value):
@@ -21,7 +23,14 @@ class JobHandle:
 
     @property
     def is_completed(self):
-        return self._status in [JobStatus.COMPLETED.value, JobStatus.FAILED.value]
+        return self._status in [JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value, JobStatus.EXPIRED.value]
+
+    def cancel(self) -> bool:
+        """Cancel the job if it hasn't finished. Returns whether it was cancelled."""
+        resp = self.client._post(f"/v1/jobs/{self.id}/cancel", json={})
+        data = resp.json()
+        self._status = data["status"]
+        return data["cancelled"]
 
     def get(self, wait: bool = True, timeout: int = 60) -> Optional[Dict[str, Any]]:
         if self.is_completed and self._result:
@@ -54,12 +63,38 @@ class CompletionsClient:
     def create(self, **kwargs) -> JobHandle:
         """
         Submit a chat completion job.
-        Accepts standard OpenAI parameters (model, messages, etc.)
+        Accepts standard OpenAI parameters (model, messages, etc.), plus the
+        queue options `hedge`, `batch_id`, `deadline` and `ttl`.
         """
         resp = self.client._post("/v1/chat/completions", json=kwargs)
         data = resp.json()
         return JobHandle(self.client, data["id"], data["status"])
 
+    def create_many(self, requests: Iterable[Dict[str, Any]], **kwargs) -> List[JobHandle]:
+        """
+        Submit many chat completion jobs, each a dict of `create` arguments.
+        See Client._submit_many for chunking, fallback and retry options.
+        """
+        return self.client._submit_many("/v1/chat/completions", requests, **kwargs)
+
+class EmbeddingsClient:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, **kwargs) -> JobHandle:
+        """
+        Submit an embeddings job.
+        Accepts standard OpenAI parameters (model, input, encoding_format, etc.)
+        and the same queue options as chat completions.
+        """
+        resp = self.client._post("/v1/embeddings", json=kwargs)
+        data = resp.json()
+        return JobHandle(self.client, data["id"], data["status"])
+
+    def create_many(self, requests: Iterable[Dict[str, Any]], **kwargs) -> List[JobHandle]:
+        """Submit many embeddings jobs, each a dict of `create` arguments."""
+        return self.client._submit_many("/v1/embeddings", requests, **kwargs)
+
 class ChatClient:
     def __init__(self, client):
         self.completions = CompletionsClient(client)
@@ -68,8 +103,39 @@ class JobsClient:
     def __init__(self, client):
         self.client = client
 
-    def poll(self, ids: List[str]) -> List[JobHandle]:
-        resp = self.client._post("/v1/results/poll", json={"ids": ids})
+    def poll(self, ids: List[str], fields: Optional[List[str]] = None) -> List[JobHandle]:
+        """
+        Current status and result of each job. With `fields` (paths such as
+        "choices.0.message.content" or "usage"), completed results hold only
+        those parts, in their original nesting.
+        """
+        store = self.client.result_store
+        if store is None or not ids:
+            return self._poll_server(ids, fields)
+
+        # Finished jobs are read from the local store; only the rest go to the server
+        cached = store.get_many(ids)
+        handles = {}
+        for job_id, (status, result) in cached.items():
+            handle = JobHandle(self.client, job_id, status)
+            handle._result = result
+            handles[job_id] = handle
+
+        # Cached results are whole, which still reads the same as a projection
+        remote_ids = [job_id for job_id in ids if job_id not in cached]
+        if remote_ids:
+            fetched = self._poll_server(remote_ids, fields)
+            if fields is None:
+                store.put_many((h.id, h.status, h.result) for h in fetched if h.is_completed)
+            handles.update((h.id, h) for h in fetched)
+
+        return [handles[job_id] for job_id in dict.fromkeys(ids) if job_id in handles]
+
+    def _poll_server(self, ids: List[str], fields: Optional[List[str]] = None) -> List[JobHandle]:
+        body: Dict[str, Any] = {"ids": ids}
+        if fields is not None:
+            body["fields"] = fields
+        resp = self.client._post("/v1/results/poll", json=body)
         data = resp.json()
 
         handles = []
@@ -79,16 +145,189 @@ class JobsClient:
             handles.append(handle)
         return handles
 
+    def changes(self, cursor: int = 0, limit: int = 500, fields: Optional[List[str]] = None) -> Tuple[List[JobHandle], int, bool]:
+        """
+        Jobs submitted with this API key whose status changed after `cursor`, in
+        change order. Returns (handles, next cursor, whether more changes are waiting).
+        Keep the cursor to sync incrementally; 0 starts from the beginning.
+        """
+        params: Dict[str, Any] = {"cursor": cursor, "limit": limit}
+        if fields is not None:
+            params["fields"] = fields
+        data = self.client._get("/v1/jobs/changes", params=params).json()
+
+        handles = []
+        for j in data["jobs"]:
+            handle = JobHandle(self.client, j["id"], j["status"])
+            handle._result = j.get("result")
+            handles.append(handle)
+
+        store = self.client.result_store
+        if store is not None and fields is None:
+            store.put_many((h.id, h.status, h.result) for h in handles if h.is_completed)
+        return handles, data["cursor"], data["has_more"]
+
+    def as_completed(
+        self,
+        handles: Iterable[Union[JobHandle, str]],
+        timeout: Optional[float] = None,
+        poll_batch_size: int = 500,
+        min_interval: float = 0.5,
+        max_interval: float = 10.0,
+        fields: Optional[List[str]] = None
+    ) -> Iterator[JobHandle]:
+        """
+        Yield each job as soon as it finishes, in completion order.
+        All outstanding ids are polled together in chunks of `poll_batch_size`, and
+        finished ids drop out of later polls. The wait between rounds starts at
+        `min_interval` and doubles, up to `max_interval`, while nothing finishes.
+        Handles are updated in place; ids are wrapped in new handles. `fields`
+        projects results as in `poll`.
+        """
+        pending: Dict[str, List[JobHandle]] = {}
+        for handle in handles:
+            if isinstance(handle, str):
+                handle = JobHandle(self.client, handle)
+            if handle.is_completed:
+                yield handle
+            else:
+                pending.setdefault(handle.id, []).append(handle)
+
+        start_time = time.time()
+        interval = min_interval
+        while pending:
+            finished = 0
+            ids = list(pending)
+            for start in range(0, len(ids), poll_batch_size):
+                for job in self.poll(ids[start:start + poll_batch_size], fields):
+                    if not job.is_completed:
+                        continue
+                    for handle in pending.pop(job.id, []):
+                        handle._status = job.status
+                        handle._result = job.result
+                        finished += 1
+                        yield handle
+
+            if not pending:
+                return
+            if timeout is not None and time.time() - start_time > timeout:
+                raise TimeoutError(f"{len(pending)} job(s) still unfinished after {timeout} seconds")
+
+            interval = min_interval if finished else min(interval * 2, max_interval)
+            time.sleep(interval)
+
+    def wait_all(self, handles: Iterable[Union[JobHandle, str]], timeout: Optional[float] = None, **kwargs) -> List[JobHandle]:
+        """Wait for every job to finish. Returns the handles in input order."""
+        handles = [JobHandle(self.client, h) if isinstance(h, str) else h for h in handles]
+        for _ in self.as_completed(handles, timeout=timeout, **kwargs):
+            pass
+        return handles
+
+    def cancel(self, ids: Optional[List[str]] = None, batch_id: Optional[str] = None) -> int:
+        """Cancel unfinished jobs by id and/or batch. Returns how many were cancelled."""
+        body = {}
+        if ids:
+            body["ids"] = ids
+        if batch_id is not None:
+            body["batch_id"] = batch_id
+        resp = self.client._post("/v1/jobs/cancel", json=body)
+        return resp.json()["cancelled"]
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+def _unsent(error: Exception) -> bool:
+    """Whether a failed submission certainly wasn't stored, so sending it again can't duplicate jobs."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (429, 503)
+    # The connection never opened; a read timeout or dropped response proves nothing
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
 class Client:
-    def __init__(self, base_url: str = "http://localhost:8000", api_key: Optional[str] = None):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        api_key: Optional[str] = None,
+        result_store: Optional[Union[str, ResultStore]] = None
+    ):
         self.base_url = base_url
         self.api_key = api_key
+        # Optional local cache of finished jobs (a ResultStore or its database path)
+        self.result_store = ResultStore(result_store) if isinstance(result_store, str) else result_store
         self.http_client = httpx.Client(base_url=base_url, headers={"Authorization": f"Bearer {api_key}"}, timeout=30.0)
 
         self.chat = ChatClient(self)
+        self.embeddings = EmbeddingsClient(self)
         self.jobs = JobsClient(self)
 
+        # Whether the server has the bulk submission endpoints; None until first tried
+        self._bulk_supported: Optional[bool] = None
+
     def _post(self, path: str, json: Dict[str, Any]) -> httpx.Response:
         resp = self.http_client.post(path, json=json)
         resp.raise_for_status()
         return resp
+
+    def _get(self, path: str, params: Dict[str, Any]) -> httpx.Response:
+        resp = self.http_client.get(path, params=params)
+        resp.raise_for_status()
+        return resp
+
+    def _post_with_retry(self, path: str, json: Dict[str, Any], max_retries: int) -> httpx.Response:
+        # Submissions aren't idempotent: only failures that prove nothing was stored
+        # (no connection, 429, 503) are retried, with exponential backoff
+        for attempt in range(max_retries + 1):
+            try:
+                return self._post(path, json=json)
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                if not _unsent(e) or attempt == max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+
+    def _submit_chunk(self, path: str, chunk: List[Dict[str, Any]], max_workers: int, max_retries: int) -> List[JobHandle]:
+        if self._bulk_supported is not False:
+            try:
+                resp = self._post_with_retry(f"{path}/bulk", {"requests": chunk}, max_retries)
+                self._bulk_supported = True
+                return [JobHandle(self, j["id"], j["status"]) for j in resp.json()["jobs"]]
+            except httpx.HTTPStatusError as e:
+                if self._bulk_supported or e.response.status_code not in (404, 405):
+                    raise
+                self._bulk_supported = False
+
+        # Older servers: one POST per job, several in flight over the shared connection pool
+        def submit(request):
+            data = self._post_with_retry(path, request, max_retries).json()
+            return JobHandle(self, data["id"], data["status"])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(submit, chunk))
+
+    def _submit_many(
+        self,
+        path: str,
+        requests: Iterable[Dict[str, Any]],
+        chunk_size: int = 500,
+        max_workers: int = 8,
+        max_retries: int = 3
+    ) -> List[JobHandle]:
+        """
+        Submit jobs `chunk_size` at a time, reading `requests` lazily so only one
+        chunk is held in memory. Each chunk goes to the server's bulk endpoint, or
+        as `max_workers` concurrent single POSTs if the server has none. Requests that
+        failed before reaching the server (connection errors, 429, 503) are retried up to
+        `max_retries` times; other errors are raised, since the jobs may have been
+        queued. Handles come back in input order.
+        """
+        handles: List[JobHandle] = []
+        chunk: List[Dict[str, Any]] = []
+        for request in requests:
+            chunk.append(request)
+            if len(chunk) == chunk_size:
+                handles.extend(self._submit_chunk(path, chunk, max_workers, max_retries))
+                chunk = []
+        if chunk:
+            handles.extend(self._submit_chunk(path, chunk, max_workers, max_retries))
+        return handles
@@ -0,0 +1,76 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from platformdirs import user_data_dir
+from openbeepboop.common.db import APP_NAME
+
+# Ids per lookup query, below SQLite's bound-parameter limit.
+LOOKUP_CHUNK = 500
+
+def default_store_path() -> str:
+    return os.path.join(user_data_dir(APP_NAME, ensure_exists=True), "results.db")
+
+class ResultStore:
+    """
+    Local SQLite cache of finished jobs. A finished job never changes on the
+    server, so once its result has been downloaded it is read from here instead.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_store_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            result TEXT,
+            stored_at DATETIME
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_stored ON results (stored_at)")
+        self._conn.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, Tuple[str, Optional[Dict[str, Any]]]]:
+        """Job id -> (status, result) for the ids stored locally."""
+        found = {}
+        for start in range(0, len(ids), LOOKUP_CHUNK):
+            chunk = ids[start:start + LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for row in self._conn.execute(f"SELECT id, status, result FROM results WHERE id IN ({placeholders})", chunk):
+                found[row["id"]] = (row["status"], json.loads(row["result"]) if row["result"] is not None else None)
+        return found
+
+    def put_many(self, jobs: Iterable[Tuple[str, str, Optional[Dict[str, Any]]]]):
+        """Store (id, status, result) of finished jobs."""
+        now = datetime.utcnow()
+        rows = [(job_id, status, json.dumps(result) if result is not None else None, now) for job_id, status, result in jobs]
+        if rows:
+            self._conn.executemany("INSERT OR REPLACE INTO results (id, status, result, stored_at) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def list(self, status: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Stored jobs, oldest first: dicts with id, status, result and stored_at."""
+        query = "SELECT id, status, result, stored_at FROM results"
+        params: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY stored_at, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return [
+            {"id": row["id"], "status": row["status"],
+             "result": json.loads(row["result"]) if row["result"] is not None else None,
+             "stored_at": row["stored_at"]}
+            for row in self._conn.execute(query, params)
+        ]
+
+    def close(self):
+        self._conn.close()
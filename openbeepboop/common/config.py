@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal
 from pydantic import BaseModel, Field
 import os
 
@@ -15,17 +15,134 @@ class LocalLLMConfig(BaseModel):
     enabled: bool = False
     port: int = 11434
 
+class BackendConfig(BaseModel):
+    # One OpenAI-compatible model server (e.g. one vLLM/llama.cpp instance per GPU)
+    host: str = "localhost"
+    port: int
+    # Models this server can run; empty means any model.
+    models: List[str] = Field(default_factory=list)
+    max_concurrency: int = Field(default=1, ge=1)
+    api_key: Optional[str] = None
+
+class RateLimitConfig(BaseModel):
+    # A model name, a provider prefix such as "openai" (every "openai/..." model), or "*"
+    model: str = "*"
+    rpm: Optional[int] = Field(default=None, gt=0)
+    tpm: Optional[int] = Field(default=None, gt=0)
+
 class LLMConfig(BaseModel):
     model: Optional[str] = None
     api_key: Optional[str] = None
 
+class WorkerConfig(BaseModel):
+    # Jobs run concurrently by the async engine; 1 keeps the sequential run_once loop.
+    max_concurrency: int = Field(default=1, ge=1)
+    # Pipelined mode: claimed jobs buffered locally beyond the running ones.
+    prefetch: int = Field(default=0, ge=0)
+    # Results are submitted once this many are pending or submit_interval seconds pass.
+    submit_batch_size: int = Field(default=1, ge=1)
+    submit_interval: float = Field(default=1.0, gt=0)
+    # How long a claimed job may wait before it starts; bounds the prefetch buffer.
+    lease_seconds: float = Field(default=300.0, gt=0)
+    # Adaptive mode: an AIMD controller tunes concurrency and fetch size
+    # between min_concurrency and max_concurrency.
+    adaptive: bool = False
+    min_concurrency: int = Field(default=1, ge=1)
+    # Per-job latency in seconds above which the adaptive controller backs off.
+    target_latency: Optional[float] = Field(default=None, gt=0)
+    # Durable result spool: results are appended here before being submitted and
+    # replayed on restart until the server acknowledges them.
+    spool_path: Optional[str] = None
+    # Multi-backend nodes: seconds between backend health checks, and how long
+    # a failing backend is taken out of rotation.
+    health_check_interval: float = Field(default=30.0, gt=0)
+    eject_seconds: float = Field(default=30.0, gt=0)
+    # Token-budget packing: keep at most this many estimated tokens (prompt plus
+    # completion allowance) in flight, sized to the backend's KV cache.
+    token_budget: Optional[int] = Field(default=None, gt=0)
+    # "estimate" uses a fast chars/4 heuristic; "litellm" counts prompts with the
+    # model's tokenizer via litellm.token_counter (slower, exact).
+    tokenizer: Literal["estimate", "litellm"] = "estimate"
+    # Prefix-cache affinity: ask the server for claims clustered by prompt prefix
+    # and run buffered jobs sharing a prefix back to back.
+    group_by_prefix: bool = False
+    # Report the models this node has loaded so the server prefers their jobs
+    # and avoids model swaps (Ollama/LM Studio load models on demand).
+    model_affinity: bool = False
+    # Seconds between heartbeats reporting capacity and throughput to the server's node registry.
+    heartbeat_interval: float = Field(default=30.0, gt=0)
+    # Retries after a provider 429 (with backoff) before the job is released back to the queue.
+    rate_limit_retries: int = Field(default=3, ge=0)
+    # Embedding jobs for the same model are sent in one provider call of up to
+    # this many inputs and estimated tokens.
+    embedding_batch_size: int = Field(default=256, ge=1)
+    embedding_batch_tokens: int = Field(default=65536, ge=1)
+
 class NodeConfig(BaseModel):
     server: ServerConfig
     llm: LLMConfig = Field(default_factory=LLMConfig)
     local_llm: LocalLLMConfig = Field(default_factory=LocalLLMConfig)
+    worker: WorkerConfig = Field(default_factory=WorkerConfig)
+    # When set, jobs are load-balanced across these servers instead of local_llm/llm.
+    backends: List[BackendConfig] = Field(default_factory=list)
+    # Provider request/token budgets; jobs wait locally until they fit.
+    rate_limits: List[RateLimitConfig] = Field(default_factory=list)
 
 class ClientConfig(BaseModel):
     server: ServerConfig
+    # SQLite file caching finished jobs' results locally, so they are downloaded once.
+    result_store: Optional[str] = None
+
+class QueueConfig(BaseModel):
+    # Prefix-grouped claims never hold back jobs that have been queued longer than this.
+    prefix_max_age: float = Field(default=60.0, ge=0)
+    # Warm-model affinity never holds back jobs for cold models queued longer than this.
+    model_max_age: float = Field(default=300.0, ge=0)
+    # Claims are capped to the jobs a registered node can start within this many
+    # seconds, going by its heartbeat (concurrency and seconds per job).
+    claim_horizon: float = Field(default=60.0, gt=0)
+    # Nodes without a heartbeat for this long are no longer listed as live.
+    node_timeout: float = Field(default=90.0, gt=0)
+    # Retryable failures (timeouts, 5xx) are requeued with exponential backoff
+    # starting at retry_backoff seconds, until a job has run max_attempts times.
+    max_attempts: int = Field(default=3, ge=1)
+    retry_backoff: float = Field(default=2.0, ge=0)
+    retry_backoff_max: float = Field(default=300.0, ge=0)
+    # Hedging (jobs submitted with "hedge": true, or by keys with hedging on): a job
+    # running longer than this percentile of recent run times for its model is
+    # offered once more to another node. Needs hedge_min_samples completed jobs.
+    hedge_percentile: float = Field(default=0.95, gt=0, le=1)
+    hedge_min_samples: int = Field(default=20, ge=1)
+    hedge_sample_size: int = Field(default=200, ge=1)
+    # Claim order: "fifo" (submission order) or "deadline" (earliest deadline first;
+    # jobs without a deadline follow, oldest first).
+    order: Literal["fifo", "deadline"] = "fifo"
+
+class CallbackConfig(BaseModel):
+    # Run the webhook delivery worker in the server process.
+    enabled: bool = True
+    # Seconds between delivery passes over the callback outbox.
+    interval: float = Field(default=2.0, gt=0)
+    # Finished jobs per POST to one callback URL.
+    batch_size: int = Field(default=100, ge=1)
+    timeout: float = Field(default=10.0, gt=0)
+    # Failed deliveries are retried with exponential backoff starting at retry_backoff
+    # seconds; after max_attempts the outbox entry is kept but marked dead.
+    max_attempts: int = Field(default=8, ge=1)
+    retry_backoff: float = Field(default=5.0, ge=0)
+    retry_backoff_max: float = Field(default=600.0, ge=0)
+    # Shared secret for HMAC-SHA256 signatures on every delivery.
+    secret: Optional[str] = None
+    # Hosts callback URLs may point at ("*.example.com" for subdomains, "*" for any).
+    # Empty rejects every callback_url: the server would otherwise POST wherever submitters ask.
+    allowed_hosts: List[str] = Field(default_factory=list)
+
+class ServerSettings(BaseModel):
+    queue: QueueConfig = Field(default_factory=QueueConfig)
+    callbacks: CallbackConfig = Field(default_factory=CallbackConfig)
+
+# `openbeepboop-server start --config` hands the settings file to the API process through this variable.
+SERVER_CONFIG_ENV = "OPENBEEPBOOP_SERVER_CONFIG"
 
 def load_node_config(path: str = "node_config.toml") -> NodeConfig:
     if not os.path.exists(path):
@@ -47,3 +164,12 @@ def load_client_config(path: str = "client_config.toml") -> ClientConfig:
         data = tomllib.load(f)
 
     return ClientConfig(**data)
+
+def load_server_config(path: str = "server_config.toml") -> ServerSettings:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Config file not found at {path}")
+
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+
+    return ServerSettings(**data)
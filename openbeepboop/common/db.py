@@ -1,12 +1,59 @@
 import sqlite3
 import os
 from platformdirs import user_data_dir
-from openbeepboop.common.models import Job
+from openbeepboop.common.models import Job, JobStatus
 import json
 from datetime import datetime
 
 APP_NAME = "openbeepboop"
 
+# Columns added to `jobs` after the initial schema, created on old databases by init_db.
+JOB_COLUMNS = {
+    "est_tokens": "INTEGER",
+    "prefix_fp": "TEXT",
+    "model": "TEXT",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "available_at": "DATETIME",
+    "hedge": "INTEGER NOT NULL DEFAULT 0",
+    "hedge_node": "TEXT",
+    "batch_id": "TEXT",
+    "deadline": "DATETIME",
+    # "chat" or "embedding"
+    "kind": "TEXT NOT NULL DEFAULT 'chat'",
+    # Embedding vectors as packed little-endian float32, kept out of result_payload
+    "result_vectors": "BLOB",
+    # key_hash of the API key that submitted the job
+    "owner": "TEXT",
+    # Change sequence number, bumped from job_seq on insert and on every status change
+    "seq": "INTEGER",
+    # Webhook the finished job is POSTed to
+    "callback_url": "TEXT",
+}
+
+FINISHED = ", ".join(f"'{status.value}'" for status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.EXPIRED))
+
+# Columns added to `api_keys` after the initial schema.
+API_KEY_COLUMNS = {
+    # Jobs submitted with this key are hedged unless the request says otherwise
+    "hedge": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Columns added to `nodes` for the node registry.
+NODE_COLUMNS = {
+    "concurrency": "INTEGER",
+    "models": "TEXT",
+    "job_seconds": "REAL",
+    "throughput": "REAL",
+    "in_flight": "INTEGER",
+    "registered_at": "DATETIME",
+}
+
+def _ensure_columns(cursor, table, columns):
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+    for name, declaration in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
 def get_db_path():
     data_dir = user_data_dir(APP_NAME, ensure_exists=True)
     return os.path.join(data_dir, "queue.db")
@@ -33,6 +80,84 @@ def init_db(db_path: str = None):
     )
     """)
 
+    _ensure_columns(cursor, "jobs", JOB_COLUMNS)
+
+    # Claiming and queue-depth counts filter by status in submission order; available_at
+    # (set while a retry backs off) is in the index so claims skip those jobs without row lookups
+    cursor.execute("DROP INDEX IF EXISTS idx_jobs_status_created")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, created_at, available_at)")
+    # Prefix-grouped claims look up the queued jobs sharing a prompt prefix
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_prefix ON jobs (prefix_fp, status, created_at)")
+    # Warm-model claims look up the queued jobs for a node's loaded models
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_model ON jobs (model, status, created_at)")
+    # Batch cancellation finds a batch's unfinished jobs
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, status)")
+    # Claim caps and the node listing count the jobs each node holds
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_locked ON jobs (locked_by, status)")
+    # Hedge candidates: only running hedgeable jobs without a duplicate, by claim time,
+    # so fetches on a drained queue don't scan and sort every PROCESSING row
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_hedge ON jobs (locked_at) "
+        "WHERE status = 'PROCESSING' AND hedge = 1 AND hedge_node IS NULL"
+    )
+    # Expiry and deadline-ordered claims scan queued jobs by deadline
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_deadline ON jobs (status, deadline)")
+
+    # Change feed: one counter shared by all jobs, so seq orders every status transition
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS job_seq (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        value INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO job_seq (id, value) VALUES (1, 0)")
+    for name, event in (("jobs_seq_insert", "AFTER INSERT ON jobs"),
+                        ("jobs_seq_status", "AFTER UPDATE OF status ON jobs WHEN NEW.status IS NOT OLD.status")):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {name} {event}
+        BEGIN
+            UPDATE job_seq SET value = value + 1 WHERE id = 1;
+            UPDATE jobs SET seq = (SELECT value FROM job_seq WHERE id = 1) WHERE rowid = NEW.rowid;
+        END
+        """)
+    # The change feed reads one owner's jobs after a cursor
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_owner_seq ON jobs (owner, seq)")
+
+    # Webhook outbox. A job with a callback_url is queued here by the same statement that
+    # finishes it, so deliveries survive restarts; rows are deleted once delivered
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS callbacks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT NOT NULL,
+        job_id TEXT NOT NULL,
+        created_at DATETIME,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at DATETIME,
+        last_error TEXT,
+        dead INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_callbacks_due ON callbacks (dead, available_at)")
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS jobs_callback
+    AFTER UPDATE OF status ON jobs
+    WHEN NEW.callback_url IS NOT NULL AND NEW.status IN ({FINISHED}) AND OLD.status NOT IN ({FINISHED})
+    BEGIN
+        INSERT INTO callbacks (url, job_id, created_at, available_at)
+        VALUES (NEW.callback_url, NEW.id, strftime('%Y-%m-%d %H:%M:%f', 'now'), strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """)
+
+    # Per-node scheduling state reported by nodes, keyed by their API key name
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS nodes (
+        name TEXT PRIMARY KEY,
+        warm_models TEXT,
+        last_seen DATETIME
+    )
+    """)
+    _ensure_columns(cursor, "nodes", NODE_COLUMNS)
+
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS api_keys (
         key_hash TEXT PRIMARY KEY,
@@ -40,6 +165,17 @@ def init_db(db_path: str = None):
         role TEXT
     )
     """)
+    _ensure_columns(cursor, "api_keys", API_KEY_COLUMNS)
+
+    # Jobs a node should stop working on (it lost a hedged race, or the job was cancelled), delivered on its next call
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cancellations (
+        node TEXT NOT NULL,
+        job_id TEXT NOT NULL,
+        created_at DATETIME,
+        PRIMARY KEY (node, job_id)
+    )
+    """)
 
     conn.commit()
     conn.close()
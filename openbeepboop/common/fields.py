@@ -0,0 +1,79 @@
+import re
+from typing import List, Dict, Any, Union
+
+# Most fields one projection may name.
+MAX_FIELDS = 32
+
+Path = List[Union[str, int]]
+
+_INDEX = re.compile(r"\[(\d+)\]")
+_KEY = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+def parse_field(field: str) -> Path:
+    """
+    Split a field path such as "choices.0.message.content" (or "choices[0].message.content")
+    into keys and list indices. Raises ValueError on malformed paths.
+    """
+    segments = _INDEX.sub(r".\1", field).split(".")
+    path: Path = []
+    for segment in segments:
+        if not _KEY.match(segment):
+            raise ValueError(f"Invalid field path: {field!r}")
+        path.append(int(segment) if segment.isdigit() else segment)
+    return path
+
+def parse_fields(fields: List[str]) -> List[Path]:
+    if not fields:
+        raise ValueError("fields must not be empty")
+    if len(fields) > MAX_FIELDS:
+        raise ValueError(f"At most {MAX_FIELDS} fields")
+    return [parse_field(field) for field in fields]
+
+def json_path(path: Path) -> str:
+    """The SQLite JSON path for a parsed field, e.g. $."choices"[0]."message"."""
+    return "$" + "".join(f"[{key}]" if isinstance(key, int) else f'."{key}"' for key in path)
+
+def extract(obj: Any, path: Path) -> Any:
+    """The value at `path`, or None where it doesn't exist (as SQLite's json_extract)."""
+    for key in path:
+        if isinstance(key, int) and isinstance(obj, list) and key < len(obj):
+            obj = obj[key]
+        elif isinstance(key, str) and isinstance(obj, dict) and key in obj:
+            obj = obj[key]
+        else:
+            return None
+    return obj
+
+def _set_path(target: Dict[str, Any], path: Path, value: Any):
+    node: Any = target
+    for i, key in enumerate(path):
+        if isinstance(node, list):
+            if not isinstance(key, int):
+                return
+            node.extend([None] * (key + 1 - len(node)))
+            current = node[key]
+        else:
+            current = node.get(key)
+
+        if i == len(path) - 1:
+            child = value
+        elif isinstance(current, (dict, list)):
+            child = current
+        else:
+            child = [] if isinstance(path[i + 1], int) else {}
+        node[key] = child
+        node = child
+
+def nest(paths: List[Path], values: List[Any]) -> Dict[str, Any]:
+    """
+    Rebuild the selected values in their original shape, so that e.g.
+    result["choices"][0]["message"]["content"] reads the same as on the full object.
+    List positions that weren't selected are None.
+    """
+    result: Dict[str, Any] = {}
+    for path, value in zip(paths, values):
+        _set_path(result, path, value)
+    return result
+
+def project(obj: Any, paths: List[Path]) -> Dict[str, Any]:
+    return nest(paths, [extract(obj, path) for path in paths])
@@ -9,6 +9,12 @@ class JobStatus(str, Enum):
     PROCESSING = "PROCESSING"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+    EXPIRED = "EXPIRED"
+
+class JobKind(str, Enum):
+    CHAT = "chat"
+    EMBEDDING = "embedding"
 
 class JobBase(BaseModel):
     request_payload: Dict[str, Any]
@@ -0,0 +1,30 @@
+import hashlib
+from typing import Any, Dict, List, Optional
+
+# Leading characters of the shared prompt that make up the fingerprint: enough to
+# tell long system prompts and few-shot blocks apart without hashing whole conversations.
+PREFIX_FINGERPRINT_CHARS = 2048
+
+def _render(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(str(part.get("text") or "") for part in content if isinstance(part, dict))
+        parts.append(f"{message.get('role', '')}\n{content or ''}")
+    return "\n".join(parts)
+
+def prefix_fingerprint(payload: Dict[str, Any]) -> Optional[str]:
+    """
+    Fingerprint of the prompt prefix a server could serve from its prefix cache.
+    All messages but the last (system prompt, few-shot turns) form the prefix;
+    a single-message prompt uses its own leading text. Jobs for different models never match.
+    """
+    messages = payload.get("messages")
+    # Malformed requests are still queued, just without a fingerprint
+    if not isinstance(messages, list) or not messages or not all(isinstance(m, dict) for m in messages):
+        return None
+    shared = messages[:-1] if len(messages) > 1 else messages
+    prefix = _render(shared)[:PREFIX_FINGERPRINT_CHARS]
+    key = f"{payload.get('model') or ''}\0{prefix}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
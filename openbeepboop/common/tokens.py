@@ -0,0 +1,99 @@
+import json
+import math
+from typing import Any, Dict, List, Optional, Callable
+
+# Rough average for English text with BPE tokenizers.
+CHARS_PER_TOKEN = 4
+# Role markers and separators that chat templates add around each message.
+TOKENS_PER_MESSAGE = 4
+# Flat cost for an image part; the real cost depends on resolution and model.
+TOKENS_PER_IMAGE = 765
+# KV-cache allowance for the completion when the request doesn't set max_tokens.
+DEFAULT_COMPLETION_TOKENS = 512
+
+def _text_tokens(chars: int) -> int:
+    return math.ceil(chars / CHARS_PER_TOKEN)
+
+def estimate_message_tokens(messages: Any) -> int:
+    """
+    Fast, tokenizer-free estimate of the prompt tokens in chat `messages`.
+    Malformed input is estimated as best it can be, never rejected: a bare string
+    counts as text and anything else that isn't a message dict is skipped.
+    """
+    if isinstance(messages, str):
+        messages = [messages]
+    if not isinstance(messages, list):
+        return 0
+
+    total = 0
+    for message in messages:
+        if isinstance(message, str):
+            total += TOKENS_PER_MESSAGE + _text_tokens(len(message))
+            continue
+        if not isinstance(message, dict):
+            continue
+        total += TOKENS_PER_MESSAGE
+        chars = 0
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, str):
+                    chars += len(part)
+                if not isinstance(part, dict):
+                    continue
+                if part.get("type") == "text":
+                    chars += len(str(part.get("text") or ""))
+                elif part.get("type") in ("image_url", "input_image"):
+                    total += TOKENS_PER_IMAGE
+        if message.get("tool_calls"):
+            chars += len(json.dumps(message["tool_calls"]))
+        total += _text_tokens(chars)
+    return total
+
+def completion_allowance(payload: Dict[str, Any], default: int = DEFAULT_COMPLETION_TOKENS) -> int:
+    for key in ("max_completion_tokens", "max_tokens"):
+        value = payload.get(key)
+        if isinstance(value, int) and value > 0:
+            return value
+    return default
+
+def estimate_request_tokens(
+    payload: Dict[str, Any],
+    count_prompt: Optional[Callable[[Dict[str, Any]], int]] = None,
+    default_completion_tokens: int = DEFAULT_COMPLETION_TOKENS
+) -> int:
+    """
+    Tokens a chat request will occupy in a server's KV cache: prompt plus completion allowance.
+    `count_prompt` may supply an exact tokenizer-based prompt count; the heuristic is used otherwise.
+    """
+    prompt = None
+    if count_prompt is not None:
+        try:
+            prompt = count_prompt(payload)
+        except Exception:
+            prompt = None
+    if prompt is None:
+        prompt = estimate_message_tokens(payload.get("messages"))
+        if payload.get("tools"):
+            prompt += _text_tokens(len(json.dumps(payload["tools"])))
+    return prompt + completion_allowance(payload, default_completion_tokens)
+
+def embedding_inputs(payload: Dict[str, Any]) -> List[Any]:
+    """The separate inputs of an embeddings request: strings or token-id lists."""
+    value = payload.get("input")
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list) and value and all(isinstance(item, int) for item in value):
+        return [value] # A single pre-tokenized input
+    return list(value) if isinstance(value, list) else [value]
+
+def estimate_embedding_tokens(payload: Dict[str, Any]) -> int:
+    """Tokens an embeddings request sends; there is no completion."""
+    total = 0
+    for item in embedding_inputs(payload):
+        total += len(item) if isinstance(item, list) else _text_tokens(len(str(item)))
+    return total
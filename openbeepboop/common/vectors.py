@@ -0,0 +1,45 @@
+import sys
+import base64
+from array import array
+from typing import List, Sequence
+
+# Vectors are stored and sent as little-endian float32, 4 bytes per dimension
+# (the same layout as OpenAI's base64 encoding_format).
+FLOAT_BYTES = 4
+
+def pack_vectors(vectors: Sequence[Sequence[float]]) -> bytes:
+    """Concatenate equal-length vectors into packed little-endian float32."""
+    packed = array("f")
+    for vector in vectors:
+        packed.extend(vector)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+def unpack_vectors(data: bytes, count: int) -> List[List[float]]:
+    """Split packed float32 back into `count` equal-length vectors."""
+    if count <= 0:
+        return []
+    values = array("f")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    if len(values) % count:
+        raise ValueError(f"{len(values)} floats do not split into {count} vectors")
+    dims = len(values) // count
+    return [values[i * dims:(i + 1) * dims].tolist() for i in range(count)]
+
+def split_packed(data: bytes, count: int) -> List[bytes]:
+    """Split packed float32 into the raw bytes of each of `count` vectors."""
+    if count <= 0:
+        return []
+    if len(data) % (count * FLOAT_BYTES):
+        raise ValueError(f"{len(data)} bytes do not split into {count} float32 vectors")
+    size = len(data) // count
+    return [data[i * size:(i + 1) * size] for i in range(count)]
+
+def encode_vectors(vectors: Sequence[Sequence[float]]) -> str:
+    return base64.b64encode(pack_vectors(vectors)).decode("ascii")
+
+def decode_vectors(text: str) -> bytes:
+    return base64.b64decode(text)
@@ -0,0 +1,39 @@
+import hashlib
+import hmac
+import time
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+# Headers on completion callbacks signed with the server's callbacks.secret.
+SIGNATURE_HEADER = "X-OpenBeepBoop-Signature"
+TIMESTAMP_HEADER = "X-OpenBeepBoop-Timestamp"
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 over "<timestamp>.<body>", as sent in SIGNATURE_HEADER."""
+    digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+def verify(secret: str, timestamp: str, body: bytes, signature: str, tolerance: Optional[float] = 300, now: Optional[float] = None) -> bool:
+    """
+    Check a callback's signature, for receivers. Deliveries signed more than
+    `tolerance` seconds ago are rejected so captured requests can't be replayed.
+    """
+    try:
+        sent_at = float(timestamp)
+    except ValueError:
+        return False
+    if tolerance is not None and abs((now if now is not None else time.time()) - sent_at) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), signature)
+
+def host_allowed(url: str, allowed_hosts: List[str]) -> bool:
+    """
+    Whether a callback URL's host is on the allow list: exact hostnames,
+    "*.example.com" for any subdomain, or "*" for any host. An empty list allows none.
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    for allowed in allowed_hosts:
+        allowed = allowed.lower()
+        if allowed == "*" or host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:])):
+            return True
+    return False
@@ -0,0 +1,152 @@
+import time
+import asyncio
+import logging
+import httpx
+from typing import List, Optional, Dict, Any
+from openbeepboop.common.config import BackendConfig
+
+logger = logging.getLogger("node")
+
+# Consecutive inference failures after which a backend is ejected.
+EJECT_AFTER_FAILURES = 3
+
+class NoBackendError(Exception):
+    pass
+
+class Backend:
+    def __init__(self, config: BackendConfig):
+        self.config = config
+        self.name = f"{config.host}:{config.port}"
+        self.api_base = f"http://{config.host}:{config.port}/v1"
+        self.api_key = config.api_key or "sk-dummy" # Local servers often don't check key
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_used = 0.0
+
+    def serves(self, model: Optional[str]) -> bool:
+        return not self.config.models or model in self.config.models
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / self.config.max_concurrency
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.config.max_concurrency
+
+class BackendPool:
+    """
+    Local LLM servers driven by one node. Jobs go to the least-loaded healthy
+    backend that serves their model. A backend is ejected for `eject_seconds`
+    after repeated inference failures or a failed health check, and readmitted
+    when the ejection expires or a health check succeeds.
+    """
+
+    def __init__(self, configs: List[BackendConfig], eject_seconds: float = 30.0):
+        self.backends = [Backend(config) for config in configs]
+        self.eject_seconds = eject_seconds
+        self._condition = None
+
+    @property
+    def capacity(self) -> int:
+        return sum(backend.config.max_concurrency for backend in self.backends)
+
+    def select(self, model: Optional[str]) -> Optional[Backend]:
+        """Claim a slot on the least-loaded ready backend, or None if all are busy or ejected."""
+        serving = [backend for backend in self.backends if backend.serves(model)]
+        if not serving:
+            raise NoBackendError(f"No backend serves model {model}")
+
+        now = time.monotonic()
+        ready = [backend for backend in serving if backend.has_capacity and not backend.is_ejected(now)]
+        if not ready:
+            return None
+
+        backend = min(ready, key=lambda b: (b.load, b.last_used))
+        backend.in_flight += 1
+        backend.last_used = now
+        return backend
+
+    async def acquire(self, model: Optional[str]) -> Backend:
+        """Wait until a backend serving `model` has a free slot."""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            while True:
+                backend = self.select(model)
+                if backend is not None:
+                    return backend
+                # Woken by a release, or re-check when the next ejection expires
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=self._next_readmit())
+                except asyncio.TimeoutError:
+                    pass
+
+    def _next_readmit(self) -> float:
+        now = time.monotonic()
+        waits = [backend.ejected_until - now for backend in self.backends if backend.is_ejected(now)]
+        return max(0.05, min(waits)) if waits else 1.0
+
+    def release(self, backend: Backend, ok: bool = True):
+        backend.in_flight -= 1
+        if ok:
+            backend.failures = 0
+        else:
+            backend.failures += 1
+            if backend.failures >= EJECT_AFTER_FAILURES:
+                self.eject(backend, f"{backend.failures} consecutive failures")
+
+    async def arelease(self, backend: Backend, ok: bool = True):
+        self.release(backend, ok)
+        await self._notify()
+
+    async def _notify(self):
+        if self._condition is not None:
+            async with self._condition:
+                self._condition.notify_all()
+
+    def eject(self, backend: Backend, reason: str):
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        backend.failures = 0
+        logger.warning(f"Ejecting backend {backend.name} for {self.eject_seconds:.0f}s: {reason}")
+
+    def readmit(self, backend: Backend):
+        if backend.ejected_until:
+            logger.info(f"Backend {backend.name} is healthy again")
+        backend.ejected_until = 0.0
+        backend.failures = 0
+
+    async def check(self, client: httpx.AsyncClient):
+        """Probe every backend's OpenAI-compatible model list."""
+        for backend in self.backends:
+            try:
+                resp = await client.get(f"{backend.api_base}/models", headers={"Authorization": f"Bearer {backend.api_key}"})
+                resp.raise_for_status()
+            except Exception as e:
+                if not backend.is_ejected(time.monotonic()):
+                    self.eject(backend, f"health check failed: {e}")
+                continue
+            self.readmit(backend)
+        await self._notify()
+
+    async def run_health_checks(self, interval: float):
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                await self.check(client)
+                await asyncio.sleep(interval)
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "backend": backend.name,
+                "in_flight": backend.in_flight,
+                "max_concurrency": backend.config.max_concurrency,
+                "ejected": backend.is_ejected(now),
+            }
+            for backend in self.backends
+        ]
@@ -0,0 +1,124 @@
+import logging
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger("node")
+
+class AdaptiveController:
+    """
+    AIMD controller for how many jobs a node fetches and keeps in flight.
+
+    Every finished job is fed back through `record`. While the server reports
+    queued work, the limit grows by one slot per successful job until the first
+    cut (slow start), then by roughly one slot per round of `limit` jobs. It is
+    cut multiplicatively on rate limiting (429), on a high error rate, or when
+    latency exceeds the configured target. After a cut, further cuts are held
+    off for one round so a burst of failures from the same overload only counts once.
+    """
+
+    def __init__(
+        self,
+        minimum: int = 1,
+        maximum: int = 1,
+        target_latency: Optional[float] = None,
+        decrease_factor: float = 0.5,
+        error_threshold: float = 0.2,
+        smoothing: float = 0.2,
+    ):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.smoothing = smoothing
+
+        self.limit = float(self.minimum)
+        self.latency = None
+        self.error_rate = 0.0
+        self.queue_depth = None
+        self.in_flight = 0
+
+        self.completed = 0
+        self.throttled = 0
+        self.increases = 0
+        self.decreases = 0
+        self.last_decision = None
+        self._hold_off = 0
+        self._slow_start = True
+
+    @property
+    def concurrency(self) -> int:
+        return int(self.limit)
+
+    def fetch_size(self, wanted: int) -> int:
+        """Jobs to ask for, never more than the server says are queued (but always probe for one)."""
+        size = max(0, wanted)
+        if self.queue_depth is not None:
+            size = min(size, max(1, self.queue_depth))
+        return size
+
+    def observe_queue_depth(self, depth: Optional[int]):
+        if depth is not None:
+            self.queue_depth = depth
+
+    def record(self, latency: float, failed: bool = False, throttled: bool = False):
+        self.completed += 1
+        self.latency = latency if self.latency is None else self.latency + self.smoothing * (latency - self.latency)
+        self.error_rate += self.smoothing * ((1.0 if failed else 0.0) - self.error_rate)
+        if throttled:
+            self.throttled += 1
+
+        if self._hold_off > 0:
+            self._hold_off -= 1
+
+        if throttled:
+            self._decrease("rate limited")
+        elif self.error_rate > self.error_threshold:
+            self._decrease("error rate")
+        elif self.target_latency is not None and self.latency > self.target_latency:
+            self._decrease("latency above target")
+        elif not failed and self._has_demand():
+            self._increase()
+
+    def _has_demand(self) -> bool:
+        # Unknown depth (older servers) counts as demand; more slots don't help an empty queue.
+        return self.queue_depth is None or self.queue_depth > 0
+
+    def _increase(self):
+        if self.limit >= self.maximum:
+            return
+        before = self.concurrency
+        step = 1.0 if self._slow_start else 1.0 / self.limit
+        self.limit = min(float(self.maximum), self.limit + step)
+        if self.concurrency != before:
+            self.increases += 1
+            self._decide(before, "increase")
+
+    def _decrease(self, reason: str):
+        if self._hold_off > 0 or self.limit <= self.minimum:
+            return
+        before = self.concurrency
+        self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+        self._hold_off = max(1, before)
+        self._slow_start = False
+        self.decreases += 1
+        self._decide(before, reason)
+
+    def _decide(self, before: int, reason: str):
+        self.last_decision = reason
+        logger.info(f"Adaptive controller: concurrency {before} -> {self.concurrency} ({reason})")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limit": self.concurrency,
+            "min_concurrency": self.minimum,
+            "max_concurrency": self.maximum,
+            "latency_seconds": self.latency,
+            "error_rate": round(self.error_rate, 4),
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "last_decision": self.last_decision,
+        }
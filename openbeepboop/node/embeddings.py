@@ -0,0 +1,72 @@
+import json
+from typing import Any, Dict, List
+from openbeepboop.common.models import JobKind, JobStatus
+from openbeepboop.common.tokens import embedding_inputs
+from openbeepboop.common.vectors import decode_vectors, encode_vectors, unpack_vectors
+
+# Request fields that don't change the provider call, so jobs differing only in these share a batch.
+PER_JOB_FIELDS = ("input", "encoding_format")
+
+def is_embedding(job) -> bool:
+    return job.get("kind") == JobKind.EMBEDDING.value
+
+def input_count(job) -> int:
+    return len(embedding_inputs(job["request_payload"]))
+
+def batch_key(job) -> str:
+    """Jobs with the same key can be sent in one embedding call: same model and parameters."""
+    params = {k: v for k, v in job["request_payload"].items() if k not in PER_JOB_FIELDS}
+    return json.dumps(params, sort_keys=True, default=str)
+
+def batch_inputs(jobs) -> List[Any]:
+    return [item for job in jobs for item in embedding_inputs(job["request_payload"])]
+
+def _as_dict(obj) -> Dict[str, Any]:
+    if isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return dict(obj)
+
+def _vector(item) -> List[float]:
+    embedding = _as_dict(item)["embedding"]
+    if isinstance(embedding, str):
+        # Provider answered in base64 float32
+        return unpack_vectors(decode_vectors(embedding), 1)[0]
+    return list(embedding)
+
+def split_response(jobs, response, tokens: List[int]) -> List[Dict[str, Any]]:
+    """
+    Fan one batched embedding response back out to its jobs, in input order.
+    Each result carries its vectors base64-packed in `vectors`; usage is shared
+    out in proportion to the jobs' estimated tokens.
+    """
+    response = _as_dict(response)
+    data = sorted(response.get("data") or [], key=lambda item: _as_dict(item).get("index", 0))
+    expected = sum(input_count(job) for job in jobs)
+    if len(data) != expected:
+        raise ValueError(f"Embedding response has {len(data)} vectors for {expected} inputs")
+
+    usage = _as_dict(response.get("usage") or {})
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    total_estimate = sum(tokens) or 1
+
+    results = []
+    offset = 0
+    for job, estimate in zip(jobs, tokens):
+        count = input_count(job)
+        vectors = [_vector(item) for item in data[offset:offset + count]]
+        offset += count
+        share = round(prompt_tokens * estimate / total_estimate)
+        results.append({
+            "id": job["id"],
+            "status": JobStatus.COMPLETED.value,
+            "result": {
+                "object": "list",
+                "data": [{"object": "embedding", "index": index} for index in range(count)],
+                "model": response.get("model"),
+                "usage": {"prompt_tokens": share, "total_tokens": share},
+            },
+            "vectors": encode_vectors(vectors),
+        })
+    return results
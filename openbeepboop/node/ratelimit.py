@@ -0,0 +1,195 @@
+import time
+import asyncio
+import logging
+from typing import List, Optional, Dict, Any, Mapping
+from openbeepboop.common.config import RateLimitConfig
+
+logger = logging.getLogger("node")
+
+# Backoff after a 429 without a Retry-After header, doubling per consecutive 429.
+THROTTLE_BACKOFF_INITIAL = 1.0
+THROTTLE_BACKOFF_MAX = 60.0
+
+class TokenBucket:
+    """Refills continuously up to `per_minute`, at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.level = self.per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60.0)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full one
+        amount = min(amount, self.per_minute)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.per_minute
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def refund(self, amount: float):
+        self.level = min(self.per_minute, self.level + amount)
+
+    def observe(self, limit: Optional[float], remaining: Optional[float], now: float):
+        """Adopt the provider's view of the limit and what is left of it."""
+        if limit:
+            self.per_minute = float(limit)
+        self._refill(now)
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+
+class _Limits:
+    def __init__(self, config: Optional[RateLimitConfig]):
+        self.requests = TokenBucket(config.rpm) if config is not None and config.rpm else None
+        self.tokens = TokenBucket(config.tpm) if config is not None and config.tpm else None
+        self.blocked_until = 0.0
+        self.strikes = 0
+
+def _header(headers: Mapping[str, Any], name: str) -> Optional[float]:
+    # LiteLLM passes provider headers through, sometimes with an "llm_provider-" prefix
+    for key in (name, f"llm_provider-{name}"):
+        value = headers.get(key)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+def response_headers(obj) -> Mapping[str, Any]:
+    """Provider HTTP headers from a LiteLLM response or exception, if any."""
+    hidden = getattr(obj, "_hidden_params", None)
+    if isinstance(hidden, dict) and isinstance(hidden.get("additional_headers"), Mapping):
+        return hidden["additional_headers"]
+    for attr in ("litellm_response_headers", "headers"):
+        headers = getattr(obj, attr, None)
+        if isinstance(headers, Mapping):
+            return headers
+    response = getattr(obj, "response", None)
+    headers = getattr(response, "headers", None)
+    if isinstance(headers, Mapping):
+        return headers
+    return {}
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for remote providers.
+
+    Budgets are keyed by the most specific configured entry matching the job's
+    model: an exact model name, or a provider prefix such as "openai" that
+    covers every "openai/..." model. Models without an entry get their own
+    budgets once the provider reports limits in x-ratelimit-* headers.
+    A 429 blocks the key for Retry-After seconds, or an exponential backoff.
+    """
+
+    def __init__(self, configs: List[RateLimitConfig]):
+        self.configs = configs
+        self._limits: Dict[str, _Limits] = {}
+
+    def _config(self, model: Optional[str]) -> Optional[RateLimitConfig]:
+        model = model or ""
+        matches = [
+            config for config in self.configs
+            if config.model == "*" or model == config.model or model.startswith(f"{config.model}/")
+        ]
+        if not matches:
+            return None
+        return max(matches, key=lambda config: 0 if config.model == "*" else len(config.model))
+
+    def _get(self, model: Optional[str]) -> _Limits:
+        config = self._config(model)
+        key = config.model if config is not None else (model or "")
+        limits = self._limits.get(key)
+        if limits is None:
+            limits = self._limits[key] = _Limits(config)
+        return limits
+
+    def delay(self, model: Optional[str], tokens: int) -> float:
+        """Seconds until a request of `tokens` fits the budgets (0 if it fits now)."""
+        now = time.monotonic()
+        limits = self._get(model)
+        waits = [limits.blocked_until - now]
+        if limits.requests is not None:
+            waits.append(limits.requests.wait_time(1, now))
+        if limits.tokens is not None:
+            waits.append(limits.tokens.wait_time(tokens, now))
+        return max(0.0, *waits)
+
+    def reserve(self, model: Optional[str], tokens: int):
+        now = time.monotonic()
+        limits = self._get(model)
+        if limits.requests is not None:
+            limits.requests.take(1, now)
+        if limits.tokens is not None:
+            limits.tokens.take(tokens, now)
+
+    def acquire(self, model: Optional[str], tokens: int):
+        """Block until the budgets allow the request, then reserve it."""
+        while True:
+            wait = self.delay(model, tokens)
+            if wait <= 0:
+                self.reserve(model, tokens)
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, model: Optional[str], tokens: int):
+        while True:
+            wait = self.delay(model, tokens)
+            if wait <= 0:
+                self.reserve(model, tokens)
+                return
+            await asyncio.sleep(wait)
+
+    def succeeded(self, model: Optional[str], reserved: int, used: Optional[int], headers: Mapping[str, Any]):
+        """Return unused reserved tokens and refine budgets from the response headers."""
+        limits = self._get(model)
+        limits.strikes = 0
+        if limits.tokens is not None and used is not None and used < reserved:
+            limits.tokens.refund(reserved - used)
+        self.observe_headers(model, headers)
+
+    def observe_headers(self, model: Optional[str], headers: Mapping[str, Any]):
+        now = time.monotonic()
+        limits = self._get(model)
+        for kind in ("requests", "tokens"):
+            limit = _header(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _header(headers, f"x-ratelimit-remaining-{kind}")
+            bucket = getattr(limits, kind)
+            if bucket is None and limit:
+                bucket = TokenBucket(limit)
+                setattr(limits, kind, bucket)
+            if bucket is not None:
+                bucket.observe(limit, remaining, now)
+
+    def throttled(self, model: Optional[str], headers: Mapping[str, Any]) -> float:
+        """Record a 429 and return how long the model's budget is blocked."""
+        limits = self._get(model)
+        retry_after = _header(headers, "retry-after")
+        if retry_after is None:
+            retry_after = min(THROTTLE_BACKOFF_MAX, THROTTLE_BACKOFF_INITIAL * 2 ** limits.strikes)
+        limits.strikes += 1
+        limits.blocked_until = max(limits.blocked_until, time.monotonic() + retry_after)
+        self.observe_headers(model, headers)
+        logger.warning(f"Rate limited on {model}, holding its jobs for {retry_after:.1f}s")
+        return retry_after
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "key": key,
+                "requests_left": None if limits.requests is None else round(limits.requests.level, 2),
+                "tokens_left": None if limits.tokens is None else round(limits.tokens.level, 2),
+                "blocked_seconds": max(0.0, limits.blocked_until - now),
+            }
+            for key, limits in self._limits.items()
+        ]
@@ -0,0 +1,124 @@
+import json
+import os
+import logging
+from typing import List, Dict, Any, Iterable
+
+logger = logging.getLogger("node")
+
+# Rewrite the file once this many lines are dead weight (acked puts and ack records)
+# and they outnumber the live entries.
+COMPACT_MIN_DEAD_LINES = 1000
+
+class ResultSpool:
+    """
+    Append-only on-disk log of job results that have not been acknowledged by the server yet.
+
+    Each line is a JSON record, either `{"op": "put", "result": {...}}` or
+    `{"op": "ack", "ids": [...]}`. Opening the spool replays the file, so results
+    from a previous run that never reached the server are picked up again.
+    A torn last line (crash mid-write) is cut off before anything new is appended.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._dead_lines = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+        if self._pending:
+            logger.info(f"Result spool {path}: replaying {len(self._pending)} unacknowledged results")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        # Byte offset just past the last complete record
+        good_end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn line")
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                good_end = f.tell()
+                if record.get("op") == "put":
+                    job_id = record["result"]["id"]
+                    if job_id in self._pending:
+                        self._dead_lines += 1
+                    self._pending[job_id] = record["result"]
+                elif record.get("op") == "ack":
+                    for job_id in record["ids"]:
+                        if self._pending.pop(job_id, None) is not None:
+                            self._dead_lines += 1
+                    self._dead_lines += 1
+
+        if good_end < os.path.getsize(self.path):
+            # Otherwise the next record would be glued onto the torn fragment and both lost
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _write(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def append(self, results: List[Dict[str, Any]]):
+        """Durably record results before they are sent to the server."""
+        if not results:
+            return
+        self._write({"op": "put", "result": result} for result in results)
+        for result in results:
+            if result["id"] in self._pending:
+                self._dead_lines += 1
+            self._pending[result["id"]] = result
+
+    def pending(self, limit: int = None) -> List[Dict[str, Any]]:
+        """Oldest unacknowledged results first."""
+        results = list(self._pending.values())
+        return results if limit is None else results[:limit]
+
+    def ack(self, ids: List[str]):
+        """Mark results as accepted by the server."""
+        acked = [job_id for job_id in ids if job_id in self._pending]
+        if not acked:
+            return
+        for job_id in acked:
+            del self._pending[job_id]
+
+        if not self._pending:
+            # Nothing live left: start a fresh file instead of logging the ack.
+            self.compact()
+            return
+
+        self._write([{"op": "ack", "ids": acked}])
+        self._dead_lines += len(acked) + 1
+        if self._dead_lines >= COMPACT_MIN_DEAD_LINES and self._dead_lines > len(self._pending):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the file with only the live entries."""
+        self._file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for result in self._pending.values():
+                f.write(json.dumps({"op": "put", "result": result}) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._dead_lines = 0
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
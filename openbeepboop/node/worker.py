@@ -1,31 +1,274 @@
 import time
 import asyncio
+from collections import deque
 import httpx
 import logging
-from litellm import completion
+from litellm import completion, acompletion, embedding, aembedding, token_counter
 from openbeepboop.common.config import NodeConfig, load_node_config
 from openbeepboop.common.models import JobStatus
+from openbeepboop.common.tokens import estimate_request_tokens, estimate_embedding_tokens
+from openbeepboop.node.controller import AdaptiveController
+from openbeepboop.node.spool import ResultSpool
+from openbeepboop.node.backends import BackendPool, NoBackendError
+from openbeepboop.node.ratelimit import RateLimiter, response_headers
+from openbeepboop.node.embeddings import is_embedding, input_count, batch_key, batch_inputs, split_response
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("node")
 
+# Prefetched jobs should start within this fraction of their lease.
+LEASE_SAFETY_FRACTION = 0.5
+JOB_SECONDS_SMOOTHING = 0.2
+
+# Spooled results are replayed in batches of at least this size, with
+# exponential backoff between failed attempts.
+SPOOL_FLUSH_BATCH = 100
+SPOOL_BACKOFF_INITIAL = 1.0
+SPOOL_BACKOFF_MAX = 60.0
+
 class NodeClient:
     def __init__(self, config: NodeConfig):
         self.config = config
         self.client = httpx.Client(base_url=config.server.url, timeout=30.0)
         self.headers = {"Authorization": f"Bearer {config.server.api_key}"}
+        # Shared connection pool for the async engine; opened by run_async.
+        self.aclient = None
+        # Smoothed inference time per job, used to size the prefetch buffer.
+        self._job_seconds = None
+        self.backends = None
+        if config.backends:
+            self.backends = BackendPool(config.backends, eject_seconds=config.worker.eject_seconds)
+        self.controller = None
+        if config.worker.adaptive:
+            self.controller = AdaptiveController(
+                minimum=config.worker.min_concurrency,
+                maximum=self._max_concurrency(),
+                target_latency=config.worker.target_latency
+            )
+        self.rate_limiter = RateLimiter(config.rate_limits)
+        self.spool = None
+        if config.worker.spool_path:
+            self.spool = ResultSpool(config.worker.spool_path)
+        self._spool_delay = 0.0
+        self._spool_retry_at = 0.0
+        # Estimated tokens of the jobs currently running (token-budget packing).
+        self._tokens_in_flight = 0
+        # Model last run on each backend (None without backends), reported for warm-model affinity.
+        self._warm_models = {}
+        # Registry reporting: jobs running now, and completions since the last report.
+        self._in_flight = 0
+        self._jobs_done = 0
+        self._reported_done = 0
+        self._reported_at = None
+        # Jobs the server told us to stop (lost a hedged race, cancelled); applied by the engine.
+        self._cancelled = set()
+        self._wakeup = None
+
+    def _fetch_body(self, limit: int, max_tokens: int = None):
+        body = {"limit": limit}
+        if max_tokens is not None:
+            body["max_tokens"] = max_tokens
+        if self.config.worker.group_by_prefix:
+            body["group_by_prefix"] = True
+        if self.config.worker.model_affinity:
+            body["warm_models"] = self.warm_models()
+        return body
+
+    def warm_models(self):
+        return sorted(set(self._warm_models.values()))
+
+    def _note_warm_model(self, job, backend):
+        model = job["request_payload"].get("model")
+        if isinstance(model, str):
+            self._warm_models[backend.name if backend is not None else None] = model
 
-    def fetch_jobs(self, limit: int = 1):
+    def fetch_jobs(self, limit: int = 1, max_tokens: int = None):
         try:
-            resp = self.client.post("/internal/queue/fetch", json={"limit": limit}, headers=self.headers)
+            resp = self.client.post("/internal/queue/fetch", json=self._fetch_body(limit, max_tokens), headers=self.headers)
             resp.raise_for_status()
+            self._observe_queue_depth(resp)
+            self._note_cancel_header(resp)
             return resp.json()
         except Exception as e:
             logger.error(f"Error fetching jobs: {e}")
             return []
 
-    def process_job(self, job):
-        logger.info(f"Processing job {job['id']}")
+    async def afetch_jobs(self, limit: int = 1, max_tokens: int = None):
+        try:
+            resp = await self.aclient.post("/internal/queue/fetch", json=self._fetch_body(limit, max_tokens), headers=self.headers)
+            resp.raise_for_status()
+            self._observe_queue_depth(resp)
+            self._note_cancel_header(resp)
+            return resp.json()
+        except Exception as e:
+            logger.error(f"Error fetching jobs: {e}")
+            return []
+
+    def _observe_queue_depth(self, resp):
+        if self.controller is None:
+            return
+        try:
+            depth = int(resp.headers["X-Queue-Depth"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.controller.observe_queue_depth(depth)
+
+    def _served_models(self):
+        if self.backends is not None:
+            if any(not backend.config.models for backend in self.backends.backends):
+                return [] # Some backend serves any model
+            return sorted({model for backend in self.backends.backends for model in backend.config.models})
+        return [self.config.llm.model] if self.config.llm.model else []
+
+    def node_report(self):
+        """Capacity and throughput for the server's node registry."""
+        now = time.monotonic()
+        throughput = None
+        if self._reported_at is not None and now > self._reported_at:
+            throughput = (self._jobs_done - self._reported_done) / (now - self._reported_at)
+        self._reported_at = now
+        self._reported_done = self._jobs_done
+
+        report = {
+            "concurrency": self._concurrency_limit(),
+            "models": self._served_models(),
+            "job_seconds": self._job_seconds,
+            "throughput": throughput,
+            "in_flight": self._in_flight,
+        }
+        if self.config.worker.model_affinity:
+            report["warm_models"] = self.warm_models()
+        return report
+
+    def _report(self, path: str) -> bool:
+        try:
+            resp = self.client.post(path, json=self.node_report(), headers=self.headers)
+            resp.raise_for_status()
+            self._note_cancellations(resp)
+            return True
+        except Exception as e:
+            logger.warning(f"Error reporting to node registry: {e}")
+            return False
+
+    async def _areport(self, path: str) -> bool:
+        try:
+            resp = await self.aclient.post(path, json=self.node_report(), headers=self.headers)
+            resp.raise_for_status()
+            self._note_cancellations(resp)
+            return True
+        except Exception as e:
+            logger.warning(f"Error reporting to node registry: {e}")
+            return False
+
+    def _cancel_jobs(self, ids):
+        if ids:
+            logger.info(f"Server cancelled {len(ids)} jobs on this node")
+            self._cancelled.update(ids)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _note_cancellations(self, resp):
+        try:
+            data = resp.json()
+        except Exception:
+            return
+        if isinstance(data, dict):
+            self._cancel_jobs(data.get("cancel"))
+
+    def _note_cancel_header(self, resp):
+        header = resp.headers.get("X-Cancel-Jobs")
+        if header:
+            self._cancel_jobs([job_id for job_id in header.split(",") if job_id])
+
+    def register(self) -> bool:
+        return self._report("/internal/nodes/register")
+
+    def heartbeat(self) -> bool:
+        return self._report("/internal/nodes/heartbeat")
+
+    async def aregister(self) -> bool:
+        return await self._areport("/internal/nodes/register")
+
+    async def aheartbeat(self) -> bool:
+        return await self._areport("/internal/nodes/heartbeat")
+
+    def _heartbeat_due(self) -> bool:
+        return self._reported_at is None or time.monotonic() - self._reported_at >= self.config.worker.heartbeat_interval
+
+    async def _run_heartbeats(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.aheartbeat()
+
+    def _count_prompt_tokens(self, payload) -> int:
+        return token_counter(model=payload.get("model") or self.config.llm.model or "", messages=payload.get("messages"))
+
+    def job_tokens(self, job) -> int:
+        """Estimated KV-cache footprint of a job: the server's estimate unless a local tokenizer is configured."""
+        if is_embedding(job):
+            if job.get("est_tokens") is not None:
+                return job["est_tokens"]
+            return estimate_embedding_tokens(job["request_payload"])
+        if self.config.worker.tokenizer == "litellm":
+            return estimate_request_tokens(job["request_payload"], count_prompt=self._count_prompt_tokens)
+        if job.get("est_tokens") is not None:
+            return job["est_tokens"]
+        return estimate_request_tokens(job["request_payload"])
+
+    def _admits(self, tokens: int, running) -> bool:
+        # A job larger than the whole budget still runs, alone.
+        budget = self.config.worker.token_budget
+        return budget is None or not running or self._tokens_in_flight + tokens <= budget
+
+    def _token_room(self, buffered_tokens: int):
+        """Token budget left for fetching: the running budget, plus one more budget's worth when prefetching."""
+        budget = self.config.worker.token_budget
+        if budget is None:
+            return None
+        if self._buffer_limit() > 0:
+            budget *= 2
+        return budget - self._tokens_in_flight - buffered_tokens
+
+    def _buffer_job(self, buffer, entry):
+        """Queue a claimed job locally, right behind buffered jobs with the same prompt prefix if grouping."""
+        fingerprint = entry[0].get("prefix_fp")
+        if self.config.worker.group_by_prefix and fingerprint is not None:
+            for index in range(len(buffer) - 1, -1, -1):
+                if buffer[index][0].get("prefix_fp") == fingerprint:
+                    buffer.insert(index + 1, entry)
+                    return
+        buffer.append(entry)
+
+    def _take_batch(self, buffer):
+        """
+        Pop the next entry to run. An embedding job takes buffered embedding jobs
+        with the same model and parameters along, within the batch limits.
+        """
+        head = buffer.popleft()
+        batch = [head]
+        if not is_embedding(head[0]):
+            return batch
+        worker = self.config.worker
+        key = batch_key(head[0])
+        inputs, tokens = input_count(head[0]), head[2]
+        kept = []
+        while buffer:
+            entry = buffer.popleft()
+            job = entry[0]
+            if (
+                is_embedding(job) and batch_key(job) == key
+                and inputs + input_count(job) <= worker.embedding_batch_size
+                and tokens + entry[2] <= worker.embedding_batch_tokens
+            ):
+                batch.append(entry)
+                inputs += input_count(job)
+                tokens += entry[2]
+            else:
+                kept.append(entry)
+        buffer.extend(kept)
+        return batch
+
+    def _completion_kwargs(self, job, backend=None):
         request_payload = job["request_payload"]
 
         # Determine model and api_base
@@ -46,96 +289,644 @@ class NodeClient:
         # Override with payload model if needed, or enforce node config?
         # Usually node enforcing model is safer for "heterogeneous compute nodes" specializing in models.
         # But payload usually has "model" field.
-        # Let's check SPEC. "If local_llm.enabled is true... overrides 'llm.model' logic".
-        # It also says "Use LiteLLM to invoke the model."
+        # SPEC: "If local_llm.enabled is true... overrides 'llm.model' logic".
+        # The fetch endpoint doesn't filter by model, so any node may get any job;
+        # if the user payload specifies a model, LiteLLM uses it.
 
-        # If the user payload specifies a model, do we use it?
-        # SPEC says: "LiteLLM (supporting local and remote models)"
-        # And "Node Client... pulls requests... runs inference".
-        # If I have a node for "gpt-4" and another for "llama3", the fetch might need to filter?
-        # The SPEC fetch endpoint doesn't support filtering by model.
-        # So assumes any node can handle any job, OR the node overrides the model.
-        # "If local_llm.enabled is true, overrides 'llm.model' logic to point to local instance"
+        # Prepare args for litellm
+        # request_payload follows OpenAI ChatCompletion schema
 
-        # If payload has 'model', LiteLLM uses it.
-        # If we want to force the node's local model, we might need to overwrite `request_payload['model']`.
+        # extract messages
+        messages = request_payload.get("messages")
+        # extract other params
+        kwargs = {k:v for k,v in request_payload.items() if k != "messages"}
 
-        if self.config.local_llm.enabled:
-             # Force usage of local endpoint
-             # We might need to map the model name or just pass it through if the local server supports it.
-             # But `api_base` is crucial.
-             pass
+        # If local, we inject api_base
+        if backend is not None:
+            kwargs["api_base"] = backend.api_base
+            kwargs["api_key"] = backend.api_key
+        elif self.config.local_llm.enabled:
+            kwargs["api_base"] = api_base
+            kwargs["api_key"] = api_key
+            # We might overwrite model if needed, but usually local server ignores it or matches it.
+            # But let's leave it to LiteLLM or payload if possible.
+        elif api_key:
+             kwargs["api_key"] = api_key
+
+        if self.config.llm.model and not self.config.local_llm.enabled:
+             # If node is configured for specific remote model
+             # payload `model` takes precedence in `completion`; config is the fallback.
+             if "model" not in kwargs:
+                 kwargs["model"] = self.config.llm.model
+
+        kwargs["messages"] = messages
+        return kwargs
+
+    def _embedding_kwargs(self, jobs, backend=None):
+        # Same model and connection settings as a chat call; all the jobs' inputs in one request
+        kwargs = self._completion_kwargs(jobs[0], backend)
+        kwargs.pop("messages", None)
+        kwargs.pop("encoding_format", None) # Floats from the provider; the node packs them
+        kwargs["input"] = batch_inputs(jobs)
+        return kwargs
+
+    def _completed(self, job, response):
+        # Response is a ModelResponse object (pydantic-like or dict-like)
+        # We need to serialize it.
+        return {
+            "id": job["id"],
+            "status": JobStatus.COMPLETED.value,
+            "result": response.model_dump() if hasattr(response, 'model_dump') else dict(response)
+        }
+
+    def _failed(self, job, error):
+        logger.error(f"Inference failed: {error}")
+        result = {
+            "id": job["id"],
+            "status": JobStatus.FAILED.value,
+            "error": str(error)
+        }
+        # LiteLLM exceptions carry the provider's HTTP status (e.g. 429 when rate limited)
+        status_code = getattr(error, "status_code", None)
+        if isinstance(status_code, int):
+            result["error_code"] = status_code
+        else:
+            status_code = None
+        # Connection errors, timeouts, rate limits and 5xx may succeed on another attempt
+        result["retryable"] = status_code is None or status_code >= 500 or status_code in (408, 429)
+        return result
+
+    def _record_outcome(self, result, seconds: float):
+        # None means the job was released back to the queue after repeated 429s
+        self._jobs_done += 1
+        self._observe_job_seconds(seconds)
+        if self.controller is not None:
+            self.controller.record(
+                seconds,
+                failed=result is None or result["status"] == JobStatus.FAILED.value,
+                throttled=result is None or result.get("error_code") == 429
+            )
+
+    def _backend_failed(self, result) -> bool:
+        # Connection errors and 5xx count against the backend; 4xx are the request's fault.
+        if result is None or result["status"] != JobStatus.FAILED.value:
+            return False
+        error_code = result.get("error_code")
+        return error_code is None or error_code >= 500
+
+    def _rate_limit_model(self, job):
+        return job["request_payload"].get("model") or self.config.llm.model
+
+    def _usage_tokens(self, response):
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        if isinstance(usage, dict):
+            return usage.get("total_tokens")
+        return getattr(usage, "total_tokens", None)
+
+    def _attempt_succeeded(self, job, response, tokens):
+        self.rate_limiter.succeeded(self._rate_limit_model(job), tokens, self._usage_tokens(response), response_headers(response))
+
+    def _attempt_failed(self, job, error):
+        result = self._failed(job, error)
+        if result.get("error_code") == 429:
+            self.rate_limiter.throttled(self._rate_limit_model(job), response_headers(error))
+        return result
+
+    def _attempt_job(self, job, tokens):
+        backend = None
+        result = None
+        try:
+            if self.backends is not None:
+                backend = self.backends.select(job["request_payload"].get("model"))
+                if backend is None:
+                    raise NoBackendError("All backends are busy or ejected")
+            response = completion(**self._completion_kwargs(job, backend))
+            result = self._completed(job, response)
+            self._attempt_succeeded(job, response, tokens)
+            self._note_warm_model(job, backend)
+        except Exception as e:
+            result = self._attempt_failed(job, e)
+        finally:
+            if backend is not None:
+                self.backends.release(backend, ok=not self._backend_failed(result))
+        return result
+
+    async def _aattempt_job(self, job, tokens):
+        backend = None
+        result = None
+        try:
+            if self.backends is not None:
+                backend = await self.backends.acquire(job["request_payload"].get("model"))
+            response = await acompletion(**self._completion_kwargs(job, backend))
+            result = self._completed(job, response)
+            self._attempt_succeeded(job, response, tokens)
+            self._note_warm_model(job, backend)
+        except Exception as e:
+            result = self._attempt_failed(job, e)
+        finally:
+            if backend is not None:
+                await self.backends.arelease(backend, ok=not self._backend_failed(result))
+        return result
 
+    def _attempt_embeddings(self, jobs, tokens):
+        backend = None
+        results = None
         try:
-            # Prepare args for litellm
-            # We pass the whole payload as kwargs?
-            # request_payload follows OpenAI ChatCompletion schema
-
-            # extract messages
-            messages = request_payload.get("messages")
-            # extract other params
-            kwargs = {k:v for k,v in request_payload.items() if k != "messages"}
-
-            # If local, we inject api_base
-            if self.config.local_llm.enabled:
-                kwargs["api_base"] = api_base
-                kwargs["api_key"] = api_key
-                # We might overwrite model if needed, but usually local server ignores it or matches it.
-                # If we want to strictly use the node's configured model:
-                # kwargs["model"] = "openai/custom"
-                # But let's leave it to LiteLLM or payload if possible.
-            elif api_key:
-                 kwargs["api_key"] = api_key
-
-            # If the node config specifies a model, we might want to default to it if payload doesn't have one?
-            # Or override? "If local_llm... overrides 'llm.model' logic".
-
-            if self.config.llm.model and not self.config.local_llm.enabled:
-                 # If node is configured for specific remote model
-                 # We might want to use that.
-                 # But payload `model` usually takes precedence in `completion`.
-                 # Let's assume payload is correct, or if missing use config.
-                 if "model" not in kwargs:
-                     kwargs["model"] = self.config.llm.model
-
-            response = completion(messages=messages, **kwargs)
-
-            # Response is a ModelResponse object (pydantic-like or dict-like)
-            # We need to serialize it.
-            return {
-                "id": job["id"],
-                "status": JobStatus.COMPLETED.value,
-                "result": response.model_dump() if hasattr(response, 'model_dump') else dict(response)
-            }
+            if self.backends is not None:
+                backend = self.backends.select(jobs[0]["request_payload"].get("model"))
+                if backend is None:
+                    raise NoBackendError("All backends are busy or ejected")
+            response = embedding(**self._embedding_kwargs(jobs, backend))
+            results = split_response(jobs, response, [self.job_tokens(job) for job in jobs])
+            self._attempt_succeeded(jobs[0], response, sum(tokens))
+            self._note_warm_model(jobs[0], backend)
+        except Exception as e:
+            failure = self._attempt_failed(jobs[0], e)
+            results = [dict(failure, id=job["id"]) for job in jobs]
+        finally:
+            if backend is not None:
+                self.backends.release(backend, ok=not self._backend_failed(results[0]))
+        return results
+
+    async def _aattempt_embeddings(self, jobs, tokens):
+        backend = None
+        results = None
+        try:
+            if self.backends is not None:
+                backend = await self.backends.acquire(jobs[0]["request_payload"].get("model"))
+            response = await aembedding(**self._embedding_kwargs(jobs, backend))
+            results = split_response(jobs, response, [self.job_tokens(job) for job in jobs])
+            self._attempt_succeeded(jobs[0], response, sum(tokens))
+            self._note_warm_model(jobs[0], backend)
+        except Exception as e:
+            failure = self._attempt_failed(jobs[0], e)
+            results = [dict(failure, id=job["id"]) for job in jobs]
+        finally:
+            if backend is not None:
+                await self.backends.arelease(backend, ok=not self._backend_failed(results[0]))
+        return results
+
+    def process_embeddings(self, jobs):
+        """
+        Run same-model embedding jobs as one provider call and fan the vectors
+        back out, one result per job. Rate limits are handled as in process_job;
+        released jobs come back as None.
+        """
+        logger.info(f"Processing {len(jobs)} embedding jobs in one call")
+        model = self._rate_limit_model(jobs[0])
+        tokens = [self.job_tokens(job) for job in jobs]
+        for _ in range(self.config.worker.rate_limit_retries + 1):
+            self.rate_limiter.acquire(model, sum(tokens))
+            results = self._attempt_embeddings(jobs, tokens)
+            if results[0].get("error_code") != 429:
+                return results
+        if self.release_jobs([job["id"] for job in jobs]):
+            return [None] * len(jobs)
+        return results
+
+    async def aprocess_embeddings(self, jobs):
+        logger.info(f"Processing {len(jobs)} embedding jobs in one call")
+        model = self._rate_limit_model(jobs[0])
+        tokens = [self.job_tokens(job) for job in jobs]
+        for _ in range(self.config.worker.rate_limit_retries + 1):
+            await self.rate_limiter.aacquire(model, sum(tokens))
+            results = await self._aattempt_embeddings(jobs, tokens)
+            if results[0].get("error_code") != 429:
+                return results
+        if await self.arelease_jobs([job["id"] for job in jobs]):
+            return [None] * len(jobs)
+        return results
+
+    def process_job(self, job):
+        """
+        Run a job within the provider's rate-limit budget. A 429 blocks the
+        model's budget and the job is retried; once retries run out it is
+        released back to the queue and None is returned.
+        """
+        logger.info(f"Processing job {job['id']}")
+        model = self._rate_limit_model(job)
+        tokens = self.job_tokens(job)
+        for _ in range(self.config.worker.rate_limit_retries + 1):
+            self.rate_limiter.acquire(model, tokens)
+            result = self._attempt_job(job, tokens)
+            if result.get("error_code") != 429:
+                return result
+        if self.release_jobs([job["id"]]):
+            return None
+        return result
 
+    async def aprocess_job(self, job):
+        logger.info(f"Processing job {job['id']}")
+        model = self._rate_limit_model(job)
+        tokens = self.job_tokens(job)
+        for _ in range(self.config.worker.rate_limit_retries + 1):
+            await self.rate_limiter.aacquire(model, tokens)
+            result = await self._aattempt_job(job, tokens)
+            if result.get("error_code") != 429:
+                return result
+        if await self.arelease_jobs([job["id"]]):
+            return None
+        return result
+
+    def release_jobs(self, ids) -> bool:
+        """Hand claimed jobs back to the queue unprocessed."""
+        try:
+            resp = self.client.post("/internal/queue/release", json={"ids": ids}, headers=self.headers)
+            resp.raise_for_status()
+            logger.info(f"Released {len(ids)} jobs back to the queue")
+            return True
+        except Exception as e:
+            logger.error(f"Error releasing jobs: {e}")
+            return False
+
+    async def arelease_jobs(self, ids) -> bool:
+        try:
+            resp = await self.aclient.post("/internal/queue/release", json={"ids": ids}, headers=self.headers)
+            resp.raise_for_status()
+            logger.info(f"Released {len(ids)} jobs back to the queue")
+            return True
         except Exception as e:
-            logger.error(f"Inference failed: {e}")
-            return {
-                "id": job["id"],
-                "status": JobStatus.FAILED.value,
-                "error": str(e)
-            }
+            logger.error(f"Error releasing jobs: {e}")
+            return False
 
     def submit_results(self, results):
+        if self.spool is not None:
+            self.spool.append(results)
+            self.flush_spool()
+            return
+        if not results:
+            return
+        try:
+            resp = self.client.post("/internal/queue/submit", json=results, headers=self.headers)
+            self._note_cancellations(resp)
+        except Exception as e:
+            logger.error(f"Error submitting results: {e}")
+
+    async def asubmit_results(self, results):
+        if self.spool is not None:
+            self.spool.append(results)
+            await self.aflush_spool()
+            return
         if not results:
             return
         try:
-            self.client.post("/internal/queue/submit", json=results, headers=self.headers)
+            resp = await self.aclient.post("/internal/queue/submit", json=results, headers=self.headers)
+            self._note_cancellations(resp)
         except Exception as e:
             logger.error(f"Error submitting results: {e}")
 
+    def _spool_retry_due(self) -> bool:
+        return self.spool is not None and len(self.spool) > 0 and time.monotonic() >= self._spool_retry_at
+
+    def _spool_batch(self):
+        return self.spool.pending(max(SPOOL_FLUSH_BATCH, self.config.worker.submit_batch_size))
+
+    def _spool_failed(self, error):
+        self._spool_delay = min(SPOOL_BACKOFF_MAX, max(SPOOL_BACKOFF_INITIAL, self._spool_delay * 2))
+        self._spool_retry_at = time.monotonic() + self._spool_delay
+        logger.error(f"Error submitting results: {error}. {len(self.spool)} spooled, retrying in {self._spool_delay:.0f}s")
+
+    def flush_spool(self) -> bool:
+        """
+        Submit spooled results in batches, acknowledging each batch the server accepts.
+        Stops at the first failure and backs off; returns True once the spool is empty.
+        """
+        if not self._spool_retry_due():
+            return len(self.spool) == 0
+        while len(self.spool):
+            batch = self._spool_batch()
+            try:
+                resp = self.client.post("/internal/queue/submit", json=batch, headers=self.headers)
+                resp.raise_for_status()
+                self._note_cancellations(resp)
+            except Exception as e:
+                self._spool_failed(e)
+                return False
+            self.spool.ack([result["id"] for result in batch])
+        self._spool_delay = 0.0
+        return True
+
+    async def aflush_spool(self) -> bool:
+        if not self._spool_retry_due():
+            return len(self.spool) == 0
+        while len(self.spool):
+            batch = self._spool_batch()
+            try:
+                resp = await self.aclient.post("/internal/queue/submit", json=batch, headers=self.headers)
+                resp.raise_for_status()
+                self._note_cancellations(resp)
+            except Exception as e:
+                self._spool_failed(e)
+                return False
+            self.spool.ack([result["id"] for result in batch])
+        self._spool_delay = 0.0
+        return True
+
     def run_once(self):
-        jobs = self.fetch_jobs(limit=1) # One at a time for simplicity or configurable
+        limit = 1
+        if self.controller is not None:
+            limit = self.controller.fetch_size(self.controller.concurrency)
+        jobs = self.fetch_jobs(limit=limit, max_tokens=self.config.worker.token_budget)
         results = []
+        self._in_flight = len(jobs)
+        pending = deque()
         for job in jobs:
-            res = self.process_job(job)
-            results.append(res)
+            if job["id"] in self._cancelled:
+                self._cancelled.discard(job["id"])
+                continue
+            # Token estimates only bound embedding batches here
+            pending.append((job, None, self.job_tokens(job) if is_embedding(job) else 0))
+        while pending:
+            batch = [entry[0] for entry in self._take_batch(pending)]
+            started = time.monotonic()
+            if is_embedding(batch[0]):
+                outcomes = self.process_embeddings(batch)
+            else:
+                outcomes = [self.process_job(batch[0])]
+            # A batch's time is shared among its jobs
+            seconds = (time.monotonic() - started) / len(outcomes)
+            for res in outcomes:
+                self._record_outcome(res, seconds)
+                if res is not None:
+                    results.append(res)
+        self._in_flight = 0
         self.submit_results(results)
         return len(jobs)
 
+    async def _arun_job(self, job, slots):
+        async with slots:
+            started = time.monotonic()
+            result = await self.aprocess_job(job)
+            self._record_outcome(result, time.monotonic() - started)
+            return result
+
+    async def _arun_embeddings(self, jobs, slots):
+        async with slots:
+            started = time.monotonic()
+            results = await self.aprocess_embeddings(jobs)
+            seconds = (time.monotonic() - started) / len(results)
+            for result in results:
+                self._record_outcome(result, seconds)
+            return results
+
+    def _observe_job_seconds(self, seconds: float):
+        if self._job_seconds is None:
+            self._job_seconds = seconds
+        else:
+            self._job_seconds += JOB_SECONDS_SMOOTHING * (seconds - self._job_seconds)
+
+    def _buffer_limit(self) -> int:
+        """
+        How many claimed-but-not-started jobs we may hold locally.
+        A buffered job waits roughly (position / max_concurrency) * job time before
+        it starts, so the buffer is capped to what drains within a fraction of the lease.
+        """
+        worker = self.config.worker
+        if not worker.prefetch or self._job_seconds is None:
+            return worker.prefetch
+        drain_budget = worker.lease_seconds * LEASE_SAFETY_FRACTION
+        by_lease = int(self._concurrency_limit() * drain_budget / max(self._job_seconds, 1e-3))
+        return max(0, min(worker.prefetch, by_lease))
+
+    def _max_concurrency(self) -> int:
+        if self.backends is not None:
+            return self.backends.capacity
+        return self.config.worker.max_concurrency
+
+    def _concurrency_limit(self) -> int:
+        if self.controller is not None:
+            return self.controller.concurrency
+        return self._max_concurrency()
+
+    def metrics(self):
+        """Current engine and adaptive-controller state, for logging or export."""
+        data = {"job_seconds": self._job_seconds, "concurrency_limit": self._concurrency_limit()}
+        if self.config.worker.token_budget is not None:
+            data["token_budget"] = self.config.worker.token_budget
+            data["tokens_in_flight"] = self._tokens_in_flight
+        if self.controller is not None:
+            data.update(self.controller.metrics())
+        if self.backends is not None:
+            data["backends"] = self.backends.metrics()
+        if self.config.rate_limits:
+            data["rate_limits"] = self.rate_limiter.metrics()
+        return data
+
+    def _uses_async_engine(self) -> bool:
+        worker = self.config.worker
+        return self._max_concurrency() > 1 or worker.prefetch > 0 or worker.submit_batch_size > 1
+
+    async def run_async(self, drain: bool = False, idle_sleep: float = 5.0):
+        """
+        Async engine: keeps up to `worker.max_concurrency` jobs in flight and
+        refills free slots as soon as any job finishes, instead of waiting for
+        a whole batch. Returns the number of jobs processed.
+
+        Fetching and submitting run as background tasks alongside inference:
+        a local buffer of up to `worker.prefetch` claimed jobs is kept topped up,
+        and results are flushed in batches of `worker.submit_batch_size` or
+        every `worker.submit_interval` seconds, whichever comes first.
+
+        With `worker.group_by_prefix`, buffered jobs sharing a prompt prefix run
+        back to back so the backend's prefix cache is reused.
+
+        With `worker.token_budget`, jobs are also admitted only while the estimated
+        tokens in flight fit the budget, and fetches ask the server for at most
+        the remaining budget.
+
+        If `drain` is set, returns once the queue is empty and everything is submitted.
+        """
+        worker = self.config.worker
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self._max_concurrency())
+
+        buffer = deque() # (job, claimed_at, tokens)
+        buffered_tokens = 0
+        running = {} # task -> estimated tokens
+        task_jobs = {} # task -> ids of its jobs not cancelled yet
+        self._tokens_in_flight = 0
+        pending = [] # results waiting to be submitted
+        pending_since = 0.0
+        fetching = None
+        submitting = None
+        queue_empty = False
+        next_fetch = 0.0
+        processed = 0
+        self._wakeup = asyncio.Event()
+        woken = None
+
+        async with httpx.AsyncClient(base_url=self.config.server.url, timeout=30.0) as aclient:
+            self.aclient = aclient
+            await self.aregister()
+            heartbeats = asyncio.create_task(self._run_heartbeats(worker.heartbeat_interval))
+            health_checks = None
+            if self.backends is not None:
+                health_checks = asyncio.create_task(self.backends.run_health_checks(worker.health_check_interval))
+            try:
+                while True:
+                    now = loop.time()
+                    limit = self._concurrency_limit()
+
+                    # Drop jobs the server cancelled (e.g. another node won a hedged race)
+                    if self._cancelled:
+                        for task, ids in task_jobs.items():
+                            # An embedding batch is one provider call; it stops once none of its jobs are wanted
+                            ids -= self._cancelled
+                            if not ids:
+                                task.cancel()
+                        kept = [entry for entry in buffer if entry[0]["id"] not in self._cancelled]
+                        buffered_tokens = sum(entry[2] for entry in kept)
+                        buffer = deque(kept)
+                        self._cancelled.clear()
+
+                    # Start buffered jobs on free slots
+                    while buffer and len(running) < limit and self._admits(buffer[0][2], running):
+                        batch = self._take_batch(buffer)
+                        job, claimed_at, _ = batch[0]
+                        tokens = sum(entry[2] for entry in batch)
+                        buffered_tokens -= tokens
+                        if now - claimed_at > worker.lease_seconds:
+                            logger.warning(f"Job {job['id']} waited {now - claimed_at:.0f}s in the local buffer, past its lease")
+                        if is_embedding(job):
+                            task = asyncio.create_task(self._arun_embeddings([entry[0] for entry in batch], slots))
+                        else:
+                            task = asyncio.create_task(self._arun_job(job, slots))
+                        running[task] = tokens
+                        task_jobs[task] = {entry[0]["id"] for entry in batch}
+                        self._tokens_in_flight += tokens
+
+                    # Top up free slots plus the prefetch buffer in the background
+                    self._in_flight = len(running)
+                    want = limit - len(running) + self._buffer_limit() - len(buffer)
+                    if self.controller is not None:
+                        self.controller.in_flight = len(running)
+                        want = self.controller.fetch_size(want)
+                    token_room = self._token_room(buffered_tokens)
+                    if token_room is not None and token_room <= 0:
+                        want = 0
+                    if fetching is None and want > 0 and now >= next_fetch:
+                        fetching = asyncio.create_task(self.afetch_jobs(limit=want, max_tokens=token_room))
+
+                    idle = not running and not buffer and fetching is None and queue_empty
+
+                    # Flush results on the size or time trigger (or right away once idle)
+                    if submitting is None and pending and (
+                        len(pending) >= worker.submit_batch_size
+                        or now - pending_since >= worker.submit_interval
+                        or idle
+                    ):
+                        if self.spool is not None:
+                            # Already durable in the spool; flush sends its whole backlog
+                            pending = []
+                            submitting = asyncio.create_task(self.aflush_spool())
+                        else:
+                            batch, pending = pending[:worker.submit_batch_size], pending[worker.submit_batch_size:]
+                            submitting = asyncio.create_task(self.asubmit_results(batch))
+                    elif submitting is None and not pending and self._spool_retry_due():
+                        # Replay results left by an earlier run or a failed flush
+                        submitting = asyncio.create_task(self.aflush_spool())
+
+                    # A spool that is backing off is left for the next run
+                    if drain and idle and not pending and submitting is None:
+                        break
+
+                    # Wake up for the next due fetch or flush even if no task completes
+                    deadlines = []
+                    if fetching is None and want > 0:
+                        deadlines.append(next_fetch)
+                    if pending and submitting is None:
+                        deadlines.append(pending_since + worker.submit_interval)
+                    if self.spool is not None and len(self.spool) and submitting is None:
+                        deadlines.append(now + self._spool_retry_at - time.monotonic())
+                    timeout = max(0.0, min(deadlines) - now) if deadlines else None
+
+                    waiting = set(running)
+                    waiting.update(task for task in (fetching, submitting) if task is not None)
+                    if waiting:
+                        if woken is None:
+                            self._wakeup.clear()
+                            woken = asyncio.create_task(self._wakeup.wait())
+                        waiting.add(woken)
+                    if not waiting:
+                        await asyncio.sleep(idle_sleep if timeout is None else timeout)
+                        continue
+
+                    done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    now = loop.time()
+
+                    if fetching in done:
+                        jobs = fetching.result()
+                        fetching = None
+                        for job in jobs:
+                            tokens = self.job_tokens(job)
+                            self._buffer_job(buffer, (job, now, tokens))
+                            buffered_tokens += tokens
+                        queue_empty = not jobs
+                        if queue_empty:
+                            next_fetch = now + idle_sleep # Sleep if no jobs
+
+                    if submitting in done:
+                        submitting = None
+
+                    if woken in done:
+                        woken = None
+
+                    finished = done & running.keys()
+                    if finished:
+                        for task in finished:
+                            self._tokens_in_flight -= running.pop(task)
+                            task_jobs.pop(task)
+                        if not pending:
+                            pending_since = now
+                        outcomes = []
+                        for task in finished:
+                            if task.cancelled():
+                                continue
+                            outcome = task.result()
+                            # Embedding batches finish several jobs at once
+                            outcomes.extend(outcome if isinstance(outcome, list) else [outcome])
+                        results = [result for result in outcomes if result is not None]
+                        if self.spool is not None:
+                            self.spool.append(results)
+                        pending.extend(results)
+                        processed += len(outcomes)
+                        # A slot freed up: refill right away rather than after the idle sleep
+                        next_fetch = 0.0
+            finally:
+                heartbeats.cancel()
+                if woken is not None:
+                    woken.cancel()
+                self._wakeup = None
+                if health_checks is not None:
+                    health_checks.cancel()
+                self.aclient = None
+                self._in_flight = 0
+
+        return processed
+
+    def run_batch(self):
+        """Process available queue items until the queue is empty, then return the job count."""
+        if self._uses_async_engine():
+            return asyncio.run(self.run_async(drain=True))
+
+        self.register()
+        total = 0
+        while True:
+            count = self.run_once()
+            if count == 0:
+                break
+            total += count
+        return total
+
     def run_loop(self):
         logger.info("Starting node loop...")
+        if self._uses_async_engine():
+            asyncio.run(self.run_async())
+            return
+        self.register()
         while True:
+            if self._heartbeat_due():
+                self.heartbeat()
             count = self.run_once()
             if count == 0:
                 time.sleep(5) # Sleep if no jobs
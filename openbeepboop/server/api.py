@@ -1,21 +1,63 @@
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Response, Query
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import sqlite3
 import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import hashlib
+import math
+from concurrent.futures import ThreadPoolExecutor
 from openbeepboop.common.db import get_db_connection, init_db
-from openbeepboop.common.models import Job, JobStatus, JobCreate, InternalJobSubmitRequest
+from openbeepboop.common.models import Job, JobStatus, JobKind, JobCreate, InternalJobSubmitRequest
+from openbeepboop.common.tokens import estimate_request_tokens, estimate_embedding_tokens
+from openbeepboop.common.vectors import decode_vectors, unpack_vectors, split_packed
+import base64
+from openbeepboop.common.prefix import prefix_fingerprint
+from openbeepboop.common.fields import parse_fields, json_path, nest, project
+from openbeepboop.common.config import ServerSettings, CallbackConfig, load_server_config, SERVER_CONFIG_ENV
+from openbeepboop.common.webhooks import sign, host_allowed, SIGNATURE_HEADER, TIMESTAMP_HEADER
 import os
+import time
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger("server")
 
 app = FastAPI(title="OpenBeepBoop Queue Server")
 
+# Queue depth reported to nodes saturates here so counting stays cheap on huge queues.
+QUEUE_DEPTH_CAP = 10000
+
+# Statuses a job never leaves; later results for it are ignored.
+FINISHED_STATUSES = (JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value, JobStatus.EXPIRED.value)
+
+# Result recorded for jobs that expired before any node ran them.
+EXPIRED_RESULT = {"error": "Deadline exceeded"}
+
+# Server tuning; replaced on startup when a settings file is configured.
+settings = ServerSettings()
+
 # Initialize DB on startup
 @app.on_event("startup")
 def startup_event():
+    global settings
     init_db()
+    config_path = os.environ.get(SERVER_CONFIG_ENV)
+    if config_path:
+        settings = load_server_config(config_path)
+
+@app.on_event("startup")
+async def start_callback_worker():
+    if settings.callbacks.enabled:
+        app.state.callback_worker = asyncio.create_task(_callback_worker())
+
+@app.on_event("shutdown")
+async def stop_callback_worker():
+    worker = getattr(app.state, "callback_worker", None)
+    if worker is not None:
+        worker.cancel()
 
 async def verify_token(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
     if not authorization:
@@ -41,63 +83,486 @@ async def verify_token(authorization: Optional[str] = Header(None)) -> Dict[str,
     if not row:
         raise HTTPException(status_code=401, detail="Invalid API Key")
 
-    return {"key_hash": row["key_hash"], "name": row["name"], "role": row["role"]}
+    return {"key_hash": row["key_hash"], "name": row["name"], "role": row["role"], "hedge": bool(row["hedge"])}
+
+# Top-level submission keys that control queueing rather than inference; they are
+# removed from the payload before it is stored and handed to nodes.
+JOB_OPTIONS = ("hedge", "batch_id", "deadline", "ttl", "callback_url")
+
+def _split_job_options(request: Dict[str, Any]):
+    payload = {k: v for k, v in request.items() if k not in JOB_OPTIONS}
+    options = {k: request[k] for k in JOB_OPTIONS if k in request}
+    return payload, options
+
+def _parse_deadline(value) -> datetime:
+    # Unix seconds or ISO 8601; stored as naive UTC like the other timestamps
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.utcfromtimestamp(value)
+    if isinstance(value, str):
+        deadline = datetime.fromisoformat(value)
+        if deadline.tzinfo is not None:
+            deadline = deadline.astimezone(timezone.utc).replace(tzinfo=None)
+        return deadline
+    raise ValueError("deadline must be unix seconds or an ISO 8601 timestamp")
+
+def _job_deadline(options: Dict[str, Any], now: datetime) -> Optional[datetime]:
+    """The earlier of the `deadline` and `ttl` options, if either is given."""
+    deadlines = []
+    try:
+        if options.get("deadline") is not None:
+            deadlines.append(_parse_deadline(options["deadline"]))
+        if options.get("ttl") is not None:
+            ttl = options["ttl"]
+            if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0:
+                raise ValueError("ttl must be a positive number of seconds")
+            deadlines.append(now + timedelta(seconds=ttl))
+    except (ValueError, OverflowError, OSError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return min(deadlines) if deadlines else None
+
+def _job_model(request: Dict[str, Any]) -> Optional[str]:
+    model = request.get("model")
+    return model if isinstance(model, str) else None
+
+async def verify_admin(identity: Dict[str, Any] = Depends(verify_token)) -> Dict[str, Any]:
+    if identity["role"] != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return identity
+
+def _job_row(request: Dict[str, Any], identity: Dict[str, Any], kind: JobKind):
+    """A new job's jobs-table values, in JOB_INSERT column order."""
+    if kind == JobKind.EMBEDDING and not request.get("input"):
+        raise HTTPException(status_code=422, detail="input is required")
+
+    request, options = _split_job_options(request)
+    hedge = bool(options.get("hedge", identity.get("hedge", False)))
+    batch_id = options.get("batch_id")
+    if batch_id is not None and not isinstance(batch_id, str):
+        raise HTTPException(status_code=422, detail="batch_id must be a string")
+    callback_url = options.get("callback_url")
+    if callback_url is not None and not (isinstance(callback_url, str) and callback_url.startswith(("http://", "https://"))):
+        raise HTTPException(status_code=422, detail="callback_url must be an http(s) URL")
+    if callback_url is not None and not host_allowed(callback_url, settings.callbacks.allowed_hosts):
+        raise HTTPException(status_code=422, detail="callback_url host is not in the server's callbacks.allowed_hosts")
 
-@app.post("/v1/chat/completions", status_code=202)
-async def submit_inference(request: Dict[str, Any], identity: Dict[str, Any] = Depends(verify_token)):
     # Create Job
     job = Job(request_payload=request)
+    deadline = _job_deadline(options, job.created_at)
+
+    if kind == JobKind.EMBEDDING:
+        est_tokens, prefix_fp = estimate_embedding_tokens(request), None
+    else:
+        est_tokens, prefix_fp = estimate_request_tokens(request), prefix_fingerprint(request)
+
+    return (job.id, job.status.value, job.created_at, job.updated_at, json.dumps(job.request_payload),
+            est_tokens, prefix_fp, _job_model(request), int(hedge), batch_id, deadline, kind.value, identity["key_hash"], callback_url)
+
+JOB_INSERT = "INSERT INTO jobs (id, status, created_at, updated_at, request_payload, est_tokens, prefix_fp, model, hedge, batch_id, deadline, kind, owner, callback_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+def _submit_jobs(requests: List[Dict[str, Any]], identity: Dict[str, Any], kind: JobKind) -> List[Dict[str, Any]]:
+    # Every request is validated before any is stored, so a bulk submission is all or nothing
+    rows = [_job_row(request, identity, kind) for request in requests]
 
     conn = get_db_connection()
     cursor = conn.cursor()
-
-    cursor.execute(
-        "INSERT INTO jobs (id, status, created_at, updated_at, request_payload) VALUES (?, ?, ?, ?, ?)",
-        (job.id, job.status.value, job.created_at, job.updated_at, json.dumps(job.request_payload))
-    )
+    cursor.executemany(JOB_INSERT, rows)
     conn.commit()
     conn.close()
 
-    return {"id": job.id, "status": job.status}
+    return [{"id": row[0], "status": row[1]} for row in rows]
+
+@app.post("/v1/chat/completions", status_code=202)
+async def submit_inference(request: Dict[str, Any], identity: Dict[str, Any] = Depends(verify_token)):
+    return _submit_jobs([request], identity, JobKind.CHAT)[0]
+
+@app.post("/v1/embeddings", status_code=202)
+async def submit_embeddings(request: Dict[str, Any], identity: Dict[str, Any] = Depends(verify_token)):
+    return _submit_jobs([request], identity, JobKind.EMBEDDING)[0]
+
+# Most jobs one bulk submission may carry.
+MAX_BULK_JOBS = 1000
+
+class BulkSubmitRequest(BaseModel):
+    requests: List[Dict[str, Any]]
+    # Default callback_url for requests that don't set their own
+    callback_url: Optional[str] = None
+
+def _submit_bulk(body: BulkSubmitRequest, identity: Dict[str, Any], kind: JobKind):
+    if not body.requests:
+        raise HTTPException(status_code=422, detail="requests must not be empty")
+    if len(body.requests) > MAX_BULK_JOBS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_JOBS} jobs per bulk submission")
+    requests = body.requests
+    if body.callback_url is not None:
+        requests = [{"callback_url": body.callback_url, **request} for request in requests]
+    return {"jobs": _submit_jobs(requests, identity, kind)}
+
+@app.post("/v1/chat/completions/bulk", status_code=202)
+async def submit_inference_bulk(body: BulkSubmitRequest, identity: Dict[str, Any] = Depends(verify_token)):
+    return _submit_bulk(body, identity, JobKind.CHAT)
+
+@app.post("/v1/embeddings/bulk", status_code=202)
+async def submit_embeddings_bulk(body: BulkSubmitRequest, identity: Dict[str, Any] = Depends(verify_token)):
+    return _submit_bulk(body, identity, JobKind.EMBEDDING)
+
+def _embedding_result(row, result_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Put the stored vectors back into an embeddings response, as floats or base64 as the request asked."""
+    data = result_payload.get("data") or []
+    encoding = json.loads(row["request_payload"]).get("encoding_format")
+    if encoding == "base64":
+        vectors = [base64.b64encode(chunk).decode("ascii") for chunk in split_packed(row["result_vectors"], len(data))]
+    else:
+        vectors = unpack_vectors(row["result_vectors"], len(data))
+    for item, vector in zip(data, vectors):
+        item["embedding"] = vector
+    return result_payload
 
 class PollRequest(BaseModel):
     ids: Optional[List[str]] = None
+    # Only return these parts of completed results, e.g. ["choices.0.message.content", "usage"]
+    fields: Optional[List[str]] = None
+
+def _field_paths(fields: Optional[List[str]]):
+    if fields is None:
+        return None
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def _poll_columns(paths) -> tuple:
+    """Columns for a poll query, and their parameters (the JSON paths)."""
+    if paths is None:
+        return "*", []
+    # Completed chat results are projected by SQLite so the full payload is never
+    # loaded; embedding results (vectors stored apart) and failures are read whole
+    projected = ", ".join("json_extract(result_payload, ?)" for _ in paths)
+    columns = (
+        "id, status, deadline, seq, result_vectors, "
+        f"CASE WHEN status = '{JobStatus.COMPLETED.value}' AND result_vectors IS NULL AND result_payload IS NOT NULL "
+        f"THEN json_array({projected}) END AS projected, "
+        f"CASE WHEN status != '{JobStatus.COMPLETED.value}' OR result_vectors IS NOT NULL THEN result_payload END AS result_payload, "
+        "CASE WHEN result_vectors IS NOT NULL THEN request_payload END AS request_payload"
+    )
+    return columns, [json_path(path) for path in paths]
 
 @app.post("/v1/results/poll")
 async def poll_results(body: PollRequest, identity: Dict[str, Any] = Depends(verify_token)):
+    paths = _field_paths(body.fields)
+    columns, params = _poll_columns(paths)
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    jobs = []
-
     if body.ids:
         placeholders = ','.join('?' * len(body.ids))
-        cursor.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders})", body.ids)
+        cursor.execute(f"SELECT {columns} FROM jobs WHERE id IN ({placeholders})", params + body.ids)
     else:
         # Return all completed user jobs (limit 100 for safety)
-        cursor.execute("SELECT * FROM jobs WHERE status = ? LIMIT 100", (JobStatus.COMPLETED.value,))
+        cursor.execute(f"SELECT {columns} FROM jobs WHERE status = ? LIMIT 100", params + [JobStatus.COMPLETED.value])
 
     rows = cursor.fetchall()
-
-    for row in rows:
-        result_payload = None
-        if row["result_payload"]:
-            result_payload = json.loads(row["result_payload"])
-
-        jobs.append({
-            "id": row["id"],
-            "status": row["status"],
-            "result": result_payload
-        })
+    now = datetime.utcnow()
+    jobs = [_polled_job(row, paths, now) for row in rows]
 
     conn.close()
     return {"jobs": jobs}
 
+def _polled_job(row, paths, now: datetime) -> Dict[str, Any]:
+    """A poll/change-feed entry for a row selected with _poll_columns."""
+    result_payload = None
+    if paths is not None and row["projected"] is not None:
+        result_payload = nest(paths, json.loads(row["projected"]))
+    elif row["result_payload"]:
+        result_payload = json.loads(row["result_payload"])
+
+    if row["result_vectors"] is not None and result_payload is not None:
+        result_payload = _embedding_result(row, result_payload)
+        if paths is not None and row["status"] == JobStatus.COMPLETED.value:
+            result_payload = project(result_payload, paths)
+
+    status = row["status"]
+    if status == JobStatus.QUEUED.value and row["deadline"] is not None and _parse_time(row["deadline"]) <= now:
+        # Past its deadline; marked EXPIRED by the next fetch
+        status = JobStatus.EXPIRED.value
+        result_payload = EXPIRED_RESULT
+
+    return {
+        "id": row["id"],
+        "status": status,
+        "result": result_payload
+    }
+
+# Most jobs one change-feed page may hold.
+MAX_CHANGES_PAGE = 5000
+
+@app.get("/v1/jobs/changes")
+async def job_changes(
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_CHANGES_PAGE),
+    fields: Optional[List[str]] = Query(None),
+    identity: Dict[str, Any] = Depends(verify_token)
+):
+    """
+    The caller's jobs whose status changed after `cursor`, in change order, each
+    with its current status and result. Pass the returned cursor to the next call.
+    """
+    paths = _field_paths(fields)
+    columns, params = _poll_columns(paths)
+
+    conn = get_db_connection()
+    rows = conn.execute(
+        f"SELECT {columns} FROM jobs WHERE owner = ? AND seq > ? ORDER BY seq LIMIT ?",
+        params + [identity["key_hash"], cursor, limit + 1]
+    ).fetchall()
+    conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    now = datetime.utcnow()
+    jobs = []
+    for row in rows:
+        job = _polled_job(row, paths, now)
+        job["seq"] = row["seq"]
+        jobs.append(job)
+
+    return {"jobs": jobs, "cursor": rows[-1]["seq"] if rows else cursor, "has_more": has_more}
+
+class CancelRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    batch_id: Optional[str] = None
+
+def _notify_cancel(cursor, node_id: Optional[str], job_id: str, now: datetime):
+    if node_id is not None:
+        cursor.execute(
+            "INSERT OR IGNORE INTO cancellations (node, job_id, created_at) VALUES (?, ?, ?)",
+            (node_id, job_id, now)
+        )
+
+def _cancel_jobs(condition: str, params) -> int:
+    """Cancel the unfinished jobs matching `condition`; nodes running them are told to stop."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        now = datetime.utcnow()
+
+        # Running jobs need their nodes notified; queued ones just leave the claimable set
+        cursor.execute(
+            f"SELECT id, locked_by, hedge_node FROM jobs WHERE {condition} AND status = ?",
+            (*params, JobStatus.PROCESSING.value)
+        )
+        for row in cursor.fetchall():
+            _notify_cancel(cursor, row["locked_by"], row["id"], now)
+            _notify_cancel(cursor, row["hedge_node"], row["id"], now)
+
+        cursor.execute(
+            f"UPDATE jobs SET status = ?, locked_by = NULL, updated_at = ? WHERE {condition} AND status IN (?, ?)",
+            (JobStatus.CANCELLED.value, now, *params, JobStatus.QUEUED.value, JobStatus.PROCESSING.value)
+        )
+        cancelled = cursor.rowcount
+        conn.commit()
+        return cancelled
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+def _owned(condition: str, params, identity: Dict[str, Any]):
+    """Restrict `condition` to the caller's own jobs; admins may act on any job."""
+    if identity["role"] == "ADMIN":
+        return condition, tuple(params)
+    return f"{condition} AND owner = ?", (*params, identity["key_hash"])
+
+@app.post("/v1/jobs/cancel")
+async def cancel_jobs(body: CancelRequest, identity: Dict[str, Any] = Depends(verify_token)):
+    if not body.ids and body.batch_id is None:
+        raise HTTPException(status_code=422, detail="Give ids or batch_id")
+    cancelled = 0
+    if body.ids:
+        placeholders = ','.join('?' * len(body.ids))
+        cancelled += _cancel_jobs(*_owned(f"id IN ({placeholders})", body.ids, identity))
+    if body.batch_id is not None:
+        # Batch names are chosen by clients, so two users' "batch-1" are different batches
+        cancelled += _cancel_jobs(*_owned("batch_id = ?", (body.batch_id,), identity))
+    return {"status": "ok", "cancelled": cancelled}
+
+@app.post("/v1/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, identity: Dict[str, Any] = Depends(verify_token)):
+    condition, params = _owned("id = ?", (job_id,), identity)
+    cancelled = _cancel_jobs(condition, params)
+    if not cancelled:
+        # Other users' jobs are reported as not found
+        conn = get_db_connection()
+        row = conn.execute(f"SELECT status FROM jobs WHERE {condition}", params).fetchone()
+        conn.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return {"id": job_id, "status": row["status"], "cancelled": False}
+    return {"id": job_id, "status": JobStatus.CANCELLED.value, "cancelled": True}
+
 class FetchRequest(BaseModel):
     limit: int = 10
+    # Token budget: claim oldest jobs until their estimated sizes would exceed it
+    # (at least one job is always returned so oversized jobs are not starved).
+    max_tokens: Optional[int] = None
+    # Cluster the claim around the oldest job's prompt prefix so the node's
+    # prefix cache is reused (bounded by the queue.prefix_max_age setting).
+    group_by_prefix: bool = False
+    # Models the node currently has loaded. Their jobs are claimed first (bounded
+    # by queue.model_max_age); the last reported list is remembered per node.
+    warm_models: Optional[List[str]] = None
+
+def _select_queued(cursor, limit: int, condition: str = "", params: tuple = (), order: str = "created_at ASC"):
+    # Jobs backing off before a retry are not claimable until available_at
+    cursor.execute(
+        f"SELECT * FROM jobs WHERE status = ? AND (available_at IS NULL OR available_at <= ?){condition} "
+        f"ORDER BY {order} LIMIT ?",
+        (JobStatus.QUEUED.value, datetime.utcnow(), *params, limit)
+    )
+    return cursor.fetchall()
+
+def _expire_jobs(cursor, now: datetime) -> int:
+    """Mark queued jobs past their deadline EXPIRED, so they never reach a node."""
+    cursor.execute(
+        "UPDATE jobs SET status = ?, result_payload = ?, updated_at = ? WHERE status = ? AND deadline <= ?",
+        (JobStatus.EXPIRED.value, json.dumps(EXPIRED_RESULT), now, JobStatus.QUEUED.value, now)
+    )
+    return cursor.rowcount
+
+def _merge_rows(rows, more, limit: int):
+    seen = {row["id"] for row in rows}
+    for row in more:
+        if len(rows) >= limit:
+            break
+        if row["id"] not in seen:
+            rows.append(row)
+            seen.add(row["id"])
+    return rows
+
+def _warm_models(cursor, node_id: str, body: FetchRequest, now: datetime) -> List[str]:
+    """Record the node's reported warm models, or fall back to the last report."""
+    if body.warm_models is not None:
+        cursor.execute(
+            "INSERT INTO nodes (name, warm_models, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET warm_models = excluded.warm_models, last_seen = excluded.last_seen",
+            (node_id, json.dumps(body.warm_models), now)
+        )
+        return body.warm_models
+    cursor.execute("SELECT warm_models FROM nodes WHERE name = ?", (node_id,))
+    row = cursor.fetchone()
+    return json.loads(row["warm_models"]) if row and row["warm_models"] else []
+
+# Longest-running hedgeable jobs inspected per fetch.
+HEDGE_SCAN_LIMIT = 100
+
+def _parse_time(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+def _hedge_threshold(cursor, model: Optional[str]) -> Optional[float]:
+    """The configured percentile of recent run times (seconds) for `model`, if enough jobs have completed."""
+    cursor.execute(
+        "SELECT locked_at, updated_at FROM jobs WHERE model IS ? AND status = ? AND locked_at IS NOT NULL "
+        "ORDER BY created_at DESC LIMIT ?",
+        (model, JobStatus.COMPLETED.value, settings.queue.hedge_sample_size)
+    )
+    durations = sorted(
+        (_parse_time(row["updated_at"]) - _parse_time(row["locked_at"])).total_seconds()
+        for row in cursor.fetchall()
+    )
+    if len(durations) < settings.queue.hedge_min_samples:
+        return None
+    return durations[max(0, math.ceil(settings.queue.hedge_percentile * len(durations)) - 1)]
+
+def _hedge_candidates(cursor, node_id: str, room: int, now: datetime):
+    """Hedgeable jobs running elsewhere for longer than usual for their model, not yet hedged."""
+    if room <= 0:
+        return []
+    # Only the partial index idx_jobs_hedge is read; without stats the planner would
+    # otherwise scan every PROCESSING row and sort them
+    cursor.execute(
+        f"SELECT * FROM jobs INDEXED BY idx_jobs_hedge WHERE status = '{JobStatus.PROCESSING.value}' AND hedge = 1 AND hedge_node IS NULL AND locked_by != ? "
+        "ORDER BY locked_at ASC LIMIT ?",
+        (node_id, HEDGE_SCAN_LIMIT)
+    )
+    thresholds = {}
+    hedges = []
+    for row in cursor.fetchall():
+        if row["model"] not in thresholds:
+            thresholds[row["model"]] = _hedge_threshold(cursor, row["model"])
+        threshold = thresholds[row["model"]]
+        if threshold is not None and (now - _parse_time(row["locked_at"])).total_seconds() > threshold:
+            hedges.append(row)
+            if len(hedges) >= room:
+                break
+    return hedges
+
+def _take_cancellations(cursor, node_id: str) -> List[str]:
+    cursor.execute("SELECT job_id FROM cancellations WHERE node = ?", (node_id,))
+    ids = [row["job_id"] for row in cursor.fetchall()]
+    if ids:
+        cursor.execute("DELETE FROM cancellations WHERE node = ?", (node_id,))
+    return ids
+
+def _claim_limit(cursor, node_id: str, limit: int) -> int:
+    """Cap a claim at the jobs the node can start within queue.claim_horizon, going by its heartbeat."""
+    cursor.execute("SELECT concurrency, job_seconds FROM nodes WHERE name = ?", (node_id,))
+    row = cursor.fetchone()
+    if row is None or not row["concurrency"] or not row["job_seconds"]:
+        return limit
+    cap = math.ceil(row["concurrency"] * settings.queue.claim_horizon / row["job_seconds"])
+    cursor.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND locked_by = ?", (JobStatus.PROCESSING.value, node_id))
+    held = cursor.fetchone()[0]
+    # Always hand out at least one job so stale claims can't starve a node
+    return min(limit, max(1, cap - held))
+
+def _claim_candidates(cursor, body: FetchRequest, warm_models: List[str], limit: int):
+    """Queued jobs to claim, in claim order."""
+    rows = []
+    if settings.queue.order == "deadline":
+        # Earliest deadline first, ahead of grouping and affinity
+        rows = list(_select_queued(cursor, limit, " AND deadline IS NOT NULL", order="deadline ASC, created_at ASC"))
+    if not body.group_by_prefix and not warm_models:
+        return _merge_rows(rows, _select_queued(cursor, limit), limit)
+
+    # Jobs past the age bound are never held back by grouping or affinity
+    max_age = min(
+        settings.queue.prefix_max_age if body.group_by_prefix else float("inf"),
+        settings.queue.model_max_age if warm_models else float("inf")
+    )
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    rows = _merge_rows(rows, _select_queued(cursor, limit, " AND created_at <= ?", (cutoff,)), limit)
+    if len(rows) < limit and warm_models:
+        placeholders = ','.join('?' * len(warm_models))
+        warm = _select_queued(cursor, limit, f" AND model IN ({placeholders})", tuple(warm_models))
+        rows = _merge_rows(rows, warm, limit)
+    if len(rows) < limit and body.group_by_prefix:
+        head = rows[0] if rows else next(iter(_select_queued(cursor, 1)), None)
+        if head is not None and head["prefix_fp"] is not None:
+            group = _select_queued(cursor, limit, " AND prefix_fp = ?", (head["prefix_fp"],))
+            rows = _merge_rows(rows, group, limit)
+    return _merge_rows(rows, _select_queued(cursor, limit), limit)
+
+def _job_tokens(row) -> int:
+    if row["est_tokens"] is not None:
+        return row["est_tokens"]
+    return estimate_request_tokens(json.loads(row["request_payload"]))
+
+def _pack_by_tokens(rows, max_tokens: int):
+    packed = []
+    total = 0
+    for row in rows:
+        cost = _job_tokens(row)
+        if packed and total + cost > max_tokens:
+            break
+        packed.append(row)
+        total += cost
+    return packed
 
 @app.post("/internal/queue/fetch")
-async def fetch_jobs(body: FetchRequest, identity: Dict[str, Any] = Depends(verify_token)):
+async def fetch_jobs(body: FetchRequest, response: Response, identity: Dict[str, Any] = Depends(verify_token)):
     # Identify node from identity
     node_id = identity["name"]
 
@@ -108,21 +573,42 @@ async def fetch_jobs(body: FetchRequest, identity: Dict[str, Any] = Depends(veri
     try:
         cursor.execute("BEGIN IMMEDIATE")
 
-        cursor.execute(
-            f"SELECT * FROM jobs WHERE status = ? ORDER BY created_at ASC LIMIT ?",
-            (JobStatus.QUEUED.value, body.limit)
-        )
-        rows = cursor.fetchall()
-
-        job_ids = [row["id"] for row in rows]
+        now = datetime.utcnow()
+        expired = _expire_jobs(cursor, now)
+        warm_models = _warm_models(cursor, node_id, body, now)
+        limit = _claim_limit(cursor, node_id, body.limit)
+        rows = list(_claim_candidates(cursor, body, warm_models, limit))
+        # Spare room goes to duplicates of straggling hedged jobs
+        rows += _hedge_candidates(cursor, node_id, limit - len(rows), now)
+        if body.max_tokens is not None:
+            rows = _pack_by_tokens(rows, body.max_tokens)
+
+        job_ids = [row["id"] for row in rows if row["status"] == JobStatus.QUEUED.value]
+        hedge_ids = [row["id"] for row in rows if row["status"] == JobStatus.PROCESSING.value]
 
         if job_ids:
-            now = datetime.utcnow()
             placeholders = ','.join('?' * len(job_ids))
             cursor.execute(
                 f"UPDATE jobs SET status = ?, locked_by = ?, locked_at = ?, updated_at = ? WHERE id IN ({placeholders})",
                 (JobStatus.PROCESSING.value, node_id, now, now, *job_ids)
             )
+        if hedge_ids:
+            placeholders = ','.join('?' * len(hedge_ids))
+            cursor.execute(f"UPDATE jobs SET hedge_node = ? WHERE id IN ({placeholders})", (node_id, *hedge_ids))
+
+        # Remaining queued work, so nodes can size their next fetch
+        cursor.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM jobs WHERE status = ? LIMIT ?)",
+            (JobStatus.QUEUED.value, QUEUE_DEPTH_CAP)
+        )
+        response.headers["X-Queue-Depth"] = str(cursor.fetchone()[0])
+
+        # Jobs this node is running that were cancelled since its last call
+        cancel = _take_cancellations(cursor, node_id)
+        if cancel:
+            response.headers["X-Cancel-Jobs"] = ",".join(cancel)
+
+        if job_ids or hedge_ids or cancel or expired or body.warm_models is not None:
             conn.commit()
 
         jobs = []
@@ -130,6 +616,12 @@ async def fetch_jobs(body: FetchRequest, identity: Dict[str, Any] = Depends(veri
             jobs.append({
                 "id": row["id"],
                 "request_payload": json.loads(row["request_payload"]),
+                "est_tokens": _job_tokens(row),
+                "prefix_fp": row["prefix_fp"],
+                "attempts": row["attempts"],
+                "hedge": row["status"] == JobStatus.PROCESSING.value,
+                "deadline": row["deadline"],
+                "kind": row["kind"],
                 # "status": JobStatus.PROCESSING, # We return what we found, but client knows it's processing
                 "created_at": row["created_at"]
             })
@@ -142,6 +634,123 @@ async def fetch_jobs(body: FetchRequest, identity: Dict[str, Any] = Depends(veri
     finally:
         conn.close()
 
+class ReleaseRequest(BaseModel):
+    ids: List[str]
+
+@app.post("/internal/queue/release")
+async def release_jobs(body: ReleaseRequest, identity: Dict[str, Any] = Depends(verify_token)):
+    """Return jobs the caller claimed but could not run (e.g. rate limited) to the queue, keeping their place."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        now = datetime.utcnow()
+        released = []
+        for job_id in body.ids:
+            cursor.execute(
+                "UPDATE jobs SET status = ?, locked_by = NULL, locked_at = NULL, updated_at = ? WHERE id = ? AND status = ? AND locked_by = ?",
+                (JobStatus.QUEUED.value, now, job_id, JobStatus.PROCESSING.value, identity["name"])
+            )
+            if cursor.rowcount:
+                released.append(job_id)
+        conn.commit()
+        return {"status": "ok", "released": released}
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+class NodeReport(BaseModel):
+    # Jobs the node runs at once, and the models it can serve (empty means any)
+    concurrency: int = 1
+    models: List[str] = []
+    warm_models: Optional[List[str]] = None
+    # Observed seconds per job and completed jobs per second, once known
+    job_seconds: Optional[float] = None
+    throughput: Optional[float] = None
+    in_flight: int = 0
+
+def _record_node(node_id: str, body: NodeReport, registering: bool):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        now = datetime.utcnow()
+        cursor.execute(
+            "INSERT INTO nodes (name, concurrency, models, warm_models, job_seconds, throughput, in_flight, last_seen, registered_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET concurrency = excluded.concurrency, models = excluded.models, "
+            "warm_models = COALESCE(excluded.warm_models, nodes.warm_models), "
+            "job_seconds = COALESCE(excluded.job_seconds, nodes.job_seconds), "
+            "throughput = COALESCE(excluded.throughput, nodes.throughput), in_flight = excluded.in_flight, "
+            "last_seen = excluded.last_seen, "
+            f"registered_at = {'excluded.registered_at' if registering else 'COALESCE(nodes.registered_at, excluded.registered_at)'}",
+            (
+                node_id, body.concurrency, json.dumps(body.models),
+                json.dumps(body.warm_models) if body.warm_models is not None else None,
+                body.job_seconds, body.throughput, body.in_flight, now, now
+            )
+        )
+        cancel = _take_cancellations(cursor, node_id)
+        conn.commit()
+        return {"status": "ok", "name": node_id, "cancel": cancel}
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@app.post("/internal/nodes/register")
+async def register_node(body: NodeReport, identity: Dict[str, Any] = Depends(verify_token)):
+    return _record_node(identity["name"], body, registering=True)
+
+@app.post("/internal/nodes/heartbeat")
+async def node_heartbeat(body: NodeReport, identity: Dict[str, Any] = Depends(verify_token)):
+    return _record_node(identity["name"], body, registering=False)
+
+@app.get("/admin/nodes")
+async def list_nodes(identity: Dict[str, Any] = Depends(verify_admin)):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.queue.node_timeout)
+    cursor.execute(
+        "SELECT *, (SELECT COUNT(*) FROM jobs WHERE status = ? AND locked_by = nodes.name) AS claimed "
+        "FROM nodes WHERE last_seen >= ? ORDER BY name",
+        (JobStatus.PROCESSING.value, cutoff)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+
+    nodes = []
+    for row in rows:
+        nodes.append({
+            "name": row["name"],
+            "concurrency": row["concurrency"],
+            "models": json.loads(row["models"]) if row["models"] else [],
+            "warm_models": json.loads(row["warm_models"]) if row["warm_models"] else [],
+            "job_seconds": row["job_seconds"],
+            "throughput": row["throughput"],
+            "in_flight": row["in_flight"],
+            "claimed": row["claimed"],
+            "utilization": row["in_flight"] / row["concurrency"] if row["concurrency"] else None,
+            "last_seen": row["last_seen"],
+            "registered_at": row["registered_at"],
+        })
+    return {"nodes": nodes}
+
+def _retry_delay(attempts: int) -> float:
+    return min(settings.queue.retry_backoff_max, settings.queue.retry_backoff * 2 ** (attempts - 1))
+
+def _requeue_for_retry(cursor, job_id: str, attempts: int, now: datetime, hedge_node: Optional[str] = None):
+    # The duplicate run is dropped along with the failed attempt, so its node must stop too
+    _notify_cancel(cursor, hedge_node, job_id, now)
+    cursor.execute(
+        "UPDATE jobs SET status = ?, attempts = ?, available_at = ?, locked_by = NULL, locked_at = NULL, hedge_node = NULL, updated_at = ? WHERE id = ?",
+        (JobStatus.QUEUED.value, attempts, now + timedelta(seconds=_retry_delay(attempts)), now, job_id)
+    )
+
 @app.post("/internal/queue/submit")
 async def submit_results(body: List[Dict[str, Any]], identity: Dict[str, Any] = Depends(verify_token)):
     conn = get_db_connection()
@@ -150,11 +759,40 @@ async def submit_results(body: List[Dict[str, Any]], identity: Dict[str, Any] =
     try:
         cursor.execute("BEGIN IMMEDIATE")
         now = datetime.utcnow()
+        ignored = []
+        retried = []
+
+        node_id = identity["name"]
 
         for item in body:
             job_id = item["id"]
             status = item["status"]
 
+            cursor.execute("SELECT status, locked_by, hedge_node, attempts FROM jobs WHERE id = ?", (job_id,))
+            job = cursor.fetchone()
+            # Only the first result for a job is applied, so nodes can safely
+            # replay results whose acknowledgement they never received.
+            if job is None or job["status"] in FINISHED_STATUSES:
+                ignored.append(job_id)
+                continue
+            running = job["status"] == JobStatus.PROCESSING.value
+
+            if status == JobStatus.FAILED.value:
+                if running and job["hedge_node"] == node_id:
+                    # A failed hedge doesn't end the job; the original attempt may still succeed
+                    ignored.append(job_id)
+                    continue
+                if item.get("retryable"):
+                    if not running or job["locked_by"] != node_id:
+                        # Replayed after the job was already requeued (or taken over)
+                        ignored.append(job_id)
+                        continue
+                    if job["attempts"] + 1 < settings.queue.max_attempts:
+                        _requeue_for_retry(cursor, job_id, job["attempts"] + 1, now, job["hedge_node"])
+                        retried.append(job_id)
+                        continue
+                    # Out of attempts: record the failure as final
+
             result_payload = None
             if "result" in item:
                 result_payload = json.dumps(item["result"])
@@ -162,16 +800,147 @@ async def submit_results(body: List[Dict[str, Any]], identity: Dict[str, Any] =
                 # If error, we might store it in result_payload as well or a separate field.
                 # SPEC says "The result from the LLM (or error message)".
                 result_payload = json.dumps({"error": item["error"]})
+            # Embedding vectors arrive base64-packed next to the rest of the response
+            vectors = decode_vectors(item["vectors"]) if item.get("vectors") else None
 
             cursor.execute(
-                "UPDATE jobs SET status = ?, result_payload = ?, updated_at = ?, locked_by = NULL WHERE id = ?",
-                (status, result_payload, now, job_id)
+                "UPDATE jobs SET status = ?, result_payload = ?, result_vectors = ?, updated_at = ?, locked_by = NULL WHERE id = ?",
+                (status, result_payload, vectors, now, job_id)
             )
 
+            # First result wins: the other attempt of a hedged job is told to stop
+            if running and job["hedge_node"] is not None:
+                loser = job["locked_by"] if node_id == job["hedge_node"] else job["hedge_node"]
+                if loser != node_id:
+                    _notify_cancel(cursor, loser, job_id, now)
+
+        cancel = _take_cancellations(cursor, node_id)
         conn.commit()
-        return {"status": "ok"}
+        return {"status": "ok", "ignored": ignored, "retried": retried, "cancel": cancel}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         conn.close()
+
+# Outbox entries claimed per delivery pass, and how long a claim is held before
+# another server process may deliver the entry again.
+CALLBACK_CLAIM_LIMIT = 1000
+CALLBACK_LEASE_SECONDS = 300
+# Callback URLs delivered to at once in a pass, so one slow receiver doesn't hold up the rest.
+CALLBACK_DELIVERY_WORKERS = 8
+
+def _claim_callbacks(now: datetime) -> List[sqlite3.Row]:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT id, url, job_id, attempts FROM callbacks WHERE dead = 0 AND available_at <= ? ORDER BY id LIMIT ?",
+            (now, CALLBACK_CLAIM_LIMIT)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            placeholders = ','.join('?' * len(rows))
+            cursor.execute(
+                f"UPDATE callbacks SET available_at = ? WHERE id IN ({placeholders})",
+                [now + timedelta(seconds=CALLBACK_LEASE_SECONDS)] + [row["id"] for row in rows]
+            )
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _callback_jobs(job_ids: List[str], now: datetime) -> List[Dict[str, Any]]:
+    conn = get_db_connection()
+    placeholders = ','.join('?' * len(job_ids))
+    rows = {row["id"]: row for row in conn.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders})", job_ids)}
+    conn.close()
+
+    jobs = []
+    for job_id in job_ids:
+        if job_id in rows:
+            job = _polled_job(rows[job_id], None, now)
+            job["batch_id"] = rows[job_id]["batch_id"]
+            jobs.append(job)
+    return jobs
+
+def _finish_callbacks(entries: List[sqlite3.Row], error: Optional[str], config: CallbackConfig, now: datetime, dead: bool = False):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if error is None:
+        cursor.executemany("DELETE FROM callbacks WHERE id = ?", [(entry["id"],) for entry in entries])
+    else:
+        for entry in entries:
+            attempts = entry["attempts"] + 1
+            delay = min(config.retry_backoff_max, config.retry_backoff * 2 ** (attempts - 1))
+            cursor.execute(
+                "UPDATE callbacks SET attempts = ?, available_at = ?, last_error = ?, dead = ? WHERE id = ?",
+                (attempts, now + timedelta(seconds=delay), error, int(dead or attempts >= config.max_attempts), entry["id"])
+            )
+    conn.commit()
+    conn.close()
+
+def _deliver_to(http_client: httpx.Client, url: str, entries: List[sqlite3.Row], config: CallbackConfig, now: datetime) -> int:
+    """
+    POST one URL's due entries in batches. After a failed batch the URL's remaining
+    entries back off with it, so an unreachable receiver costs at most one timeout per pass.
+    """
+    if not host_allowed(url, config.allowed_hosts):
+        # Submitted before the host was taken off callbacks.allowed_hosts
+        _finish_callbacks(entries, "Host not allowed", config, now, dead=True)
+        return 0
+
+    delivered = 0
+    for start in range(0, len(entries), config.batch_size):
+        batch = entries[start:start + config.batch_size]
+        body = json.dumps({"jobs": _callback_jobs([entry["job_id"] for entry in batch], now)}).encode()
+        headers = {"Content-Type": "application/json"}
+        if config.secret:
+            timestamp = str(int(time.time()))
+            headers[TIMESTAMP_HEADER] = timestamp
+            headers[SIGNATURE_HEADER] = sign(config.secret, timestamp, body)
+
+        try:
+            resp = http_client.post(url, content=body, headers=headers, timeout=config.timeout)
+            error = None if resp.is_success else f"HTTP {resp.status_code}"
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+
+        if error is not None:
+            _finish_callbacks(entries[start:], error, config, datetime.utcnow())
+            break
+        _finish_callbacks(batch, None, config, datetime.utcnow())
+        delivered += len(batch)
+    return delivered
+
+def deliver_callbacks(http_client: httpx.Client, config: Optional[CallbackConfig] = None) -> int:
+    """
+    One delivery pass over the callback outbox: due entries are grouped by URL and
+    POSTed as {"jobs": [...]} in batches of config.batch_size, up to
+    CALLBACK_DELIVERY_WORKERS URLs at a time. A 2xx response removes the batch from
+    the outbox; anything else schedules a retry. Returns jobs delivered.
+    """
+    config = config or settings.callbacks
+    now = datetime.utcnow()
+
+    by_url: Dict[str, List[sqlite3.Row]] = {}
+    for entry in _claim_callbacks(now):
+        by_url.setdefault(entry["url"], []).append(entry)
+    if not by_url:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=min(CALLBACK_DELIVERY_WORKERS, len(by_url))) as pool:
+        return sum(pool.map(lambda item: _deliver_to(http_client, item[0], item[1], config, now), by_url.items()))
+
+async def _callback_worker():
+    with httpx.Client() as http_client:
+        while True:
+            try:
+                await asyncio.to_thread(deliver_callbacks, http_client)
+            except Exception as e:
+                logger.warning(f"Callback delivery pass failed: {e}")
+            await asyncio.sleep(settings.callbacks.interval)
@@ -0,0 +1,89 @@
+import pytest
+from benchmarks.storage import run_suite, compare, populate, app, OPERATIONS, OWNERS
+from typer.testing import CliRunner
+import json
+import os
+import sqlite3
+import tempfile
+
+runner = CliRunner()
+
+def test_populate_status_mix():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "bench.db")
+        ids = populate(db_path, 500, "drained")
+
+        assert len(ids) == 500
+        conn = sqlite3.connect(db_path)
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        owners = dict(conn.execute("SELECT owner, COUNT(*) FROM jobs GROUP BY owner").fetchall())
+        unsequenced = conn.execute("SELECT COUNT(*) FROM jobs WHERE seq IS NULL").fetchone()[0]
+        conn.close()
+
+        assert sum(counts.values()) == 500
+        assert counts["COMPLETED"] > counts["QUEUED"]
+        # Spread over several API keys, each with its own change stream
+        assert sorted(owners) == OWNERS and sum(owners.values()) == 500
+        assert unsequenced == 0
+
+def test_run_suite_reports_every_operation():
+    data = run_suite(rows=[200], mixes=["backlog"], batch=5, repeat=3)
+
+    ops = [r["op"] for r in data["results"]]
+    assert ops == OPERATIONS
+    for result in data["results"]:
+        assert result["rows"] == 200
+        assert result["median_ms"] > 0
+        assert result["p95_ms"] >= result["min_ms"]
+
+    claim = next(r for r in data["results"] if r["op"] == "claim")
+    assert any("jobs" in plan for plan in claim["plans"])
+    # The change feed is read through the (owner, seq) index
+    poll_owner = next(r for r in data["results"] if r["op"] == "poll_owner")
+    assert any("idx_jobs_owner_seq" in plan for plan in poll_owner["plans"])
+
+def test_compare_flags_regressions_and_plan_changes():
+    baseline = {"results": [
+        {"rows": 10, "mix": "backlog", "op": "claim", "batch": 5, "median_ms": 1.0, "plans": ["SCAN jobs"]},
+        {"rows": 10, "mix": "backlog", "op": "insert", "batch": 5, "median_ms": 1.0, "plans": []},
+    ]}
+    current = {"results": [
+        {"rows": 10, "mix": "backlog", "op": "claim", "batch": 5, "median_ms": 2.0, "plans": ["SCAN jobs"]},
+        {"rows": 10, "mix": "backlog", "op": "insert", "batch": 5, "median_ms": 1.1, "plans": ["SEARCH jobs"]},
+        {"rows": 20, "mix": "backlog", "op": "insert", "batch": 5, "median_ms": 1.0, "plans": []},
+    ]}
+
+    report = compare(current, baseline, tolerance=0.25)
+
+    assert len(report) == 2
+    claim, insert = report
+    assert claim["regression"] is True
+    assert claim["plan_changed"] is False
+    assert insert["regression"] is False
+    assert insert["plan_changed"] is True
+
+def test_bench_command_baseline_regression():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        baseline_path = os.path.join(temp_dir, "baseline.json")
+        output_path = os.path.join(temp_dir, "out.json")
+
+        # An impossibly fast baseline makes every case a regression.
+        data = run_suite(rows=[100], mixes=["balanced"], batch=2, repeat=2)
+        for result in data["results"]:
+            result["median_ms"] = 1e-9
+        with open(baseline_path, "w") as f:
+            json.dump(data, f)
+
+        result = runner.invoke(app, [
+            "--rows", "100", "--mix", "balanced", "--batch", "2", "--repeat", "2",
+            "--output", output_path, "--baseline", baseline_path
+        ])
+
+        assert result.exit_code == 1
+        with open(output_path) as f:
+            output = json.load(f)
+        assert all(entry["regression"] for entry in output["comparison"])
+
+def test_bench_command_unknown_mix():
+    result = runner.invoke(app, ["--mix", "nope"])
+    assert result.exit_code == 2
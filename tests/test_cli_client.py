@@ -115,16 +115,23 @@ def test_poll_command_wait(mock_client_cls):
     mock_job.status = "QUEUED"
     mock_job.is_completed = False # Initially false
 
-    # Mocking get(wait=True) to return result
-    mock_job.get.return_value = {"content": "final"}
+    def wait_all(handles, fields=None):
+        # Handles are updated in place
+        for handle in handles:
+            handle.status = "COMPLETED"
+            handle.is_completed = True
+            handle.result = {"content": "final"}
+        return handles
 
     mock_client.jobs.poll.return_value = [mock_job]
+    mock_client.jobs.wait_all.side_effect = wait_all
 
     result = runner.invoke(app, ["poll", "job-123", "--wait"])
 
     assert result.exit_code == 0
-    assert "Waiting for job job-123..." in result.stdout
+    assert "Waiting for 1 job(s)..." in result.stdout
     assert '"content": "final"' in result.stdout
+    mock_client.jobs.wait_all.assert_called_once_with([mock_job], fields=None)
 
 @patch("openbeepboop.cli.client.Client")
 def test_poll_command_not_found(mock_client_cls):
@@ -210,3 +217,138 @@ def test_submit_command_override_config(mock_client_cls):
 
         # Verify Client was initialized with OVERRIDDEN values
         mock_client_cls.assert_called_with(base_url="http://override:5000", api_key="config-key")
+
+@patch("openbeepboop.cli.client.Client")
+def test_cancel_command(mock_client_cls):
+    mock_client = MagicMock()
+    mock_client_cls.return_value = mock_client
+    mock_client.jobs.cancel.return_value = 2
+
+    result = runner.invoke(app, ["cancel", "job-1", "--batch", "b1"])
+
+    assert result.exit_code == 0
+    assert "Cancelled 2 job(s)." in result.stdout
+    mock_client.jobs.cancel.assert_called_with(ids=["job-1"], batch_id="b1")
+
+    result = runner.invoke(app, ["cancel"])
+    assert result.exit_code == 1
+
+def test_results_list_and_export():
+    from openbeepboop.client.store import ResultStore
+    with runner.isolated_filesystem():
+        with open("client_config.toml", "w") as f:
+            f.write('result_store = "results.db"\n[server]\nurl = "http://config-server:8000"')
+        ResultStore("results.db").put_many([("j1", "COMPLETED", {"foo": "bar"}), ("j2", "FAILED", {"error": "x"})])
+
+        result = runner.invoke(app, ["results", "list", "--status", "COMPLETED"])
+        assert result.exit_code == 0
+        assert "j1  COMPLETED" in result.stdout
+        assert "j2" not in result.stdout
+
+        result = runner.invoke(app, ["results", "export", "out.jsonl"])
+        assert result.exit_code == 0
+        assert "Exported 2 result(s)" in result.stdout
+        with open("out.jsonl") as f:
+            lines = [json.loads(line) for line in f]
+        assert lines[0] == {"id": "j1", "status": "COMPLETED", "result": {"foo": "bar"}}
+
+@patch("openbeepboop.cli.client.Client")
+def test_client_uses_configured_result_store(mock_client_cls):
+    with runner.isolated_filesystem():
+        with open("client_config.toml", "w") as f:
+            f.write('result_store = "results.db"\n[server]\nurl = "http://config-server:8000"')
+        mock_client_cls.return_value.jobs.poll.return_value = []
+
+        runner.invoke(app, ["poll", "job-1"])
+
+        mock_client_cls.assert_called_with(base_url="http://config-server:8000", api_key=None, result_store="results.db")
+
+@patch("openbeepboop.cli.client.Client")
+def test_submit_file_writes_manifest_and_resumes(mock_client_cls):
+    mock_client = mock_client_cls.return_value
+    submitted = []
+
+    def create_many(requests, chunk_size):
+        submitted.extend(requests)
+        handles = []
+        for _ in requests:
+            handle = MagicMock()
+            handle.id = f"job-{len(handles) + len(submitted) - len(requests)}"
+            handles.append(handle)
+        return handles
+
+    mock_client.chat.completions.create_many.side_effect = create_many
+
+    with runner.isolated_filesystem():
+        with open("input.jsonl", "w") as f:
+            f.write(json.dumps({"custom_id": "a", "messages": [{"role": "user", "content": "1"}]}) + "\n")
+            f.write("\n")
+            f.write(json.dumps({"model": "other", "messages": []}) + "\n")
+            f.write(json.dumps({"messages": []}) + "\n")
+        # Line 1 went through in an earlier run, which was cut off mid-write
+        with open("input.manifest.jsonl", "w") as f:
+            f.write(json.dumps({"line": 1, "id": "old", "custom_id": "a"}) + "\n")
+            f.write('{"line": 3, "i')
+
+        result = runner.invoke(app, ["submit-file", "input.jsonl", "--model", "m", "--chunk-size", "1"])
+
+        assert result.exit_code == 0
+        assert "Submitted 2 job(s)" in result.stdout
+        assert submitted == [{"model": "other", "messages": []}, {"model": "m", "messages": []}]
+        with open("input.manifest.jsonl") as f:
+            manifest = [json.loads(line) for line in f]
+        assert manifest == [{"line": 1, "id": "old", "custom_id": "a"}, {"line": 3, "id": "job-0"}, {"line": 4, "id": "job-1"}]
+
+@patch("openbeepboop.cli.client.Client")
+def test_collect_streams_results_and_skips_collected(mock_client_cls):
+    mock_client = mock_client_cls.return_value
+
+    def as_completed(ids, timeout=None, fields=None):
+        for job_id in reversed(ids):
+            job = MagicMock()
+            job.id, job.status, job.result = job_id, "COMPLETED", {"id": job_id}
+            yield job
+
+    mock_client.jobs.as_completed.side_effect = as_completed
+
+    with runner.isolated_filesystem():
+        with open("input.manifest.jsonl", "w") as f:
+            for i in range(3):
+                f.write(json.dumps({"line": i + 1, "id": f"j{i}"}) + "\n")
+        with open("input.results.jsonl", "w") as f:
+            f.write(json.dumps({"line": 1, "id": "j0", "status": "COMPLETED", "result": {}}) + "\n")
+            f.write('{"line": 2, "id": "j1", "sta')
+
+        result = runner.invoke(app, ["collect", "input.manifest.jsonl"])
+
+        assert result.exit_code == 0
+        assert "Collected 3 result(s)" in result.stdout
+        mock_client.jobs.as_completed.assert_called_once_with(["j1", "j2"], timeout=None, fields=None)
+        with open("input.results.jsonl") as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["id"] for line in lines] == ["j0", "j2", "j1"]
+        assert lines[1] == {"line": 3, "id": "j2", "status": "COMPLETED", "result": {"id": "j2"}}
+
+@patch("openbeepboop.cli.client.Client")
+def test_collect_timeout(mock_client_cls):
+    mock_client_cls.return_value.jobs.as_completed.side_effect = TimeoutError("1 job(s) still unfinished")
+    with runner.isolated_filesystem():
+        with open("m.jsonl", "w") as f:
+            f.write(json.dumps({"line": 1, "id": "j0"}) + "\n")
+        result = runner.invoke(app, ["collect", "m.jsonl", "--timeout", "1"])
+        assert result.exit_code == 1
+        assert "Run collect again to resume" in result.output
+
+@patch("openbeepboop.cli.client.Client")
+def test_poll_command_fields(mock_client_cls):
+    mock_client = mock_client_cls.return_value
+    mock_job = MagicMock()
+    mock_job.status = "COMPLETED"
+    mock_job.is_completed = True
+    mock_job.result = {"usage": {"total_tokens": 3}}
+    mock_client.jobs.poll.return_value = [mock_job]
+
+    result = runner.invoke(app, ["poll", "job-1", "--fields", "choices.0.message.content, usage"])
+
+    assert result.exit_code == 0
+    mock_client.jobs.poll.assert_called_with(["job-1"], fields=["choices.0.message.content", "usage"])
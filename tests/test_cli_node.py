@@ -65,12 +65,9 @@ def test_node_batch_command(mock_client_cls, mock_load_config):
     mock_client_cls.return_value = mock_client
     mock_load_config.return_value = MagicMock()
 
-    # Mock run_once to return 1 job then 0 jobs to break loop
-    mock_client.run_once.side_effect = [1, 0]
-
     result = runner.invoke(app, ["batch"])
     assert result.exit_code == 0
-    assert mock_client.run_once.call_count == 2
+    mock_client.run_batch.assert_called_once()
 
 def test_node_run_missing_config():
     with runner.isolated_filesystem():
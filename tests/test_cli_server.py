@@ -61,6 +61,23 @@ def test_server_start_command_custom_host_port(mock_run):
     assert kwargs["host"] == "127.0.0.1"
     assert kwargs["port"] == 9000
 
+@patch("openbeepboop.cli.server.uvicorn.run")
+def test_server_start_command_config(mock_run):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_path = os.path.join(temp_dir, "server_config.toml")
+        with open(config_path, "w") as f:
+            f.write("[queue]\nprefix_max_age = 5\n")
+
+        with patch.dict(os.environ, {}):
+            result = runner.invoke(app, ["start", "--config", config_path])
+            assert result.exit_code == 0
+            assert os.environ["OPENBEEPBOOP_SERVER_CONFIG"] == config_path
+
+        result = runner.invoke(app, ["start", "--config", os.path.join(temp_dir, "missing.toml")])
+        assert result.exit_code == 1
+        assert "Error loading config" in result.stdout
+        mock_run.assert_called_once()
+
 def test_server_setup_duplicate_key_handling():
     with tempfile.TemporaryDirectory() as temp_dir:
         db_path = os.path.join(temp_dir, "test.db")
@@ -1,6 +1,6 @@
 import pytest
-from openbeepboop.client.client import Client
-from unittest.mock import MagicMock
+from openbeepboop.client.client import Client, JobHandle
+from unittest.mock import MagicMock, patch
 
 def test_client_chat_completion_create():
     c = Client(base_url="http://test")
@@ -55,3 +55,186 @@ def test_job_handle_get_wait():
     # get(wait=True)
     result = handle.get(wait=True)
     assert result == {"done": True}
+
+def test_client_cancel():
+    c = Client(base_url="http://test")
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {"status": "ok", "cancelled": 3}))
+
+    assert c.jobs.cancel(ids=["job-1"], batch_id="b1") == 3
+    c.http_client.post.assert_called_with("/v1/jobs/cancel", json={"ids": ["job-1"], "batch_id": "b1"})
+
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {"id": "job-1", "status": "CANCELLED", "cancelled": True}))
+    handle = JobHandle(c, "job-1")
+    assert handle.cancel() is True
+    assert handle.is_completed
+    c.http_client.post.assert_called_with("/v1/jobs/job-1/cancel", json={})
+
+def test_client_embeddings_create():
+    c = Client(base_url="http://test")
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=202, json=lambda: {"id": "job-2", "status": "QUEUED"}))
+
+    handle = c.embeddings.create(model="embed", input=["a", "b"])
+
+    assert handle.id == "job-2"
+    c.http_client.post.assert_called_with("/v1/embeddings", json={"model": "embed", "input": ["a", "b"]})
+
+def test_as_completed_polls_outstanding_ids_in_chunks():
+    c = Client(base_url="http://test")
+    finish_order = {"j1": 1, "j2": 2, "j3": 1}
+    rounds = {"count": 0}
+    polled = []
+
+    def side_effect(path, json=None):
+        polled.append(list(json["ids"]))
+        if len(polled) in (1, 3):
+            rounds["count"] += 1
+        jobs = [
+            {"id": job_id, "status": "COMPLETED" if finish_order[job_id] <= rounds["count"] else "QUEUED", "result": {"id": job_id}}
+            for job_id in json["ids"]
+        ]
+        return MagicMock(status_code=200, json=lambda: {"jobs": jobs})
+
+    c.http_client.post = MagicMock(side_effect=side_effect)
+    done = JobHandle(c, "j0", "COMPLETED")
+
+    with patch("openbeepboop.client.client.time.sleep") as sleep:
+        finished = [h.id for h in c.jobs.as_completed([done, "j1", "j2", "j3"], poll_batch_size=2)]
+
+    assert finished == ["j0", "j1", "j3", "j2"]
+    # Finished ids drop out of later polls
+    assert polled == [["j1", "j2"], ["j3"], ["j2"]]
+    sleep.assert_called_once_with(0.5)
+
+def test_wait_all_backs_off_and_times_out():
+    c = Client(base_url="http://test")
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {"jobs": [{"id": "j1", "status": "QUEUED", "result": None}]}))
+    clock = iter(range(100))
+
+    with patch("openbeepboop.client.client.time.sleep") as sleep, \
+         patch("openbeepboop.client.client.time.time", side_effect=lambda: next(clock)):
+        with pytest.raises(TimeoutError):
+            c.jobs.wait_all(["j1"], timeout=4, max_interval=2.0)
+
+    assert [call.args[0] for call in sleep.call_args_list] == [1.0, 2.0, 2.0, 2.0]
+
+def _bulk_response(json):
+    jobs = [{"id": request["id"], "status": "QUEUED"} for request in json["requests"]]
+    return MagicMock(status_code=202, json=lambda: {"jobs": jobs})
+
+def test_create_many_uses_bulk_endpoint_in_chunks():
+    c = Client(base_url="http://test")
+    calls = []
+
+    def side_effect(path, json=None):
+        calls.append((path, len(json["requests"])))
+        return _bulk_response(json)
+
+    c.http_client.post = MagicMock(side_effect=side_effect)
+    requests = ({"id": f"job-{i}", "model": "m", "messages": []} for i in range(5))
+
+    handles = c.chat.completions.create_many(requests, chunk_size=2)
+
+    assert [h.id for h in handles] == [f"job-{i}" for i in range(5)]
+    assert calls == [("/v1/chat/completions/bulk", 2)] * 2 + [("/v1/chat/completions/bulk", 1)]
+
+def test_create_many_falls_back_to_single_posts_and_retries():
+    import httpx
+    c = Client(base_url="http://test")
+    failures = {"job-1": 1}
+
+    def side_effect(path, json=None):
+        request = httpx.Request("POST", f"http://test{path}")
+        if path.endswith("/bulk"):
+            return httpx.Response(404, request=request)
+        if failures.get(json["id"]):
+            failures[json["id"]] -= 1
+            return httpx.Response(503, request=request)
+        return httpx.Response(202, json={"id": json["id"], "status": "QUEUED"}, request=request)
+
+    c.http_client.post = MagicMock(side_effect=side_effect)
+
+    with patch("openbeepboop.client.client.time.sleep"):
+        handles = c.embeddings.create_many([{"id": f"job-{i}", "input": "x"} for i in range(3)], chunk_size=2)
+
+    assert [h.id for h in handles] == ["job-0", "job-1", "job-2"]
+    # The bulk endpoint is only tried once
+    bulk_calls = [call for call in c.http_client.post.call_args_list if call.args[0].endswith("/bulk")]
+    assert len(bulk_calls) == 1
+    assert c._bulk_supported is False
+
+def test_create_many_only_retries_unsent_bulk_calls():
+    import httpx
+    c = Client(base_url="http://test")
+    outcomes = []
+
+    def side_effect(path, json=None):
+        request = httpx.Request("POST", f"http://test{path}")
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome != 202:
+            return httpx.Response(outcome, request=request)
+        return httpx.Response(202, json={"jobs": [{"id": r["id"], "status": "QUEUED"} for r in json["requests"]]}, request=request)
+
+    c.http_client.post = MagicMock(side_effect=side_effect)
+    requests = [{"id": "job-0", "model": "m", "messages": []}]
+
+    with patch("openbeepboop.client.client.time.sleep"):
+        outcomes[:] = [httpx.ConnectError("refused"), 429, 503, 202]
+        assert [h.id for h in c.chat.completions.create_many(requests)] == ["job-0"]
+
+        # The server may have stored the chunk before these; resending could duplicate it
+        for failure in [httpx.ReadTimeout("lost"), httpx.RemoteProtocolError("dropped"), 500, 502]:
+            outcomes[:] = [failure, 202]
+            with pytest.raises((httpx.TransportError, httpx.HTTPStatusError)):
+                c.chat.completions.create_many(requests)
+            assert outcomes == [202]
+
+def test_poll_reads_finished_jobs_from_result_store(tmp_path):
+    c = Client(base_url="http://test", result_store=str(tmp_path / "results.db"))
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {"jobs": [
+        {"id": "j1", "status": "COMPLETED", "result": {"foo": "bar"}},
+        {"id": "j2", "status": "QUEUED", "result": None}
+    ]}))
+
+    assert [h.status for h in c.jobs.poll(["j1", "j2"])] == ["COMPLETED", "QUEUED"]
+
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {"jobs": [
+        {"id": "j2", "status": "COMPLETED", "result": {"baz": 1}}
+    ]}))
+    handles = c.jobs.poll(["j1", "j2"])
+
+    # Only the unfinished job goes over the wire
+    c.http_client.post.assert_called_once_with("/v1/results/poll", json={"ids": ["j2"]})
+    assert [h.result for h in handles] == [{"foo": "bar"}, {"baz": 1}]
+
+    c.http_client.post.reset_mock()
+    assert JobHandle(c, "j2").get() == {"baz": 1}
+    c.http_client.post.assert_not_called()
+
+def test_poll_fields_are_sent_and_projections_not_cached(tmp_path):
+    c = Client(base_url="http://test", result_store=str(tmp_path / "results.db"))
+    c.http_client.post = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {"jobs": [
+        {"id": "j1", "status": "COMPLETED", "result": {"usage": {"total_tokens": 1}}}
+    ]}))
+
+    handles = c.jobs.poll(["j1"], fields=["usage"])
+
+    assert handles[0].result == {"usage": {"total_tokens": 1}}
+    c.http_client.post.assert_called_with("/v1/results/poll", json={"ids": ["j1"], "fields": ["usage"]})
+    assert c.result_store.get_many(["j1"]) == {}
+
+def test_job_changes(tmp_path):
+    c = Client(base_url="http://test", result_store=str(tmp_path / "results.db"))
+    c.http_client.get = MagicMock(return_value=MagicMock(status_code=200, json=lambda: {
+        "jobs": [{"id": "j1", "status": "COMPLETED", "result": {"a": 1}, "seq": 7}, {"id": "j2", "status": "PROCESSING", "result": None, "seq": 9}],
+        "cursor": 9,
+        "has_more": False
+    }))
+
+    handles, cursor, has_more = c.jobs.changes(cursor=3)
+
+    assert [h.id for h in handles] == ["j1", "j2"]
+    assert (cursor, has_more) == (9, False)
+    c.http_client.get.assert_called_with("/v1/jobs/changes", params={"cursor": 3, "limit": 500})
+    assert c.result_store.get_many(["j1", "j2"]) == {"j1": ("COMPLETED", {"a": 1})}
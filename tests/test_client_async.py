@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from openbeepboop import AsyncClient
+from openbeepboop.client.async_client import AsyncJobHandle
+
+def _response(data):
+    return MagicMock(status_code=200, json=lambda: data, raise_for_status=lambda: None)
+
+@pytest.mark.asyncio
+async def test_async_create_and_poll():
+    async with AsyncClient(base_url="http://test") as c:
+        c.http_client.post = AsyncMock(return_value=_response({"id": "job-1", "status": "QUEUED"}))
+        handle = await c.chat.completions.create(model="test", messages=[])
+        assert handle.id == "job-1"
+        c.http_client.post.assert_called_with("/v1/chat/completions", json={"model": "test", "messages": []})
+
+        c.http_client.post = AsyncMock(return_value=_response({"jobs": [{"id": "job-1", "status": "COMPLETED", "result": {"foo": "bar"}}]}))
+        handles = await c.jobs.poll(["job-1"])
+        assert handles[0].result == {"foo": "bar"}
+        assert await handle.get(wait=False) == {"foo": "bar"}
+
+@pytest.mark.asyncio
+async def test_async_get_shares_one_poller():
+    polled = []
+    rounds = {"count": 0}
+
+    async def post(path, json=None):
+        polled.append(list(json["ids"]))
+        rounds["count"] += 1
+        # Everything finishes on the second round
+        status = "COMPLETED" if rounds["count"] > 2 else "QUEUED"
+        return _response({"jobs": [{"id": job_id, "status": status, "result": {"id": job_id}} for job_id in json["ids"]]})
+
+    async with AsyncClient(base_url="http://test", poll_interval=0.01, poll_batch_size=2) as c:
+        c.http_client.post = post
+        handles = [AsyncJobHandle(c, f"j{i}") for i in range(3)]
+        results = await asyncio.gather(*(handle.get(timeout=5) for handle in handles))
+
+    assert results == [{"id": "j0"}, {"id": "j1"}, {"id": "j2"}]
+    # One round polls every waiting job, in batches of poll_batch_size
+    assert polled[:2] == [["j0", "j1"], ["j2"]]
+    assert all(handle.status == "COMPLETED" for handle in handles)
+
+@pytest.mark.asyncio
+async def test_async_get_timeout():
+    async with AsyncClient(base_url="http://test", poll_interval=0.01) as c:
+        c.http_client.post = AsyncMock(return_value=_response({"jobs": [{"id": "j1", "status": "QUEUED"}]}))
+        with pytest.raises(TimeoutError):
+            await AsyncJobHandle(c, "j1").get(timeout=0.05)
+        assert c._waiters == {}
+
+@pytest.mark.asyncio
+async def test_async_poller_retries_transient_errors():
+    request = httpx.Request("POST", "http://test/v1/results/poll")
+    outcomes = [
+        httpx.ConnectError("refused", request=request),
+        httpx.HTTPStatusError("busy", request=request, response=httpx.Response(503, request=request)),
+        _response({"jobs": [{"id": "j1", "status": "COMPLETED", "result": {"ok": True}}]}),
+    ]
+
+    async def post(path, json=None):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async with AsyncClient(base_url="http://test", poll_interval=0.01) as c:
+        c.http_client.post = post
+        assert await AsyncJobHandle(c, "j1").get(timeout=5) == {"ok": True}
+
+@pytest.mark.asyncio
+async def test_async_poller_fails_waiters_on_client_errors():
+    request = httpx.Request("POST", "http://test/v1/results/poll")
+    error = httpx.HTTPStatusError("forbidden", request=request, response=httpx.Response(403, request=request))
+
+    async with AsyncClient(base_url="http://test", poll_interval=0.01) as c:
+        c.http_client.post = AsyncMock(side_effect=error)
+        with pytest.raises(httpx.HTTPStatusError):
+            await AsyncJobHandle(c, "j1").get(timeout=5)
+        assert c._waiters == {}
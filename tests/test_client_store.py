@@ -0,0 +1,21 @@
+import os
+from openbeepboop.client.store import ResultStore
+
+def test_result_store_round_trip(tmp_path):
+    path = str(tmp_path / "cache" / "results.db")
+    store = ResultStore(path)
+    store.put_many([("j1", "COMPLETED", {"foo": "bar"}), ("j2", "FAILED", None)])
+
+    assert store.get_many(["j1", "j2", "j3"]) == {"j1": ("COMPLETED", {"foo": "bar"}), "j2": ("FAILED", None)}
+    assert [job["id"] for job in store.list(status="COMPLETED")] == ["j1"]
+    assert len(store.list(limit=1)) == 1
+    store.close()
+
+    # Persisted across instances
+    assert os.path.exists(path)
+    assert ResultStore(path).get_many(["j1"])["j1"][1] == {"foo": "bar"}
+
+def test_result_store_lookup_is_chunked(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.put_many((f"j{i}", "COMPLETED", {"i": i}) for i in range(1200))
+    assert len(store.get_many([f"j{i}" for i in range(1300)])) == 1200
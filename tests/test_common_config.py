@@ -1,5 +1,5 @@
 import pytest
-from openbeepboop.common.config import load_node_config, NodeConfig
+from openbeepboop.common.config import load_node_config, NodeConfig, load_server_config, ServerSettings
 import os
 import tempfile
 import tomli_w
@@ -38,3 +38,18 @@ def test_load_node_config_invalid_format():
             load_node_config(path)
     finally:
         os.remove(path)
+
+def test_load_server_config():
+    with tempfile.NamedTemporaryFile(suffix=".toml", delete=False) as f:
+        tomli_w.dump({"queue": {"prefix_max_age": 5}}, f)
+        path = f.name
+
+    try:
+        settings = load_server_config(path)
+        assert isinstance(settings, ServerSettings)
+        assert settings.queue.prefix_max_age == 5
+    finally:
+        os.remove(path)
+
+    with pytest.raises(FileNotFoundError):
+        load_server_config("non_existent_file.toml")
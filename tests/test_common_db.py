@@ -49,3 +49,50 @@ def test_get_db_connection_default_path():
              conn = get_db_connection() # get at mocked default
              assert isinstance(conn, sqlite3.Connection)
              conn.close()
+
+def test_init_db_migrates_old_jobs_table():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "old.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE jobs (
+                id TEXT PRIMARY KEY, status TEXT, created_at TIMESTAMP, updated_at TIMESTAMP,
+                request_payload TEXT, result_payload TEXT, locked_by TEXT, locked_at TIMESTAMP
+            )
+        """)
+        conn.execute("INSERT INTO jobs (id, status) VALUES ('old', 'QUEUED')")
+        conn.commit()
+        conn.close()
+
+        init_db(db_path)
+        init_db(db_path) # idempotent
+
+        conn = sqlite3.connect(db_path)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        assert {"est_tokens", "attempts", "available_at"} <= columns
+        assert conn.execute("SELECT attempts FROM jobs WHERE id='old'").fetchone() == (0,)
+        assert conn.execute("SELECT est_tokens FROM jobs WHERE id='old'").fetchone() == (None,)
+        conn.close()
+
+def test_job_seq_bumps_on_insert_and_status_change():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = init_db(os.path.join(temp_dir, "test.db"))
+        conn = get_db_connection(db_path)
+        conn.execute("INSERT INTO jobs (id, status) VALUES ('a', 'QUEUED')")
+        conn.execute("INSERT INTO jobs (id, status) VALUES ('b', 'QUEUED')")
+        seq = lambda job_id: conn.execute("SELECT seq FROM jobs WHERE id = ?", (job_id,)).fetchone()["seq"]
+        assert (seq("a"), seq("b")) == (1, 2)
+
+        conn.execute("UPDATE jobs SET status = 'PROCESSING' WHERE id = 'a'")
+        assert seq("a") == 3
+        # Other columns, or a status rewritten unchanged, leave seq alone
+        conn.execute("UPDATE jobs SET locked_by = 'n', status = 'PROCESSING' WHERE id = 'a'")
+        assert seq("a") == 3
+        conn.close()
+
+def test_held_job_count_uses_index():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        conn = get_db_connection(init_db(os.path.join(temp_dir, "test.db")))
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM jobs WHERE status = ? AND locked_by = ?", ("PROCESSING", "n")).fetchall()
+        assert "idx_jobs_locked" in plan[0]["detail"]
+        conn.close()
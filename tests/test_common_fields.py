@@ -0,0 +1,27 @@
+import pytest
+from openbeepboop.common.fields import parse_field, parse_fields, json_path, project, MAX_FIELDS
+
+def test_parse_field():
+    assert parse_field("choices.0.message.content") == ["choices", 0, "message", "content"]
+    assert parse_field("choices[0].message") == ["choices", 0, "message"]
+    assert json_path(parse_field("choices.0.message")) == '$."choices"[0]."message"'
+    for bad in ["", "a..b", 'a."b"', "a.$"]:
+        with pytest.raises(ValueError):
+            parse_field(bad)
+    with pytest.raises(ValueError):
+        parse_fields(["a"] * (MAX_FIELDS + 1))
+
+def test_project_keeps_original_nesting():
+    obj = {
+        "choices": [{"message": {"content": "hi", "role": "assistant"}}, {"message": {"content": "second"}}],
+        "usage": {"total_tokens": 5},
+        "model": "m"
+    }
+    paths = parse_fields(["choices.1.message.content", "choices.0.message.content", "usage", "missing.x"])
+    assert project(obj, paths) == {
+        "choices": [{"message": {"content": "hi"}}, {"message": {"content": "second"}}],
+        "usage": {"total_tokens": 5},
+        "missing": {"x": None}
+    }
+    # A list index on an object selects nothing
+    assert project(obj, parse_fields(["usage.0"])) == {"usage": [None]}
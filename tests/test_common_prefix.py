@@ -0,0 +1,33 @@
+from openbeepboop.common.prefix import prefix_fingerprint, PREFIX_FINGERPRINT_CHARS
+
+def _payload(messages, model="m"):
+    return {"model": model, "messages": messages}
+
+def test_shared_system_prompt_matches():
+    system = {"role": "system", "content": "You are terse."}
+    first = prefix_fingerprint(_payload([system, {"role": "user", "content": "one"}]))
+    second = prefix_fingerprint(_payload([system, {"role": "user", "content": "two"}]))
+    other = prefix_fingerprint(_payload([{"role": "system", "content": "Be verbose."}, {"role": "user", "content": "one"}]))
+
+    assert first == second
+    assert first != other
+
+def test_model_and_content_parts():
+    system = {"role": "system", "content": [{"type": "text", "text": "You are terse."}]}
+    user = {"role": "user", "content": "hi"}
+    assert prefix_fingerprint(_payload([system, user])) == prefix_fingerprint(_payload([{"role": "system", "content": "You are terse."}, user]))
+    assert prefix_fingerprint(_payload([system, user])) != prefix_fingerprint(_payload([system, user], model="other"))
+
+def test_long_single_message_uses_leading_text():
+    shared = "x" * PREFIX_FINGERPRINT_CHARS
+    assert prefix_fingerprint(_payload([{"role": "user", "content": shared + "a"}])) == \
+        prefix_fingerprint(_payload([{"role": "user", "content": shared + "b"}]))
+
+def test_no_messages():
+    assert prefix_fingerprint({"model": "m"}) is None
+    assert prefix_fingerprint(_payload([])) is None
+
+def test_malformed_messages():
+    assert prefix_fingerprint(_payload("hello")) is None
+    assert prefix_fingerprint(_payload(["hi"])) is None
+    assert prefix_fingerprint(_payload([{"role": "user", "content": [{"type": "text", "text": 5}]}])) is not None
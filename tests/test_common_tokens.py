@@ -0,0 +1,44 @@
+from openbeepboop.common.tokens import (
+    estimate_message_tokens, estimate_request_tokens, embedding_inputs, estimate_embedding_tokens,
+    DEFAULT_COMPLETION_TOKENS, TOKENS_PER_IMAGE
+)
+
+def test_estimate_message_tokens():
+    messages = [
+        {"role": "system", "content": "x" * 40},
+        {"role": "user", "content": [
+            {"type": "text", "text": "y" * 8},
+            {"type": "image_url", "image_url": {"url": "data:..."}},
+        ]},
+    ]
+    assert estimate_message_tokens(messages) == (4 + 10) + (4 + 2 + TOKENS_PER_IMAGE)
+    assert estimate_message_tokens(None) == 0
+
+def test_estimate_message_tokens_malformed_input():
+    assert estimate_message_tokens("x" * 8) == 4 + 2
+    assert estimate_message_tokens(["x" * 8, 5, None]) == 4 + 2
+    assert estimate_message_tokens({"role": "user"}) == 0
+    assert estimate_message_tokens([{"content": [{"type": "text", "text": 12345678}, "abcd", 3]}]) == 4 + 3
+    assert estimate_request_tokens({"messages": "hello", "max_tokens": 1}) == 4 + 2 + 1
+
+def test_estimate_request_tokens_completion_allowance():
+    messages = [{"role": "user", "content": "x" * 40}]
+    assert estimate_request_tokens({"messages": messages}) == 14 + DEFAULT_COMPLETION_TOKENS
+    assert estimate_request_tokens({"messages": messages, "max_tokens": 10}) == 24
+    assert estimate_request_tokens({"messages": messages, "max_completion_tokens": 20, "max_tokens": 10}) == 34
+
+def test_estimate_request_tokens_tokenizer_fallback():
+    payload = {"messages": [{"role": "user", "content": "x" * 40}], "max_tokens": 1}
+    assert estimate_request_tokens(payload, count_prompt=lambda p: 3) == 4
+
+    def broken(p):
+        raise ValueError("unknown model")
+    assert estimate_request_tokens(payload, count_prompt=broken) == 15
+
+def test_embedding_inputs_and_tokens():
+    assert embedding_inputs({"input": "abcd"}) == ["abcd"]
+    assert embedding_inputs({"input": [1, 2, 3]}) == [[1, 2, 3]] # one pre-tokenized input
+    assert embedding_inputs({"input": ["ab", [1, 2]]}) == ["ab", [1, 2]]
+    assert embedding_inputs({}) == []
+
+    assert estimate_embedding_tokens({"input": ["abcdefgh", [1, 2, 3]]}) == 2 + 3
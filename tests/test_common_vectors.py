@@ -0,0 +1,28 @@
+import base64
+import pytest
+from openbeepboop.common.vectors import pack_vectors, unpack_vectors, split_packed, encode_vectors, decode_vectors
+
+def test_pack_round_trip():
+    vectors = [[0.5, -1.0, 2.25], [0.0, 1.5, -0.125]]
+    packed = pack_vectors(vectors)
+
+    assert len(packed) == 6 * 4 # float32
+    assert unpack_vectors(packed, 2) == vectors
+    assert unpack_vectors(decode_vectors(encode_vectors(vectors)), 2) == vectors
+
+def test_little_endian_layout():
+    # Same bytes as OpenAI's base64 encoding_format
+    assert pack_vectors([[1.0]]) == b"\x00\x00\x80\x3f"
+
+def test_split_packed():
+    packed = pack_vectors([[1.0, 2.0], [3.0, 4.0]])
+    first, second = split_packed(packed, 2)
+    assert unpack_vectors(first, 1) == [[1.0, 2.0]]
+    assert unpack_vectors(second, 1) == [[3.0, 4.0]]
+    assert split_packed(packed, 0) == []
+
+def test_uneven_split_rejected():
+    with pytest.raises(ValueError):
+        unpack_vectors(pack_vectors([[1.0, 2.0, 3.0]]), 2)
+    with pytest.raises(ValueError):
+        split_packed(pack_vectors([[1.0, 2.0, 3.0]]), 2)
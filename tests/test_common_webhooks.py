@@ -0,0 +1,24 @@
+from openbeepboop.common.webhooks import sign, verify, host_allowed
+
+def test_sign_and_verify():
+    body = b'{"jobs": []}'
+    signature = sign("secret", "1000", body)
+    assert signature.startswith("sha256=")
+    assert verify("secret", "1000", body, signature, now=1010)
+    assert not verify("other", "1000", body, signature, now=1010)
+    assert not verify("secret", "1000", body + b" ", signature, now=1010)
+    # Stale or malformed timestamps are rejected
+    assert not verify("secret", "1000", body, signature, now=2000)
+    assert verify("secret", "1000", body, signature, tolerance=None, now=2000)
+    assert not verify("secret", "soon", body, signature)
+
+def test_host_allowed():
+    # Closed unless hosts are listed
+    assert not host_allowed("http://10.0.0.1/hook", [])
+    assert host_allowed("http://10.0.0.1/hook", ["*"])
+    allowed = ["hooks.example.com", "*.internal.example.com"]
+    assert host_allowed("https://HOOKS.example.com:8443/x", allowed)
+    assert host_allowed("https://a.b.internal.example.com/x", allowed)
+    assert not host_allowed("https://internal.example.com/x", allowed)
+    assert not host_allowed("https://evilinternal.example.com/x", allowed)
+    assert not host_allowed("http://localhost/x", allowed)
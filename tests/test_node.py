@@ -1,8 +1,10 @@
 import pytest
+import asyncio
+from collections import deque
 from openbeepboop.node.worker import NodeClient, NodeConfig
-from openbeepboop.common.config import ServerConfig, LLMConfig, LocalLLMConfig
+from openbeepboop.common.config import ServerConfig, LLMConfig, LocalLLMConfig, WorkerConfig, BackendConfig, RateLimitConfig
 from openbeepboop.common.models import JobStatus
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, AsyncMock, patch
 
 @pytest.fixture
 def node_config():
@@ -144,3 +146,759 @@ def test_run_loop(mock_sleep, node_config):
 
     mock_sleep.assert_called_once_with(5)
     assert client.run_once.call_count == 3
+
+def test_run_batch_sequential(node_config):
+    client = NodeClient(node_config)
+    # Mock run_once to return 1 job then 0 jobs to break loop
+    client.run_once = MagicMock(side_effect=[1, 0])
+
+    assert client.run_batch() == 1
+    assert client.run_once.call_count == 2
+
+@pytest.fixture
+def concurrent_config():
+    return NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        llm=LLMConfig(model="gpt-test"),
+        worker=WorkerConfig(max_concurrency=4)
+    )
+
+@pytest.mark.asyncio
+@patch("openbeepboop.node.worker.acompletion", new_callable=AsyncMock)
+async def test_aprocess_job(mock_acompletion, node_config):
+    client = NodeClient(node_config)
+    mock_response = MagicMock()
+    mock_response.model_dump.return_value = {"id": "chatcmpl-1"}
+    mock_acompletion.return_value = mock_response
+
+    result = await client.aprocess_job({"id": "job-1", "request_payload": {"model": "m", "messages": []}})
+
+    assert result == {"id": "job-1", "status": JobStatus.COMPLETED.value, "result": {"id": "chatcmpl-1"}}
+    assert mock_acompletion.call_args.kwargs["model"] == "m"
+
+@pytest.mark.asyncio
+@patch("openbeepboop.node.worker.acompletion", new_callable=AsyncMock)
+async def test_aprocess_job_failure(mock_acompletion, node_config):
+    client = NodeClient(node_config)
+    mock_acompletion.side_effect = Exception("LiteLLM Error")
+
+    result = await client.aprocess_job({"id": "job-1", "request_payload": {"messages": []}})
+    assert result["status"] == JobStatus.FAILED.value
+    assert "LiteLLM Error" in result["error"]
+
+@pytest.mark.asyncio
+async def test_afetch_and_asubmit(node_config):
+    client = NodeClient(node_config)
+    client.aclient = MagicMock()
+    client.aclient.post = AsyncMock(return_value=MagicMock(status_code=200, json=lambda: [{"id": "1"}]))
+
+    assert await client.afetch_jobs(limit=3) == [{"id": "1"}]
+    client.aclient.post.assert_called_with("/internal/queue/fetch", json={"limit": 3}, headers=client.headers)
+
+    await client.asubmit_results([{"id": "1", "status": "COMPLETED"}])
+    client.aclient.post.assert_called_with("/internal/queue/submit", json=[{"id": "1", "status": "COMPLETED"}], headers=client.headers)
+
+    client.aclient.post = AsyncMock(side_effect=Exception("Connection error"))
+    assert await client.afetch_jobs(limit=1) == []
+    await client.asubmit_results([{"id": "1", "status": "COMPLETED"}]) # logs, doesn't raise
+
+@pytest.mark.asyncio
+async def test_run_async_bounded_window_with_refill(concurrent_config):
+    client = NodeClient(concurrent_config)
+    queue = [{"id": f"j{i}", "request_payload": {}} for i in range(10)]
+    fetch_limits = []
+
+    async def afetch_jobs(limit=1, max_tokens=None):
+        fetch_limits.append(limit)
+        taken = queue[:limit]
+        del queue[:limit]
+        return taken
+
+    active = 0
+    peak = 0
+
+    async def aprocess_job(job):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        # Uneven durations so slots free up one at a time
+        await asyncio.sleep(0.001 * (int(job["id"][1:]) % 3 + 1))
+        active -= 1
+        return {"id": job["id"], "status": "COMPLETED"}
+
+    submitted = []
+
+    async def asubmit_results(results):
+        submitted.extend(results)
+
+    client.afetch_jobs = afetch_jobs
+    client.aprocess_job = aprocess_job
+    client.asubmit_results = asubmit_results
+
+    processed = await client.run_async(drain=True)
+
+    assert processed == 10
+    assert sorted(r["id"] for r in submitted) == sorted(f"j{i}" for i in range(10))
+    assert peak == 4
+    assert fetch_limits[0] == 4
+    # Refill requests only the freed slots rather than a full batch
+    assert any(limit < 4 for limit in fetch_limits[1:])
+    assert client.aclient is None
+
+@patch("openbeepboop.node.worker.asyncio.run")
+def test_run_batch_and_loop_use_async_engine(mock_run, concurrent_config):
+    client = NodeClient(concurrent_config)
+    client.run_async = MagicMock(return_value="coro")
+    mock_run.return_value = 7
+
+    assert client.run_batch() == 7
+    client.run_async.assert_called_with(drain=True)
+
+    client.run_loop()
+    client.run_async.assert_called_with()
+    assert mock_run.call_count == 2
+
+def _fake_queue(client, count, duration=0.001, tokens=100):
+    """Wire a NodeClient's async I/O to an in-memory queue and record what happens."""
+    queue = [{"id": f"j{i}", "request_payload": {}, "est_tokens": tokens} for i in range(count)]
+    log = {"fetch_limits": [], "fetch_active": [], "submits": [], "active": 0, "active_tokens": 0, "peak_tokens": 0}
+
+    async def afetch_jobs(limit=1, max_tokens=None):
+        log["fetch_limits"].append(limit)
+        log["fetch_active"].append(log["active"])
+        taken = queue[:limit]
+        if max_tokens is not None:
+            taken = taken[:max(1, max_tokens // tokens)]
+        del queue[:len(taken)]
+        return taken
+
+    async def aprocess_job(job):
+        log["active"] += 1
+        log["active_tokens"] += job["est_tokens"]
+        log["peak_tokens"] = max(log["peak_tokens"], log["active_tokens"])
+        await asyncio.sleep(duration)
+        log["active_tokens"] -= job["est_tokens"]
+        log["active"] -= 1
+        return {"id": job["id"], "status": "COMPLETED"}
+
+    async def asubmit_results(results):
+        log["submits"].append([r["id"] for r in results])
+
+    client.afetch_jobs = afetch_jobs
+    client.aprocess_job = aprocess_job
+    client.asubmit_results = asubmit_results
+    return log
+
+@pytest.mark.asyncio
+async def test_run_async_pipelined_prefetch_and_batched_submit():
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(max_concurrency=2, prefetch=4, submit_batch_size=3, submit_interval=60)
+    )
+    client = NodeClient(config)
+    log = _fake_queue(client, 12, duration=0.005)
+
+    processed = await client.run_async(drain=True)
+
+    assert processed == 12
+    # First fetch fills the running slots plus the prefetch buffer
+    assert log["fetch_limits"][0] == 6
+    # Later fetches overlap with inference instead of waiting for it
+    assert any(active > 0 for active in log["fetch_active"][1:])
+    submitted = [job_id for batch in log["submits"] for job_id in batch]
+    assert sorted(submitted) == sorted(f"j{i}" for i in range(12))
+    assert all(len(batch) <= 3 for batch in log["submits"][:-1])
+    assert max(len(batch) for batch in log["submits"]) > 1
+
+@pytest.mark.asyncio
+async def test_run_async_submit_interval_trigger():
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(max_concurrency=1, prefetch=2, submit_batch_size=100, submit_interval=0.01)
+    )
+    client = NodeClient(config)
+    log = _fake_queue(client, 4, duration=0.03)
+
+    await client.run_async(drain=True)
+
+    # The size trigger never fires, so results go out on the time trigger as they finish
+    assert len(log["submits"]) > 1
+    assert sum(len(batch) for batch in log["submits"]) == 4
+
+def test_buffer_limit_accounts_for_lease():
+    config = NodeConfig(
+        server=ServerConfig(),
+        worker=WorkerConfig(max_concurrency=2, prefetch=8, lease_seconds=20)
+    )
+    client = NodeClient(config)
+    # Nothing observed yet: trust the configured prefetch
+    assert client._buffer_limit() == 8
+
+    # 10s jobs on 2 slots drain 2 buffered jobs within half the 20s lease
+    client._observe_job_seconds(10.0)
+    assert client._buffer_limit() == 2
+
+    client._job_seconds = 0.1
+    assert client._buffer_limit() == 8
+
+    config.worker.prefetch = 0
+    assert client._buffer_limit() == 0
+
+@pytest.fixture
+def adaptive_config():
+    return NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(adaptive=True, min_concurrency=1, max_concurrency=8)
+    )
+
+def test_fetch_jobs_reads_queue_depth(adaptive_config):
+    client = NodeClient(adaptive_config)
+    client.client.post = MagicMock(return_value=MagicMock(status_code=200, headers={"X-Queue-Depth": "42"}, json=lambda: []))
+
+    client.fetch_jobs(limit=1)
+    assert client.controller.queue_depth == 42
+
+    client.client.post = MagicMock(return_value=MagicMock(status_code=200, headers={}, json=lambda: []))
+    client.fetch_jobs(limit=1)
+    assert client.controller.queue_depth == 42
+
+@patch("openbeepboop.node.worker.completion")
+def test_process_job_failure_keeps_status_code(mock_completion, node_config):
+    node_config.worker.rate_limit_retries = 0
+    client = NodeClient(node_config)
+    client.release_jobs = MagicMock(return_value=False)
+    error = Exception("Rate limit exceeded")
+    error.status_code = 429
+    mock_completion.side_effect = error
+
+    # Nothing to retry and the release failed, so the 429 is reported
+    result = client.process_job({"id": "job-1", "request_payload": {"messages": []}})
+    assert result["status"] == JobStatus.FAILED.value
+    assert result["error_code"] == 429
+
+def test_run_once_adaptive_fetch_size(adaptive_config):
+    client = NodeClient(adaptive_config)
+    client.fetch_jobs = MagicMock(return_value=[{"id": "j1"}, {"id": "j2"}])
+    client.process_job = MagicMock(side_effect=lambda job: {"id": job["id"], "status": "COMPLETED"})
+    client.submit_results = MagicMock()
+
+    client.run_once()
+    client.fetch_jobs.assert_called_with(limit=1, max_tokens=None)
+    assert client.controller.completed == 2
+
+    # Two successes in slow start grow the next fetch
+    client.run_once()
+    client.fetch_jobs.assert_called_with(limit=3, max_tokens=None)
+
+    client.process_job = MagicMock(return_value={"id": "j1", "status": "FAILED", "error_code": 429})
+    client.run_once()
+    assert client.controller.concurrency < 5
+    assert client.metrics()["throttled"] == 2
+
+@pytest.mark.asyncio
+async def test_run_async_adaptive_window(adaptive_config):
+    client = NodeClient(adaptive_config)
+    log = _fake_queue(client, 20)
+
+    processed = await client.run_async(drain=True)
+
+    assert processed == 20
+    # Starts at the minimum and grows as jobs succeed
+    assert log["fetch_limits"][0] == 1
+    assert max(log["fetch_limits"]) > 1
+    assert client.metrics()["concurrency_limit"] > 1
+
+@pytest.fixture
+def spool_config(tmp_path):
+    return NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(spool_path=str(tmp_path / "results.spool"))
+    )
+
+def test_submit_results_spools_until_acknowledged(spool_config):
+    client = NodeClient(spool_config)
+    client.client.post = MagicMock(side_effect=Exception("Server down"))
+
+    client.submit_results([{"id": "1", "status": "COMPLETED"}])
+    assert len(client.spool) == 1
+    first_delay = client._spool_delay
+    assert first_delay > 0
+
+    # Still backing off: no request is made
+    client.submit_results([{"id": "2", "status": "COMPLETED"}])
+    assert client.client.post.call_count == 1
+    assert len(client.spool) == 2
+
+    # Backoff elapsed but the server is still down: the delay doubles
+    client._spool_retry_at = 0
+    client.flush_spool()
+    assert client._spool_delay == 2 * first_delay
+
+    client.client.post = MagicMock()
+    client._spool_retry_at = 0
+    assert client.flush_spool() is True
+    client.client.post.assert_called_once_with(
+        "/internal/queue/submit",
+        json=[{"id": "1", "status": "COMPLETED"}, {"id": "2", "status": "COMPLETED"}],
+        headers=client.headers
+    )
+    assert len(client.spool) == 0
+    assert client._spool_delay == 0
+
+def test_spool_replayed_on_restart(spool_config):
+    client = NodeClient(spool_config)
+    client.client.post = MagicMock(side_effect=Exception("Server down"))
+    client.submit_results([{"id": "1", "status": "COMPLETED"}])
+    client.spool.close()
+
+    restarted = NodeClient(spool_config)
+    assert len(restarted.spool) == 1
+    restarted.client.post = MagicMock()
+    restarted.fetch_jobs = MagicMock(return_value=[])
+
+    # An idle run_once still flushes the backlog
+    assert restarted.run_once() == 0
+    restarted.client.post.assert_called_once()
+    assert len(restarted.spool) == 0
+
+@pytest.mark.asyncio
+async def test_run_async_spool_flushes_and_replays(spool_config):
+    spool_config.worker.submit_batch_size = 2
+    client = NodeClient(spool_config)
+    client.spool.append([{"id": "old", "status": "COMPLETED"}])
+    log = _fake_queue(client, 3)
+    posted = []
+
+    async def post(path, json=None, headers=None):
+        posted.extend(r["id"] for r in json)
+        return MagicMock(status_code=200)
+
+    # Spooled results bypass asubmit_results and go out through aflush_spool
+    async def patched_flush():
+        client.aclient = MagicMock(post=post)
+        return await NodeClient.aflush_spool(client)
+    client.aflush_spool = patched_flush
+
+    processed = await client.run_async(drain=True)
+
+    assert processed == 3
+    assert sorted(posted) == ["j0", "j1", "j2", "old"]
+    assert log["submits"] == []
+    assert len(client.spool) == 0
+
+@pytest.mark.asyncio
+async def test_run_async_drain_leaves_backlog_when_server_down(spool_config):
+    client = NodeClient(spool_config)
+    _fake_queue(client, 2)
+
+    async def patched_flush():
+        client.aclient = MagicMock(post=AsyncMock(side_effect=Exception("Server down")))
+        return await NodeClient.aflush_spool(client)
+    client.aflush_spool = patched_flush
+
+    spool_config.worker.max_concurrency = 2
+    processed = await client.run_async(drain=True)
+
+    assert processed == 2
+    assert len(client.spool) == 2
+    assert client._spool_delay > 0
+
+@pytest.fixture
+def backends_config():
+    return NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        backends=[
+            BackendConfig(port=8001, max_concurrency=2),
+            BackendConfig(port=8002, max_concurrency=2),
+        ]
+    )
+
+@patch("openbeepboop.node.worker.completion")
+def test_process_job_routes_to_backend(mock_completion, backends_config):
+    client = NodeClient(backends_config)
+    mock_completion.return_value = MagicMock(model_dump=lambda: {})
+
+    client.process_job({"id": "j1", "request_payload": {"model": "m", "messages": []}})
+    client.process_job({"id": "j2", "request_payload": {"model": "m", "messages": []}})
+
+    bases = [c.kwargs["api_base"] for c in mock_completion.call_args_list]
+    assert sorted(bases) == ["http://localhost:8001/v1", "http://localhost:8002/v1"]
+    assert all(b.in_flight == 0 for b in client.backends.backends)
+    assert client._uses_async_engine() # 4 slots across backends
+    assert client.metrics()["concurrency_limit"] == 4
+
+@patch("openbeepboop.node.worker.completion")
+def test_process_job_backend_failures_eject(mock_completion, backends_config):
+    backends_config.backends = backends_config.backends[:1]
+    client = NodeClient(backends_config)
+    mock_completion.side_effect = Exception("Connection refused")
+
+    for i in range(3):
+        client.process_job({"id": f"j{i}", "request_payload": {"messages": []}})
+
+    result = client.process_job({"id": "j4", "request_payload": {"messages": []}})
+    assert result["status"] == JobStatus.FAILED.value
+    assert "busy or ejected" in result["error"]
+    assert client.metrics()["backends"][0]["ejected"] is True
+
+@pytest.mark.asyncio
+@patch("openbeepboop.node.worker.acompletion")
+async def test_run_async_spreads_across_backends(mock_acompletion, backends_config):
+    client = NodeClient(backends_config)
+    client.backends.run_health_checks = AsyncMock()
+    queue = [{"id": f"j{i}", "request_payload": {"messages": []}} for i in range(8)]
+
+    async def afetch_jobs(limit=1, max_tokens=None):
+        taken = queue[:limit]
+        del queue[:limit]
+        return taken
+
+    async def asubmit_results(results):
+        pass
+
+    peak = {}
+
+    async def fake_acompletion(**kwargs):
+        in_flight = {b.name: b.in_flight for b in client.backends.backends}
+        for name, count in in_flight.items():
+            peak[name] = max(peak.get(name, 0), count)
+        await asyncio.sleep(0.005)
+        return MagicMock(model_dump=lambda: {})
+
+    mock_acompletion.side_effect = fake_acompletion
+    client.afetch_jobs = afetch_jobs
+    client.asubmit_results = asubmit_results
+
+    assert await client.run_async(drain=True) == 8
+    assert peak == {"localhost:8001": 2, "localhost:8002": 2}
+    client.backends.run_health_checks.assert_called_once_with(backends_config.worker.health_check_interval)
+
+def test_job_tokens_prefers_server_estimate(node_config):
+    client = NodeClient(node_config)
+    payload = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 50}
+
+    assert client.job_tokens({"request_payload": payload, "est_tokens": 7}) == 7
+    # Older servers don't send estimates: 4 message tokens + 100 content tokens + completion
+    assert client.job_tokens({"request_payload": payload}) == 154
+
+@patch("openbeepboop.node.worker.token_counter")
+def test_job_tokens_litellm_tokenizer(mock_counter):
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(tokenizer="litellm")
+    )
+    client = NodeClient(config)
+    mock_counter.return_value = 42
+
+    job = {"request_payload": {"model": "m", "messages": [], "max_tokens": 8}, "est_tokens": 7}
+    assert client.job_tokens(job) == 50
+    mock_counter.assert_called_once_with(model="m", messages=[])
+
+@pytest.mark.asyncio
+async def test_run_async_token_budget():
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(max_concurrency=8, token_budget=300)
+    )
+    client = NodeClient(config)
+    log = _fake_queue(client, 10, duration=0.005, tokens=100)
+
+    processed = await client.run_async(drain=True)
+
+    assert processed == 10
+    # Slots allow 8 jobs, but only 3 fit the budget at once
+    assert log["peak_tokens"] == 300
+    assert client.metrics()["tokens_in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_run_async_oversized_job_runs_alone():
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(max_concurrency=4, token_budget=50)
+    )
+    client = NodeClient(config)
+    log = _fake_queue(client, 3, tokens=100)
+
+    assert await client.run_async(drain=True) == 3
+    assert log["peak_tokens"] == 100
+
+def test_group_by_prefix_fetch_and_buffer_order():
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        worker=WorkerConfig(group_by_prefix=True)
+    )
+    client = NodeClient(config)
+    assert client._fetch_body(4) == {"limit": 4, "group_by_prefix": True}
+
+    buffer = deque()
+    for job_id, fingerprint in [("j1", "a"), ("j2", "b"), ("j3", None), ("j4", "a"), ("j5", "b")]:
+        client._buffer_job(buffer, ({"id": job_id, "prefix_fp": fingerprint}, 0.0, 1))
+
+    assert [entry[0]["id"] for entry in buffer] == ["j1", "j4", "j2", "j5", "j3"]
+
+@patch("openbeepboop.node.worker.completion")
+def test_model_affinity_reports_warm_models(mock_completion, backends_config):
+    backends_config.worker.model_affinity = True
+    client = NodeClient(backends_config)
+    mock_completion.return_value = {"choices": []}
+    assert client._fetch_body(2) == {"limit": 2, "warm_models": []}
+
+    client.process_job({"id": "j1", "request_payload": {"model": "llama3-70b", "messages": []}})
+    client.process_job({"id": "j2", "request_payload": {"model": "qwen2-7b", "messages": []}})
+
+    assert client._fetch_body(2)["warm_models"] == ["llama3-70b", "qwen2-7b"]
+
+def test_node_report(backends_config):
+    backends_config.worker.model_affinity = True
+    client = NodeClient(backends_config)
+
+    report = client.node_report()
+    assert report["concurrency"] == client.backends.capacity
+    assert report["models"] == [] # backends serve any model
+    assert report["throughput"] is None
+    assert report["warm_models"] == []
+
+    client._record_outcome({"id": "j1", "status": "COMPLETED"}, 2.0)
+    client._reported_at -= 10
+    report = client.node_report()
+    assert report["job_seconds"] == 2.0
+    assert 0 < report["throughput"] <= 0.1
+
+def test_register_and_heartbeat(node_config):
+    client = NodeClient(node_config)
+    client.client = MagicMock()
+
+    assert client.register() is True
+    path = client.client.post.call_args[0][0]
+    assert path == "/internal/nodes/register"
+    assert client._heartbeat_due() is False
+
+    client.client.post.side_effect = Exception("Connection error")
+    assert client.heartbeat() is False # logs, doesn't raise
+
+@pytest.mark.asyncio
+async def test_run_async_registers_and_heartbeats(concurrent_config):
+    concurrent_config.worker.heartbeat_interval = 0.01
+    client = NodeClient(concurrent_config)
+    _fake_queue(client, 8, duration=0.01)
+    reports = []
+
+    async def areport(path):
+        reports.append(path)
+        return True
+
+    client._areport = areport
+    await client.run_async(drain=True)
+
+    assert reports[0] == "/internal/nodes/register"
+    assert "/internal/nodes/heartbeat" in reports[1:]
+
+def _rate_limit_error(retry_after=None):
+    error = Exception("Rate limit exceeded")
+    error.status_code = 429
+    error.headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return error
+
+@patch("openbeepboop.node.ratelimit.time.sleep")
+@patch("openbeepboop.node.worker.completion")
+def test_process_job_retries_after_429(mock_completion, mock_sleep, node_config):
+    client = NodeClient(node_config)
+    mock_completion.side_effect = [_rate_limit_error("0.5"), {"choices": []}]
+
+    result = client.process_job({"id": "job-1", "request_payload": {"model": "gpt-test", "messages": []}})
+
+    assert result["status"] == JobStatus.COMPLETED.value
+    assert mock_completion.call_count == 2
+    # Held back for the provider's Retry-After before trying again
+    assert 0 < mock_sleep.call_args_list[0][0][0] <= 0.5
+
+@patch("openbeepboop.node.ratelimit.time.sleep")
+@patch("openbeepboop.node.worker.completion")
+def test_process_job_released_after_429_retries(mock_completion, mock_sleep, node_config):
+    node_config.worker.rate_limit_retries = 1
+    client = NodeClient(node_config)
+    client.client = MagicMock()
+    mock_completion.side_effect = _rate_limit_error()
+
+    assert client.process_job({"id": "job-1", "request_payload": {"messages": []}}) is None
+    assert mock_completion.call_count == 2
+    client.client.post.assert_called_once_with("/internal/queue/release", json={"ids": ["job-1"]}, headers=client.headers)
+
+def test_run_once_skips_released_jobs(adaptive_config):
+    client = NodeClient(adaptive_config)
+    client.fetch_jobs = MagicMock(return_value=[{"id": "j1"}])
+    client.process_job = MagicMock(return_value=None)
+    client.submit_results = MagicMock()
+
+    assert client.run_once() == 1
+    client.submit_results.assert_called_once_with([])
+    assert client.controller.throttled == 1
+
+@pytest.mark.asyncio
+@patch("openbeepboop.node.worker.acompletion")
+async def test_aprocess_job_waits_for_rate_limit_budget(mock_acompletion):
+    config = NodeConfig(
+        server=ServerConfig(url="http://testserver", api_key="sk-test"),
+        rate_limits=[RateLimitConfig(model="openai", rpm=60)]
+    )
+    client = NodeClient(config)
+    mock_acompletion.return_value = {"choices": []}
+    job = {"id": "j1", "request_payload": {"model": "openai/gpt-4o", "messages": []}}
+
+    # Spend the whole budget; the next job must wait for the bucket to refill
+    client.rate_limiter.reserve("openai/gpt-4o-mini", 1)
+    client.rate_limiter._get("openai").requests.level = 0
+    assert client.rate_limiter.delay("openai/gpt-4o", 1) > 0.9
+
+    with patch("openbeepboop.node.ratelimit.asyncio.sleep", new=AsyncMock()) as mock_sleep:
+        mock_sleep.side_effect = lambda seconds: client.rate_limiter._get("openai").requests.refund(60)
+        result = await client.aprocess_job(job)
+
+    assert result["status"] == JobStatus.COMPLETED.value
+    mock_sleep.assert_called_once()
+    assert client.metrics()["rate_limits"][0]["key"] == "openai"
+
+def test_failed_result_retryable(node_config):
+    client = NodeClient(node_config)
+    job = {"id": "j1"}
+
+    def error(status_code=None):
+        e = Exception("boom")
+        if status_code is not None:
+            e.status_code = status_code
+        return e
+
+    assert client._failed(job, error())["retryable"] is True
+    assert client._failed(job, error(503))["retryable"] is True
+    assert client._failed(job, error(408))["retryable"] is True
+    assert client._failed(job, error(400))["retryable"] is False
+
+@pytest.mark.asyncio
+async def test_run_async_cancels_jobs_the_server_revokes(concurrent_config):
+    client = NodeClient(concurrent_config)
+    log = _fake_queue(client, 1, duration=30)
+    client._areport = AsyncMock(return_value=True)
+    response = MagicMock()
+    response.json.return_value = {"status": "ok", "cancel": ["j0"]}
+    run_job = client.aprocess_job
+
+    async def aprocess_job(job):
+        # Delivered mid-run, e.g. on a heartbeat after another node won a hedged race
+        asyncio.get_running_loop().call_later(0.01, client._note_cancellations, response)
+        return await run_job(job)
+
+    client.aprocess_job = aprocess_job
+    processed = await asyncio.wait_for(client.run_async(drain=True), timeout=5)
+
+    assert processed == 0
+    assert log["submits"] == []
+
+def test_fetch_jobs_notes_cancel_header(node_config):
+    client = NodeClient(node_config)
+    client.client = MagicMock()
+    client.client.post.return_value = MagicMock(headers={"X-Cancel-Jobs": "j1,j2"}, json=lambda: [])
+
+    client.fetch_jobs(limit=1)
+
+    assert client._cancelled == {"j1", "j2"}
+
+def _embedding_job(job_id, inputs, model="embed"):
+    return {"id": job_id, "kind": "embedding", "request_payload": {"model": model, "input": inputs}, "est_tokens": 10}
+
+def _embedding_response(**kwargs):
+    return {"model": kwargs["model"], "data": [{"index": i, "embedding": [float(i)]} for i in range(len(kwargs["input"]))]}
+
+@patch("openbeepboop.node.worker.embedding")
+def test_run_once_batches_embedding_jobs(mock_embedding, node_config):
+    node_config.worker.embedding_batch_size = 3
+    client = NodeClient(node_config)
+    client.fetch_jobs = MagicMock(return_value=[
+        _embedding_job("e1", "a"), _embedding_job("e2", ["b", "c"]),
+        _embedding_job("e3", "d"), _embedding_job("o1", "x", model="other"),
+    ])
+    client.submit_results = MagicMock()
+    mock_embedding.side_effect = _embedding_response
+
+    assert client.run_once() == 4
+
+    # e1+e2 fill the 3-input batch; e3 and the other model get calls of their own
+    assert [call.kwargs["input"] for call in mock_embedding.call_args_list] == [["a", "b", "c"], ["d"], ["x"]]
+    results = client.submit_results.call_args[0][0]
+    assert [result["id"] for result in results] == ["e1", "e2", "e3", "o1"]
+    assert all(result["status"] == "COMPLETED" and result["vectors"] for result in results)
+
+@pytest.mark.asyncio
+@patch("openbeepboop.node.worker.aembedding", new_callable=AsyncMock)
+async def test_run_async_batches_embedding_jobs(mock_aembedding, concurrent_config):
+    concurrent_config.worker.max_concurrency = 1
+    concurrent_config.worker.prefetch = 8
+    client = NodeClient(concurrent_config)
+    client._areport = AsyncMock(return_value=True)
+    jobs = [_embedding_job(f"e{i}", f"text {i}") for i in range(5)]
+
+    async def afetch_jobs(limit=1, max_tokens=None):
+        taken = jobs[:limit]
+        del jobs[:limit]
+        return taken
+
+    client.afetch_jobs = afetch_jobs
+    submitted = []
+
+    async def asubmit_results(results):
+        submitted.extend(results)
+
+    client.asubmit_results = asubmit_results
+    mock_aembedding.side_effect = _embedding_response
+
+    processed = await client.run_async(drain=True, idle_sleep=0.01)
+
+    assert processed == 5
+    assert mock_aembedding.call_count == 1
+    assert sorted(result["id"] for result in submitted) == [f"e{i}" for i in range(5)]
+
+@patch("openbeepboop.node.worker.embedding")
+def test_embedding_batch_failure_fails_each_job(mock_embedding, node_config):
+    client = NodeClient(node_config)
+    error = Exception("Bad request")
+    error.status_code = 400
+    mock_embedding.side_effect = error
+
+    results = client.process_embeddings([_embedding_job("e1", "a"), _embedding_job("e2", "b")])
+
+    assert [(result["id"], result["status"], result["retryable"]) for result in results] == [
+        ("e1", "FAILED", False), ("e2", "FAILED", False)
+    ]
+
+@pytest.mark.asyncio
+@patch("openbeepboop.node.worker.aembedding", new_callable=AsyncMock)
+async def test_run_async_cancels_embedding_batch_once_all_jobs_are_revoked(mock_aembedding, concurrent_config):
+    concurrent_config.worker.prefetch = 4
+    client = NodeClient(concurrent_config)
+    client._areport = AsyncMock(return_value=True)
+    jobs = [_embedding_job("e0", "a"), _embedding_job("e1", "b")]
+
+    async def afetch_jobs(limit=1, max_tokens=None):
+        taken = jobs[:limit]
+        del jobs[:limit]
+        return taken
+
+    client.afetch_jobs = afetch_jobs
+    client.asubmit_results = AsyncMock()
+
+    def revoke(job_id):
+        response = MagicMock()
+        response.json.return_value = {"status": "ok", "cancel": [job_id]}
+        client._note_cancellations(response)
+
+    async def aembedding(**kwargs):
+        # The batch's jobs are revoked one at a time
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, revoke, "e0")
+        loop.call_later(0.05, revoke, "e1")
+        await asyncio.sleep(30)
+
+    mock_aembedding.side_effect = aembedding
+    processed = await asyncio.wait_for(client.run_async(drain=True, idle_sleep=0.01), timeout=5)
+
+    assert processed == 0
+    client.asubmit_results.assert_not_awaited()
@@ -0,0 +1,113 @@
+import pytest
+import asyncio
+import httpx
+from openbeepboop.node.backends import BackendPool, NoBackendError, EJECT_AFTER_FAILURES
+from openbeepboop.common.config import BackendConfig
+
+@pytest.fixture
+def pool():
+    return BackendPool([
+        BackendConfig(port=8001, models=["llama3"], max_concurrency=2),
+        BackendConfig(port=8002, models=["llama3", "qwen"], max_concurrency=2),
+        BackendConfig(host="gpu-box", port=8003, models=["qwen"], max_concurrency=1),
+    ], eject_seconds=30.0)
+
+def test_capacity_and_api_base(pool):
+    assert pool.capacity == 5
+    assert pool.backends[2].api_base == "http://gpu-box:8003/v1"
+    assert pool.backends[0].api_key == "sk-dummy"
+
+def test_select_least_loaded(pool):
+    first = pool.select("llama3")
+    second = pool.select("llama3")
+    # Spread across both llama3 servers before doubling up
+    assert {first.name, second.name} == {"localhost:8001", "localhost:8002"}
+
+    third = pool.select("llama3")
+    fourth = pool.select("llama3")
+    assert third.load == 1.0 and fourth.load == 1.0
+
+    # Both llama3 servers are full
+    assert pool.select("llama3") is None
+
+    pool.release(first)
+    assert pool.select("llama3") is first
+
+def test_select_unknown_model(pool):
+    with pytest.raises(NoBackendError):
+        pool.select("gpt-4")
+
+def test_any_model_backend():
+    pool = BackendPool([BackendConfig(port=8001)])
+    assert pool.select("anything") is not None
+
+def test_ejection_after_consecutive_failures(pool):
+    backend = pool.backends[2]
+    pool.backends[1].in_flight = 2 # keep the shared qwen server busy for now
+    for _ in range(EJECT_AFTER_FAILURES - 1):
+        assert pool.select("qwen") is backend
+        pool.release(backend, ok=False)
+    assert backend.ejected_until == 0
+
+    pool.select("qwen")
+    pool.release(backend, ok=False)
+    assert backend.ejected_until > 0
+
+    # Ejected and the other qwen server is full
+    assert pool.select("qwen") is None
+    pool.backends[1].in_flight = 0
+    assert pool.select("qwen").name == "localhost:8002"
+
+    pool.readmit(backend)
+    assert pool.select("qwen") is backend
+
+def test_success_resets_failures(pool):
+    backend = pool.backends[2]
+    pool.backends[1].in_flight = 2
+    pool.select("qwen")
+    pool.release(backend, ok=False)
+    pool.select("qwen")
+    pool.release(backend, ok=True)
+    assert backend.failures == 0
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_release(pool):
+    only_qwen = pool.backends[2]
+    pool.backends[1].in_flight = 2 # the shared server is full
+
+    held = await pool.acquire("qwen")
+    assert held is only_qwen
+
+    waiter = asyncio.create_task(pool.acquire("qwen"))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    await pool.arelease(held)
+    assert await asyncio.wait_for(waiter, timeout=1) is only_qwen
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_ejection_to_expire(pool):
+    pool.eject_seconds = 0.05
+    for backend in pool.backends:
+        pool.eject(backend, "test")
+
+    backend = await asyncio.wait_for(pool.acquire("qwen"), timeout=1)
+    assert backend.serves("qwen")
+
+@pytest.mark.asyncio
+async def test_health_check_ejects_and_readmits(pool):
+    down = {"localhost:8002"}
+
+    def handler(request):
+        if f"{request.url.host}:{request.url.port}" in down:
+            return httpx.Response(503)
+        assert request.url.path == "/v1/models"
+        return httpx.Response(200, json={"data": []})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await pool.check(client)
+        assert [m["ejected"] for m in pool.metrics()] == [False, True, False]
+
+        down.clear()
+        await pool.check(client)
+        assert [m["ejected"] for m in pool.metrics()] == [False, False, False]
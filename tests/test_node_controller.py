@@ -0,0 +1,103 @@
+import pytest
+from openbeepboop.node.controller import AdaptiveController
+
+def test_slow_start_grows_per_success():
+    c = AdaptiveController(minimum=1, maximum=8)
+    assert c.concurrency == 1
+
+    for _ in range(3):
+        c.record(0.1)
+
+    assert c.concurrency == 4
+    assert c.increases == 3
+    assert c.last_decision == "increase"
+
+def test_never_exceeds_bounds():
+    c = AdaptiveController(minimum=2, maximum=4)
+    assert c.concurrency == 2
+
+    for _ in range(50):
+        c.record(0.1)
+    assert c.concurrency == 4
+
+    for _ in range(50):
+        c.record(0.1, failed=True, throttled=True)
+    assert c.concurrency == 2
+
+def test_throttle_halves_once_per_round():
+    c = AdaptiveController(minimum=1, maximum=64)
+    c.limit = 32.0
+
+    # A burst of 429s from the same overload only cuts once
+    for _ in range(5):
+        c.record(0.1, failed=True, throttled=True)
+
+    assert c.concurrency == 16
+    assert c.decreases == 1
+    assert c.throttled == 5
+    assert c.last_decision == "rate limited"
+
+def test_additive_increase_after_cut():
+    c = AdaptiveController(minimum=1, maximum=64)
+    c.limit = 8.0
+    c.record(0.1, throttled=True)
+    assert c.concurrency == 4
+
+    # Roughly one slot per round of `limit` successes, no longer doubling
+    for _ in range(4):
+        c.record(0.1)
+    assert c.concurrency == 4
+    for _ in range(4):
+        c.record(0.1)
+    assert c.concurrency == 5
+
+def test_latency_target_backs_off():
+    c = AdaptiveController(minimum=1, maximum=16, target_latency=1.0)
+    c.limit = 8.0
+
+    c.record(5.0)
+
+    assert c.concurrency == 4
+    assert c.last_decision == "latency above target"
+
+def test_error_rate_backs_off():
+    c = AdaptiveController(minimum=1, maximum=16, error_threshold=0.3)
+    c.limit = 8.0
+
+    c.record(0.1, failed=True)
+    assert c.concurrency == 8 # single failure stays under the threshold
+    c.record(0.1, failed=True)
+
+    assert c.concurrency == 4
+    assert c.last_decision == "error rate"
+
+def test_empty_queue_stops_growth_and_caps_fetch():
+    c = AdaptiveController(minimum=1, maximum=16)
+    c.observe_queue_depth(0)
+
+    for _ in range(5):
+        c.record(0.1)
+    assert c.concurrency == 1
+
+    # Always probe for at least one job
+    assert c.fetch_size(10) == 1
+
+    c.observe_queue_depth(3)
+    assert c.fetch_size(10) == 3
+    assert c.fetch_size(2) == 2
+    assert c.fetch_size(0) == 0
+
+    c.observe_queue_depth(None) # missing header leaves the last reading
+    assert c.queue_depth == 3
+
+def test_metrics_snapshot():
+    c = AdaptiveController(minimum=1, maximum=4)
+    c.observe_queue_depth(7)
+    c.record(0.5)
+
+    m = c.metrics()
+    assert m["concurrency_limit"] == 2
+    assert m["queue_depth"] == 7
+    assert m["latency_seconds"] == 0.5
+    assert m["completed"] == 1
+    assert m["increases"] == 1
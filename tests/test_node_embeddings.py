@@ -0,0 +1,40 @@
+import pytest
+from openbeepboop.common.vectors import decode_vectors, unpack_vectors, encode_vectors
+from openbeepboop.node.embeddings import batch_key, batch_inputs, split_response, is_embedding
+
+def _job(job_id, inputs, model="embed", **params):
+    return {"id": job_id, "kind": "embedding", "request_payload": {"model": model, "input": inputs, **params}}
+
+def test_batch_key_ignores_per_job_fields():
+    assert batch_key(_job("a", "x")) == batch_key(_job("b", ["y", "z"], encoding_format="base64"))
+    assert batch_key(_job("a", "x")) != batch_key(_job("b", "x", model="other"))
+    assert batch_key(_job("a", "x")) != batch_key(_job("b", "x", dimensions=256))
+    assert is_embedding(_job("a", "x"))
+    assert not is_embedding({"id": "c", "request_payload": {}})
+
+def test_split_response_fans_out_in_input_order():
+    jobs = [_job("a", "x"), _job("b", ["y", "z"])]
+    assert batch_inputs(jobs) == ["x", "y", "z"]
+    response = {
+        "model": "embed",
+        # Out of order, one vector already base64-packed by the provider
+        "data": [
+            {"index": 2, "embedding": [3.0, 3.5]},
+            {"index": 0, "embedding": [1.0, 1.5]},
+            {"index": 1, "embedding": encode_vectors([[2.0, 2.5]])},
+        ],
+        "usage": {"prompt_tokens": 30, "total_tokens": 30},
+    }
+
+    first, second = split_response(jobs, response, tokens=[1, 2])
+
+    assert first["id"] == "a" and first["status"] == "COMPLETED"
+    assert unpack_vectors(decode_vectors(first["vectors"]), 1) == [[1.0, 1.5]]
+    assert unpack_vectors(decode_vectors(second["vectors"]), 2) == [[2.0, 2.5], [3.0, 3.5]]
+    assert second["result"]["data"] == [{"object": "embedding", "index": 0}, {"object": "embedding", "index": 1}]
+    assert first["result"]["usage"]["prompt_tokens"] == 10
+    assert second["result"]["usage"]["prompt_tokens"] == 20
+
+def test_split_response_count_mismatch():
+    with pytest.raises(ValueError):
+        split_response([_job("a", ["x", "y"])], {"data": [{"index": 0, "embedding": [1.0]}]}, tokens=[1])
@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import patch
+from openbeepboop.common.config import RateLimitConfig
+from openbeepboop.node.ratelimit import RateLimiter, TokenBucket, response_headers, THROTTLE_BACKOFF_INITIAL
+
+def test_token_bucket_refill():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+    bucket.take(60, start)
+    assert bucket.wait_time(30, start) == pytest.approx(30.0)
+    assert bucket.wait_time(30, start + 30) == 0.0
+    # Larger than the bucket: wait for a full one rather than forever
+    assert bucket.wait_time(600, start + 30) == pytest.approx(30.0)
+
+def test_most_specific_config_wins():
+    limiter = RateLimiter([
+        RateLimitConfig(model="*", rpm=1000),
+        RateLimitConfig(model="openai", rpm=100, tpm=1000),
+        RateLimitConfig(model="openai/gpt-4o", tpm=500),
+    ])
+    limiter.reserve("openai/gpt-4o", 500)
+    assert limiter.delay("openai/gpt-4o", 1) > 0
+    # Other OpenAI models share the provider budget, not gpt-4o's
+    assert limiter.delay("openai/gpt-4o-mini", 1000) == 0
+    assert limiter.delay("anthropic/claude", 1) == 0
+    assert {entry["key"] for entry in limiter.metrics()} == {"openai/gpt-4o", "openai", "*"}
+
+def test_tokens_refunded_and_headers_learned():
+    limiter = RateLimiter([RateLimitConfig(model="m", tpm=1000)])
+    limiter.reserve("m", 800)
+    limiter.succeeded("m", 800, 300, {})
+    assert limiter.delay("m", 700) == 0
+    assert limiter.delay("m", 800) > 0
+
+    # Unconfigured models pick up limits from provider headers
+    headers = {"llm_provider-x-ratelimit-limit-requests": "60", "llm_provider-x-ratelimit-remaining-requests": "0"}
+    limiter.succeeded("other", 0, None, headers)
+    assert limiter.delay("other", 1) > 0.9
+
+def test_throttle_backoff_and_retry_after():
+    limiter = RateLimiter([])
+    assert limiter.throttled("m", {}) == THROTTLE_BACKOFF_INITIAL
+    assert limiter.throttled("m", {}) == THROTTLE_BACKOFF_INITIAL * 2
+    assert limiter.delay("m", 1) > THROTTLE_BACKOFF_INITIAL
+    assert limiter.throttled("n", {"retry-after": "7"}) == 7
+
+    limiter.succeeded("m", 0, None, {})
+    assert limiter.throttled("m", {}) == THROTTLE_BACKOFF_INITIAL
+
+def test_response_headers():
+    class Response:
+        _hidden_params = {"additional_headers": {"x-ratelimit-remaining-tokens": "5"}}
+
+    class Error(Exception):
+        headers = {"retry-after": "1"}
+
+    assert response_headers(Response())["x-ratelimit-remaining-tokens"] == "5"
+    assert response_headers(Error())["retry-after"] == "1"
+    assert response_headers({"choices": []}) == {}
+
+@patch("openbeepboop.node.ratelimit.time.sleep")
+def test_acquire_sleeps_until_budget(mock_sleep):
+    limiter = RateLimiter([RateLimitConfig(model="m", rpm=60)])
+    limiter.reserve("m", 1)
+    limiter._get("m").requests.level = 0
+    mock_sleep.side_effect = lambda seconds: limiter._get("m").requests.refund(1)
+
+    limiter.acquire("m", 1)
+    mock_sleep.assert_called_once()
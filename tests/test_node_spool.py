@@ -0,0 +1,93 @@
+import pytest
+from openbeepboop.node import spool as spool_module
+from openbeepboop.node.spool import ResultSpool
+import json
+import os
+import tempfile
+
+@pytest.fixture
+def spool_path():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "nested", "results.spool")
+
+def _lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_append_and_ack(spool_path):
+    spool = ResultSpool(spool_path)
+    spool.append([{"id": "1", "status": "COMPLETED"}, {"id": "2", "status": "FAILED"}])
+
+    assert len(spool) == 2
+    assert [r["id"] for r in spool.pending()] == ["1", "2"]
+    assert [r["id"] for r in spool.pending(limit=1)] == ["1"]
+
+    spool.ack(["1", "unknown"])
+    assert [r["id"] for r in spool.pending()] == ["2"]
+    assert _lines(spool_path)[-1] == {"op": "ack", "ids": ["1"]}
+    spool.close()
+
+def test_replay_after_restart(spool_path):
+    spool = ResultSpool(spool_path)
+    spool.append([{"id": "1", "status": "COMPLETED"}, {"id": "2", "status": "COMPLETED"}])
+    spool.ack(["1"])
+    spool.append([{"id": "3", "status": "COMPLETED"}])
+    spool.close()
+
+    # Simulate a crash mid-write
+    with open(spool_path, "a") as f:
+        f.write('{"op": "put", "resu')
+
+    reopened = ResultSpool(spool_path)
+    assert [r["id"] for r in reopened.pending()] == ["2", "3"]
+    reopened.close()
+
+def test_ack_everything_truncates(spool_path):
+    spool = ResultSpool(spool_path)
+    spool.append([{"id": "1", "status": "COMPLETED"}])
+    spool.ack(["1"])
+
+    assert len(spool) == 0
+    assert os.path.getsize(spool_path) == 0
+
+    # Still usable after compaction
+    spool.append([{"id": "2", "status": "COMPLETED"}])
+    spool.close()
+    assert [r["result"]["id"] for r in _lines(spool_path)] == ["2"]
+
+def test_compaction_drops_dead_lines(spool_path, monkeypatch):
+    monkeypatch.setattr(spool_module, "COMPACT_MIN_DEAD_LINES", 4)
+    spool = ResultSpool(spool_path)
+    spool.append([{"id": str(i), "status": "COMPLETED"} for i in range(4)])
+
+    spool.ack(["0"])
+    assert len(_lines(spool_path)) == 5
+    spool.ack(["1", "2"])
+
+    # 3 acked puts + 2 ack records reached the threshold and outnumber the 1 live entry
+    assert _lines(spool_path) == [{"op": "put", "result": {"id": "3", "status": "COMPLETED"}}]
+    spool.close()
+
+def test_latest_result_for_a_job_wins(spool_path):
+    spool = ResultSpool(spool_path, fsync=False)
+    spool.append([{"id": "1", "status": "FAILED"}])
+    spool.append([{"id": "1", "status": "COMPLETED"}])
+    assert spool.pending() == [{"id": "1", "status": "COMPLETED"}]
+    spool.close()
+
+    reopened = ResultSpool(spool_path)
+    assert reopened.pending() == [{"id": "1", "status": "COMPLETED"}]
+    reopened.close()
+
+def test_append_after_torn_line_survives_restart(spool_path):
+    spool = ResultSpool(spool_path)
+    spool.append([{"id": "a", "status": "COMPLETED"}])
+    spool.close()
+    with open(spool_path, "a") as f:
+        f.write('{"op": "put", "result": {"id": "b"')
+
+    reopened = ResultSpool(spool_path)
+    reopened.append([{"id": "c", "status": "COMPLETED"}])
+    reopened.close()
+
+    assert [r["id"] for r in ResultSpool(spool_path).pending()] == ["a", "c"]
@@ -1,12 +1,14 @@
 import pytest
 from openbeepboop.common.db import init_db
 from openbeepboop.common.models import JobStatus
+from openbeepboop.common.config import ServerSettings
 from openbeepboop.client.client import Client
 import os
 import shutil
 import tempfile
 import sqlite3
 import hashlib
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
 # We will test the API directly using TestClient from FastAPI
@@ -126,3 +128,623 @@ def test_submit_results(client):
     data = poll_resp.json()
     assert data["jobs"][0]["status"] == "COMPLETED"
     assert data["jobs"][0]["result"]["choices"][0]["message"]["content"] == "Hi"
+
+def test_fetch_jobs_reports_queue_depth(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    for _ in range(3):
+        client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers)
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    response = client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers)
+    assert len(response.json()) == 1
+    assert response.headers["X-Queue-Depth"] == "2"
+
+    response = client.post("/internal/queue/fetch", json={"limit": 5}, headers=node_headers)
+    assert len(response.json()) == 2
+    assert response.headers["X-Queue-Depth"] == "0"
+
+def test_submit_results_idempotent(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    job_id = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers)
+
+    first = {"id": job_id, "status": "COMPLETED", "result": {"n": 1}}
+    response = client.post("/internal/queue/submit", json=[first], headers=node_headers)
+    assert response.json()["ignored"] == []
+
+    # A replayed (or late) result does not overwrite the first one
+    replay = {"id": job_id, "status": "FAILED", "error": "late"}
+    response = client.post("/internal/queue/submit", json=[replay], headers=node_headers)
+    assert response.status_code == 200
+    assert response.json()["ignored"] == [job_id]
+
+    data = client.post("/v1/results/poll", json={"ids": [job_id]}, headers=headers).json()
+    assert data["jobs"][0]["status"] == "COMPLETED"
+    assert data["jobs"][0]["result"] == {"n": 1}
+
+def test_fetch_jobs_token_budget(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    for size in (400, 400, 4000):
+        payload = {"model": "m", "messages": [{"role": "user", "content": "x" * size}], "max_tokens": 100}
+        client.post("/v1/chat/completions", json=payload, headers=headers)
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    # Each small job is ~204 tokens, so two of them fit but not the large one
+    jobs = client.post("/internal/queue/fetch", json={"limit": 5, "max_tokens": 500}, headers=node_headers).json()
+    assert len(jobs) == 2
+    assert all(job["est_tokens"] == 204 for job in jobs)
+
+    # A job bigger than the budget is still handed out on its own
+    jobs = client.post("/internal/queue/fetch", json={"limit": 5, "max_tokens": 500}, headers=node_headers).json()
+    assert len(jobs) == 1
+    assert jobs[0]["est_tokens"] == 1104
+
+def _chat(system, user, model="m"):
+    return {"model": model, "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}]}
+
+def test_fetch_jobs_group_by_prefix(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    ids = []
+    for system in ("A", "B", "A", "B", "A"):
+        ids.append(client.post("/v1/chat/completions", json=_chat(system, "q"), headers=headers).json()["id"])
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    jobs = client.post("/internal/queue/fetch", json={"limit": 3, "group_by_prefix": True}, headers=node_headers).json()
+
+    # The oldest job's prefix group is claimed ahead of older jobs with other prefixes
+    assert [job["id"] for job in jobs] == [ids[0], ids[2], ids[4]]
+    assert len({job["prefix_fp"] for job in jobs}) == 1
+
+    jobs = client.post("/internal/queue/fetch", json={"limit": 3}, headers=node_headers).json()
+    assert [job["id"] for job in jobs] == [ids[1], ids[3]]
+
+def test_fetch_jobs_group_by_prefix_age_bound(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    ids = []
+    for system in ("A", "B", "A"):
+        ids.append(client.post("/v1/chat/completions", json=_chat(system, "q"), headers=headers).json()["id"])
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    settings = ServerSettings(queue={"prefix_max_age": 0})
+    with patch("openbeepboop.server.api.settings", settings):
+        jobs = client.post("/internal/queue/fetch", json={"limit": 2, "group_by_prefix": True}, headers=node_headers).json()
+
+    # Every job is past the bound, so grouping can't hold the older "B" job back
+    assert [job["id"] for job in jobs] == [ids[0], ids[1]]
+
+def test_fetch_jobs_warm_model_affinity(client, test_db):
+    headers = {"Authorization": "Bearer sk-test"}
+    ids = []
+    for model in ("cold", "warm", "cold", "warm"):
+        ids.append(client.post("/v1/chat/completions", json={"model": model, "messages": []}, headers=headers).json()["id"])
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    jobs = client.post("/internal/queue/fetch", json={"limit": 1, "warm_models": ["warm"]}, headers=node_headers).json()
+    assert [job["id"] for job in jobs] == [ids[1]]
+
+    # The report is remembered for later fetches
+    jobs = client.post("/internal/queue/fetch", json={"limit": 2}, headers=node_headers).json()
+    assert [job["id"] for job in jobs] == [ids[3], ids[0]]
+
+    conn = sqlite3.connect(test_db)
+    assert conn.execute("SELECT warm_models FROM nodes WHERE name = 'TestNode'").fetchone()[0] == '["warm"]'
+    conn.close()
+
+def test_fetch_jobs_warm_model_staleness_bound(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    ids = []
+    for model in ("cold", "warm"):
+        ids.append(client.post("/v1/chat/completions", json={"model": model, "messages": []}, headers=headers).json()["id"])
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    settings = ServerSettings(queue={"model_max_age": 0})
+    with patch("openbeepboop.server.api.settings", settings):
+        jobs = client.post("/internal/queue/fetch", json={"limit": 1, "warm_models": ["warm"]}, headers=node_headers).json()
+
+    # The cold job has waited past the bound, so it is served despite the swap
+    assert [job["id"] for job in jobs] == [ids[0]]
+
+def _add_admin_key(db_path):
+    conn = sqlite3.connect(db_path)
+    key_hash = hashlib.sha256("sk-admin".encode()).hexdigest()
+    conn.execute("INSERT INTO api_keys (key_hash, name, role) VALUES (?, ?, ?)", (key_hash, "Admin", "ADMIN"))
+    conn.commit()
+    conn.close()
+    return {"Authorization": "Bearer sk-admin"}
+
+def test_node_registry_and_admin_listing(client, test_db):
+    admin_headers = _add_admin_key(test_db)
+    node_headers = {"Authorization": "Bearer sk-node"}
+
+    report = {"concurrency": 4, "models": ["m"], "job_seconds": 2.0, "in_flight": 1}
+    response = client.post("/internal/nodes/register", json=report, headers=node_headers)
+    assert response.json() == {"status": "ok", "name": "TestNode", "cancel": []}
+
+    client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers={"Authorization": "Bearer sk-test"})
+    client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers)
+    client.post("/internal/nodes/heartbeat", json={"concurrency": 4, "models": ["m"], "throughput": 1.5, "in_flight": 3}, headers=node_headers)
+
+    # Only admins may list nodes
+    assert client.get("/admin/nodes", headers=node_headers).status_code == 403
+
+    nodes = client.get("/admin/nodes", headers=admin_headers).json()["nodes"]
+    assert len(nodes) == 1
+    node = nodes[0]
+    assert node["name"] == "TestNode"
+    assert node["models"] == ["m"]
+    assert node["job_seconds"] == 2.0 # kept from registration
+    assert node["throughput"] == 1.5
+    assert node["claimed"] == 1
+    assert node["utilization"] == 0.75
+    assert node["registered_at"] is not None
+
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"node_timeout": 1e-9})):
+        assert client.get("/admin/nodes", headers=admin_headers).json()["nodes"] == []
+
+def test_fetch_jobs_capped_by_node_service_time(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    for _ in range(10):
+        client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers)
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    # 2 slots at 30s per job can start 4 jobs within the default 60s horizon
+    client.post("/internal/nodes/register", json={"concurrency": 2, "job_seconds": 30.0}, headers=node_headers)
+
+    jobs = client.post("/internal/queue/fetch", json={"limit": 10}, headers=node_headers).json()
+    assert len(jobs) == 4
+    # Jobs already held count against the cap, but a node always gets at least one
+    jobs = client.post("/internal/queue/fetch", json={"limit": 10}, headers=node_headers).json()
+    assert len(jobs) == 1
+
+def test_release_jobs(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    first = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    second = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+
+    node_headers = {"Authorization": "Bearer sk-node"}
+    client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers)
+
+    # Only jobs the caller holds are released
+    response = client.post("/internal/queue/release", json={"ids": [first, second]}, headers=node_headers)
+    assert response.json()["released"] == [first]
+
+    # The released job keeps its place at the head of the queue
+    jobs = client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers).json()
+    assert jobs[0]["id"] == first
+
+def test_retryable_failure_requeued_with_backoff(client, test_db):
+    headers = {"Authorization": "Bearer sk-test"}
+    job_id = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    node_headers = {"Authorization": "Bearer sk-node"}
+    failure = {"id": job_id, "status": "FAILED", "error": "Timeout", "retryable": True}
+
+    client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers)
+    response = client.post("/internal/queue/submit", json=[failure], headers=node_headers)
+    assert response.json()["retried"] == [job_id]
+
+    # Backing off: queued, but not claimable yet
+    data = client.post("/v1/results/poll", json={"ids": [job_id]}, headers=headers).json()
+    assert data["jobs"][0]["status"] == "QUEUED"
+    assert client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers).json() == []
+
+    # A replayed copy of the same failure doesn't requeue or fail it again
+    response = client.post("/internal/queue/submit", json=[failure], headers=node_headers)
+    assert response.json()["ignored"] == [job_id]
+
+    conn = sqlite3.connect(test_db)
+    conn.execute("UPDATE jobs SET available_at = NULL WHERE id = ?", (job_id,))
+    conn.commit()
+    conn.close()
+
+    jobs = client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers).json()
+    assert jobs[0]["attempts"] == 1
+
+    # Out of attempts (max_attempts = 2): the failure is final
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"max_attempts": 2})):
+        response = client.post("/internal/queue/submit", json=[failure], headers=node_headers)
+    assert response.json()["retried"] == []
+    data = client.post("/v1/results/poll", json={"ids": [job_id]}, headers=headers).json()
+    assert data["jobs"][0]["status"] == "FAILED"
+
+def test_retry_delay_backoff():
+    from openbeepboop.server import api
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"retry_backoff": 2, "retry_backoff_max": 5})):
+        assert [api._retry_delay(n) for n in (1, 2, 3)] == [2, 4, 5]
+
+def _add_key(db_path, key, name, role, hedge=0):
+    conn = sqlite3.connect(db_path)
+    key_hash = hashlib.sha256(key.encode()).hexdigest()
+    conn.execute("INSERT INTO api_keys (key_hash, name, role, hedge) VALUES (?, ?, ?, ?)", (key_hash, name, role, hedge))
+    conn.commit()
+    conn.close()
+    return {"Authorization": f"Bearer {key}"}
+
+def _add_run_history(db_path, model="m", seconds=0.0):
+    # A completed job of `model` that ran for `seconds`
+    conn = sqlite3.connect(db_path)
+    started = datetime.utcnow() - timedelta(hours=1)
+    conn.execute(
+        "INSERT INTO jobs (id, status, created_at, updated_at, locked_at, model) VALUES (?, ?, ?, ?, ?, ?)",
+        ("done", JobStatus.COMPLETED.value, started, started + timedelta(seconds=seconds), started, model)
+    )
+    conn.commit()
+    conn.close()
+
+def test_hedged_job_first_result_wins(client, test_db):
+    headers = {"Authorization": "Bearer sk-test"}
+    node_a = {"Authorization": "Bearer sk-node"}
+    node_b = _add_key(test_db, "sk-node-b", "NodeB", "NODE")
+    job_id = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "hedge": True}, headers=headers).json()["id"]
+
+    jobs = client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_a).json()
+    assert jobs[0]["hedge"] is False
+    assert "hedge" not in jobs[0]["request_payload"]
+
+    # Not enough run-time history yet: no duplicate is handed out
+    assert client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_b).json() == []
+
+    _add_run_history(test_db)
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"hedge_min_samples": 1})):
+        jobs = client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_b).json()
+        assert [job["id"] for job in jobs] == [job_id]
+        assert jobs[0]["hedge"] is True
+        # Only one duplicate per job
+        assert client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_b).json() == []
+
+    # A failed hedge doesn't end the job
+    failure = {"id": job_id, "status": "FAILED", "error": "boom"}
+    assert client.post("/internal/queue/submit", json=[failure], headers=node_b).json()["ignored"] == [job_id]
+
+    result = {"id": job_id, "status": "COMPLETED", "result": {"choices": []}}
+    response = client.post("/internal/queue/submit", json=[result], headers=node_b).json()
+    assert response["ignored"] == []
+
+    # The original node is told to stop, once
+    response = client.post("/internal/nodes/heartbeat", json={}, headers=node_a).json()
+    assert response["cancel"] == [job_id]
+    response = client.post("/internal/queue/submit", json=[result], headers=node_a).json()
+    assert response["ignored"] == [job_id]
+    assert response["cancel"] == []
+
+def test_hedge_default_from_api_key(client, test_db):
+    hedged = _add_key(test_db, "sk-hedged", "HedgedUser", "USER", hedge=1)
+    node_a = {"Authorization": "Bearer sk-node"}
+    node_b = _add_key(test_db, "sk-node-b", "NodeB", "NODE")
+    client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=hedged)
+    client.post("/v1/chat/completions", json={"model": "m", "messages": [], "hedge": False}, headers=hedged)
+
+    client.post("/internal/queue/fetch", json={"limit": 2}, headers=node_a)
+    _add_run_history(test_db)
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"hedge_min_samples": 1})):
+        jobs = client.post("/internal/queue/fetch", json={"limit": 2}, headers=node_b).json()
+    assert len(jobs) == 1
+
+def test_cancel_queued_and_running_jobs(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+    running = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "batch_id": "b1"}, headers=headers).json()["id"]
+    client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_headers)
+    queued = [
+        client.post("/v1/chat/completions", json={"model": "m", "messages": [], "batch_id": "b1"}, headers=headers).json()["id"]
+        for _ in range(2)
+    ]
+    other = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+
+    response = client.post("/v1/jobs/cancel", json={"batch_id": "b1"}, headers=headers)
+    assert response.json()["cancelled"] == 3
+
+    # Cancelled queued jobs are no longer claimable; the node learns about its running job on fetch
+    response = client.post("/internal/queue/fetch", json={"limit": 5}, headers=node_headers)
+    assert [job["id"] for job in response.json()] == [other]
+    assert response.headers["X-Cancel-Jobs"] == running
+    assert "X-Cancel-Jobs" not in client.post("/internal/queue/fetch", json={"limit": 5}, headers=node_headers).headers
+
+    # A late result for the cancelled job is ignored
+    result = {"id": running, "status": "COMPLETED", "result": {"choices": []}}
+    assert client.post("/internal/queue/submit", json=[result], headers=node_headers).json()["ignored"] == [running]
+
+    data = client.post("/v1/results/poll", json={"ids": [running, *queued]}, headers=headers).json()
+    assert {job["status"] for job in data["jobs"]} == {"CANCELLED"}
+
+def test_cancel_single_job(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    job_id = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+
+    assert client.post(f"/v1/jobs/{job_id}/cancel", headers=headers).json() == {"id": job_id, "status": "CANCELLED", "cancelled": True}
+    assert client.post(f"/v1/jobs/{job_id}/cancel", headers=headers).json()["cancelled"] is False
+    assert client.post("/v1/jobs/missing/cancel", headers=headers).status_code == 404
+    assert client.post("/v1/jobs/cancel", json={}, headers=headers).status_code == 422
+
+def test_expired_jobs_never_reach_nodes(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+    past = (datetime.utcnow() - timedelta(seconds=5)).isoformat()
+    expired = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "deadline": past}, headers=headers).json()["id"]
+    live = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "ttl": 600}, headers=headers).json()["id"]
+
+    # Reported as expired even before a fetch sweeps it
+    data = client.post("/v1/results/poll", json={"ids": [expired]}, headers=headers).json()
+    assert data["jobs"][0]["status"] == "EXPIRED"
+
+    jobs = client.post("/internal/queue/fetch", json={"limit": 5}, headers=node_headers).json()
+    assert [job["id"] for job in jobs] == [live]
+    assert "deadline" not in jobs[0]["request_payload"]
+
+    data = client.post("/v1/results/poll", json={"ids": [expired]}, headers=headers).json()
+    assert data["jobs"][0] == {"id": expired, "status": "EXPIRED", "result": {"error": "Deadline exceeded"}}
+
+def test_fetch_jobs_earliest_deadline_first(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+    no_deadline = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    late = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "ttl": 600}, headers=headers).json()["id"]
+    soon = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "ttl": 60}, headers=headers).json()["id"]
+
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"order": "deadline"})):
+        jobs = client.post("/internal/queue/fetch", json={"limit": 3}, headers=node_headers).json()
+    assert [job["id"] for job in jobs] == [soon, late, no_deadline]
+
+def test_submit_rejects_bad_deadline(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    assert client.post("/v1/chat/completions", json={"model": "m", "messages": [], "ttl": -1}, headers=headers).status_code == 422
+    assert client.post("/v1/chat/completions", json={"model": "m", "messages": [], "deadline": "soon"}, headers=headers).status_code == 422
+
+def test_embeddings_job_round_trip(client):
+    from openbeepboop.common.vectors import encode_vectors
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+    floats = client.post("/v1/embeddings", json={"model": "embed", "input": ["a", "b"]}, headers=headers).json()["id"]
+    packed = client.post("/v1/embeddings", json={"model": "embed", "input": "c", "encoding_format": "base64"}, headers=headers).json()["id"]
+    assert client.post("/v1/embeddings", json={"model": "embed"}, headers=headers).status_code == 422
+
+    jobs = client.post("/internal/queue/fetch", json={"limit": 2}, headers=node_headers).json()
+    assert [job["kind"] for job in jobs] == ["embedding", "embedding"]
+    assert jobs[0]["est_tokens"] == 2
+
+    def result(job_id, vectors):
+        data = [{"object": "embedding", "index": i} for i in range(len(vectors))]
+        return {"id": job_id, "status": "COMPLETED", "result": {"object": "list", "data": data, "model": "embed"},
+                "vectors": encode_vectors(vectors)}
+
+    client.post("/internal/queue/submit", json=[result(floats, [[0.5, 1.0], [1.5, 2.0]]), result(packed, [[1.0, 0.0]])], headers=node_headers)
+
+    data = client.post("/v1/results/poll", json={"ids": [floats, packed]}, headers=headers).json()
+    by_id = {job["id"]: job["result"] for job in data["jobs"]}
+    assert [item["embedding"] for item in by_id[floats]["data"]] == [[0.5, 1.0], [1.5, 2.0]]
+    assert by_id[packed]["data"][0]["embedding"] == encode_vectors([[1.0, 0.0]])
+
+def test_bulk_submit(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    requests = [{"model": "m", "messages": [{"role": "user", "content": str(i)}], "batch_id": "b1"} for i in range(3)]
+    response = client.post("/v1/chat/completions/bulk", json={"requests": requests}, headers=headers)
+    assert response.status_code == 202
+    jobs = response.json()["jobs"]
+    assert [job["status"] for job in jobs] == ["QUEUED"] * 3
+
+    fetched = client.post("/internal/queue/fetch", json={"limit": 5}, headers={"Authorization": "Bearer sk-node"}).json()
+    assert [job["id"] for job in fetched] == [job["id"] for job in jobs]
+    assert fetched[2]["request_payload"] == {"model": "m", "messages": [{"role": "user", "content": "2"}]}
+
+    # One invalid request rejects the whole submission
+    bad = [{"model": "embed", "input": "a"}, {"model": "embed"}]
+    assert client.post("/v1/embeddings/bulk", json={"requests": bad}, headers=headers).status_code == 422
+    assert client.post("/v1/results/poll", json={}, headers=headers).json()["jobs"] == []
+
+    with patch("openbeepboop.server.api.MAX_BULK_JOBS", 2):
+        assert client.post("/v1/chat/completions/bulk", json={"requests": requests}, headers=headers).status_code == 413
+
+def test_poll_results_field_projection(client):
+    from openbeepboop.common.vectors import encode_vectors
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+    chat = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    failed = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    embed = client.post("/v1/embeddings", json={"model": "e", "input": "a"}, headers=headers).json()["id"]
+    client.post("/internal/queue/fetch", json={"limit": 3}, headers=node_headers)
+
+    full = {"choices": [{"message": {"role": "assistant", "content": "hi"}}], "usage": {"total_tokens": 7}, "model": "m"}
+    client.post("/internal/queue/submit", json=[
+        {"id": chat, "status": "COMPLETED", "result": full},
+        {"id": failed, "status": "FAILED", "error": "boom"},
+        {"id": embed, "status": "COMPLETED", "result": {"object": "list", "data": [{"object": "embedding", "index": 0}], "usage": {"total_tokens": 1}},
+         "vectors": encode_vectors([[1.0]])},
+    ], headers=node_headers)
+
+    body = {"ids": [chat, failed, embed], "fields": ["choices.0.message.content", "usage"]}
+    jobs = {job["id"]: job for job in client.post("/v1/results/poll", json=body, headers=headers).json()["jobs"]}
+    assert jobs[chat]["result"] == {"choices": [{"message": {"content": "hi"}}], "usage": {"total_tokens": 7}}
+    # Failures keep their error
+    assert jobs[failed]["status"] == "FAILED"
+    assert jobs[failed]["result"] == client.post("/v1/results/poll", json={"ids": [failed]}, headers=headers).json()["jobs"][0]["result"]
+    assert jobs[embed]["result"] == {"choices": [{"message": {"content": None}}], "usage": {"total_tokens": 1}}
+
+    embed_fields = {"ids": [embed], "fields": ["data.0.embedding"]}
+    assert client.post("/v1/results/poll", json=embed_fields, headers=headers).json()["jobs"][0]["result"] == {"data": [{"embedding": [1.0]}]}
+    assert client.post("/v1/results/poll", json={"ids": [chat], "fields": ["bad path"]}, headers=headers).status_code == 422
+
+def test_job_change_feed(client, test_db):
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+    other = _add_key(test_db, "sk-other", "Other", "USER")
+    first = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    second = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+    client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=other)
+
+    page = client.get("/v1/jobs/changes", params={"limit": 1}, headers=headers).json()
+    assert [job["id"] for job in page["jobs"]] == [first]
+    assert page["has_more"] is True
+    page = client.get("/v1/jobs/changes", params={"cursor": page["cursor"]}, headers=headers).json()
+    assert [job["id"] for job in page["jobs"]] == [second]
+    assert page["has_more"] is False
+    cursor = page["cursor"]
+
+    # Nothing changed since
+    assert client.get("/v1/jobs/changes", params={"cursor": cursor}, headers=headers).json() == {"jobs": [], "cursor": cursor, "has_more": False}
+
+    client.post("/internal/queue/fetch", json={"limit": 3}, headers=node_headers)
+    client.post("/internal/queue/submit", json=[{"id": second, "status": "COMPLETED", "result": {"usage": {"total_tokens": 2}, "model": "m"}}], headers=node_headers)
+
+    page = client.get("/v1/jobs/changes", params={"cursor": cursor, "fields": ["usage"]}, headers=headers).json()
+    # Each job appears once, at its latest change
+    assert [(job["id"], job["status"]) for job in page["jobs"]] == [(first, "PROCESSING"), (second, "COMPLETED")]
+    assert page["jobs"][1]["result"] == {"usage": {"total_tokens": 2}}
+    assert page["cursor"] == page["jobs"][1]["seq"] > cursor
+
+    assert client.get("/v1/jobs/changes", params={"limit": 0}, headers=headers).status_code == 422
+
+@patch("openbeepboop.server.api.settings", ServerSettings(callbacks={"allowed_hosts": ["*"]}))
+def test_completion_callbacks_delivered_in_signed_batches(client, test_db):
+    import httpx
+    import json
+    from openbeepboop.common.config import CallbackConfig
+    from openbeepboop.common.webhooks import verify, SIGNATURE_HEADER, TIMESTAMP_HEADER
+    from openbeepboop.server.api import deliver_callbacks
+    headers = {"Authorization": "Bearer sk-test"}
+    node_headers = {"Authorization": "Bearer sk-node"}
+
+    assert client.post("/v1/chat/completions", json={"model": "m", "messages": [], "callback_url": "ftp://x"}, headers=headers).status_code == 422
+    jobs = client.post("/v1/chat/completions/bulk", json={
+        "requests": [{"model": "m", "messages": []}, {"model": "m", "messages": [], "callback_url": "http://other/hook"}, {"model": "m", "messages": []}],
+        "callback_url": "http://receiver/hook"
+    }, headers=headers).json()["jobs"]
+    done, other, cancelled = [job["id"] for job in jobs]
+    plain = client.post("/v1/chat/completions", json={"model": "m", "messages": []}, headers=headers).json()["id"]
+
+    client.post("/internal/queue/fetch", json={"limit": 2}, headers=node_headers)
+    client.post("/internal/queue/submit", json=[{"id": done, "status": "COMPLETED", "result": {"ok": True}},
+                                                {"id": other, "status": "COMPLETED", "result": {"ok": 2}}], headers=node_headers)
+    client.post(f"/v1/jobs/{cancelled}/cancel", json={}, headers=headers)
+    client.post(f"/v1/jobs/{plain}/cancel", json={}, headers=headers)
+
+    received = []
+
+    def receiver(request):
+        received.append(request)
+        return httpx.Response(200 if request.url.host == "receiver" else 503)
+
+    config = CallbackConfig(batch_size=5, secret="s3cret", retry_backoff=60, allowed_hosts=["*"])
+    with httpx.Client(transport=httpx.MockTransport(receiver)) as http_client:
+        assert deliver_callbacks(http_client, config) == 2
+        # The failed delivery backs off, and nothing else is due
+        assert deliver_callbacks(http_client, config) == 0
+
+    assert len(received) == 2
+    batch = next(request for request in received if request.url.host == "receiver")
+    body = json.loads(batch.content)
+    assert [(job["id"], job["status"]) for job in body["jobs"]] == [(done, "COMPLETED"), (cancelled, "CANCELLED")]
+    assert body["jobs"][0]["result"] == {"ok": True}
+    assert verify("s3cret", batch.headers[TIMESTAMP_HEADER], batch.content, batch.headers[SIGNATURE_HEADER])
+
+    conn = sqlite3.connect(test_db)
+    assert conn.execute("SELECT job_id, attempts, last_error, dead FROM callbacks").fetchall() == [(other, 1, "HTTP 503", 0)]
+
+    # Retried once due; the last allowed attempt marks the entry dead
+    conn.execute("UPDATE callbacks SET available_at = ?", (datetime.utcnow() - timedelta(seconds=1),))
+    conn.commit()
+    with httpx.Client(transport=httpx.MockTransport(receiver)) as http_client:
+        assert deliver_callbacks(http_client, CallbackConfig(max_attempts=2, allowed_hosts=["*"])) == 0
+    assert conn.execute("SELECT attempts, dead FROM callbacks").fetchall() == [(2, 1)]
+    conn.close()
+
+@patch("openbeepboop.server.api.settings", ServerSettings(callbacks={"allowed_hosts": ["up", "down"]}))
+def test_callback_delivery_isolates_slow_and_failing_urls(client, test_db):
+    import httpx
+    import threading
+    from openbeepboop.common.config import CallbackConfig
+    from openbeepboop.server.api import deliver_callbacks
+    headers = {"Authorization": "Bearer sk-test"}
+    for url in ["http://down/hook"] * 3 + ["http://up/hook"]:
+        job_id = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "callback_url": url}, headers=headers).json()["id"]
+        client.post(f"/v1/jobs/{job_id}/cancel", json={}, headers=headers)
+
+    both_called = threading.Barrier(2, timeout=5)
+    received = []
+
+    def receiver(request):
+        received.append(request.url.host)
+        if len(received) <= 2:
+            # Only returns if the other URL is being delivered to at the same time
+            both_called.wait()
+        return httpx.Response(200 if request.url.host == "up" else 503)
+
+    with httpx.Client(transport=httpx.MockTransport(receiver)) as http_client:
+        assert deliver_callbacks(http_client, CallbackConfig(batch_size=1, allowed_hosts=["up", "down"])) == 1
+
+    # The failing URL is tried once; its other entries back off with the failed batch
+    assert sorted(received) == ["down", "up"]
+    conn = sqlite3.connect(test_db)
+    assert conn.execute("SELECT url, attempts, last_error FROM callbacks").fetchall() == [("http://down/hook", 1, "HTTP 503")] * 3
+    conn.close()
+
+def test_callback_hosts_can_be_restricted(client, test_db):
+    import httpx
+    from openbeepboop.server.api import deliver_callbacks
+    headers = {"Authorization": "Bearer sk-test"}
+    request = {"model": "m", "messages": []}
+    internal = dict(request, callback_url="http://127.0.0.1:8080/admin")
+
+    # Closed by default: no host is allowed until the admin lists some
+    assert client.post("/v1/chat/completions", json=internal, headers=headers).status_code == 422
+
+    with patch("openbeepboop.server.api.settings", ServerSettings(callbacks={"allowed_hosts": ["*"]})):
+        job_id = client.post("/v1/chat/completions", json=internal, headers=headers).json()["id"]
+    client.post(f"/v1/jobs/{job_id}/cancel", json={}, headers=headers)
+
+    restricted = ServerSettings(callbacks={"allowed_hosts": ["*.example.com"]})
+    with patch("openbeepboop.server.api.settings", restricted):
+        assert client.post("/v1/chat/completions", json=internal, headers=headers).status_code == 422
+        response = client.post("/v1/chat/completions", json=dict(request, callback_url="https://hooks.example.com/x"), headers=headers)
+        assert response.status_code == 202
+
+    # Queued before the host was disallowed: dropped without a request
+    received = []
+    with httpx.Client(transport=httpx.MockTransport(lambda request: received.append(request) or httpx.Response(200))) as http_client:
+        assert deliver_callbacks(http_client, restricted.callbacks) == 0
+    assert received == []
+    conn = sqlite3.connect(test_db)
+    assert conn.execute("SELECT job_id, last_error, dead FROM callbacks").fetchall() == [(job_id, "Host not allowed", 1)]
+    conn.close()
+
+def test_submit_accepts_malformed_messages(client):
+    headers = {"Authorization": "Bearer sk-test"}
+    for messages in ["hello", ["hi"], [{"role": "user", "content": [{"type": "text", "text": 5}]}], {"role": "user"}]:
+        response = client.post("/v1/chat/completions", json={"model": "m", "messages": messages}, headers=headers)
+        assert response.status_code == 202
+
+def test_retried_hedged_job_stops_its_duplicate(client, test_db):
+    headers = {"Authorization": "Bearer sk-test"}
+    node_a = {"Authorization": "Bearer sk-node"}
+    node_b = _add_key(test_db, "sk-node-b", "NodeB", "NODE")
+    job_id = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "hedge": True}, headers=headers).json()["id"]
+    client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_a)
+
+    _add_run_history(test_db)
+    with patch("openbeepboop.server.api.settings", ServerSettings(queue={"hedge_min_samples": 1})):
+        assert [job["id"] for job in client.post("/internal/queue/fetch", json={"limit": 1}, headers=node_b).json()] == [job_id]
+
+        failure = {"id": job_id, "status": "FAILED", "error": "timeout", "retryable": True}
+        assert client.post("/internal/queue/submit", json=[failure], headers=node_a).json()["retried"] == [job_id]
+
+    # The hedge node is told to drop its duplicate of the requeued job
+    assert client.post("/internal/nodes/heartbeat", json={}, headers=node_b).json()["cancel"] == [job_id]
+
+def test_cancel_is_scoped_to_the_callers_jobs(client, test_db):
+    alice = {"Authorization": "Bearer sk-test"}
+    bob = _add_key(test_db, "sk-bob", "Bob", "USER")
+    admin = _add_admin_key(test_db)
+    job = {"model": "m", "messages": [], "batch_id": "batch-1"}
+    alice_ids = [client.post("/v1/chat/completions", json=job, headers=alice).json()["id"] for _ in range(2)]
+    bob_id = client.post("/v1/chat/completions", json=job, headers=bob).json()["id"]
+
+    # Same batch name, different owners
+    assert client.post("/v1/jobs/cancel", json={"batch_id": "batch-1"}, headers=bob).json()["cancelled"] == 1
+    assert client.post("/v1/jobs/cancel", json={"ids": alice_ids}, headers=bob).json()["cancelled"] == 0
+    assert client.post(f"/v1/jobs/{alice_ids[0]}/cancel", json={}, headers=bob).status_code == 404
+
+    statuses = {j["id"]: j["status"] for j in client.post("/v1/results/poll", json={"ids": alice_ids + [bob_id]}, headers=alice).json()["jobs"]}
+    assert statuses == {alice_ids[0]: "QUEUED", alice_ids[1]: "QUEUED", bob_id: "CANCELLED"}
+
+    # Admins may cancel anyone's jobs
+    assert client.post(f"/v1/jobs/{alice_ids[0]}/cancel", json={}, headers=admin).json()["cancelled"] is True